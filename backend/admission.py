@@ -0,0 +1,158 @@
+"""
+Admission control for /analyze_frame.
+
+Cameras post frames as fast as they like; the model pool does not scale with
+them. Without a gate, a surge piles frames into the inference queue, every
+frame (and every investigator search behind it) waits for the whole backlog,
+and frames are embedded long after they stopped being current.
+
+Three checks, all before the frame is decoded:
+
+* rate     - a token bucket per camera (`rate` frames/s, `burst` deep). A
+             camera over its budget is told to come back when it has a token.
+* slots    - at most `max_inflight` frames are between decode and embed at
+             once. Later frames wait in one bounded FIFO (`max_queue`).
+* freshest - the queue holds one frame per camera. A newer frame from the
+             same camera takes the older one's place in line and the older
+             request is answered "superseded": only the latest view of a
+             scene is worth embedding.
+
+Refusals raise `Shed` with a `retry_after` and the `frame_interval` the
+camera should settle at: the larger of 1/rate and the interval at which the
+measured service time, shared across the currently active cameras, keeps the
+queue from growing. Everything runs on the event loop; no locks.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+import metrics
+
+ADMISSION_WAIT_SECONDS = metrics.histogram("kumbh_admission_wait_seconds", "Time frames waited for an inference slot")
+
+
+class Shed(Exception):
+    """A frame refused at admission; handlers map it to 429."""
+
+    def __init__(self, reason, retry_after, frame_interval):
+        super().__init__(f"Frame shed ({reason}), retry in {retry_after:.2f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+        self.frame_interval = frame_interval
+
+
+class TokenBucket:
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.stamp = now
+
+    def take(self, now):
+        """Spend one token; returns 0, or the seconds until one is available."""
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+
+class AdmissionControl:
+    def __init__(self, rate=2.0, burst=4, max_inflight=16, max_queue=32, active_window=10.0):
+        """rate/burst: per-camera frames/s and bucket depth; max_inflight: frames between
+        decode and embed at once; max_queue: frames waiting for a slot (one per camera);
+        active_window: a camera with a frame in the last this-many seconds counts as active."""
+        self.rate = rate
+        self.burst = burst
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.active_window = active_window
+        self._buckets = {}  # cam_id -> TokenBucket
+        self._waiting = OrderedDict()  # cam_id -> future resolved when a slot is handed over
+        self._inflight = 0
+        self._service_s = None  # EWMA of slot hold time (decode -> embed)
+        self.counters = {"admitted": 0, "rate": 0, "overload": 0, "superseded": 0}
+
+    def _active_cameras(self, now):
+        horizon = now - max(self.active_window, 1.0 / self.rate)
+        stale = [cam for cam, b in self._buckets.items() if b.stamp < horizon]
+        for cam in stale:
+            del self._buckets[cam]
+        return max(len(self._buckets), 1)
+
+    def frame_interval(self, now=None):
+        """Seconds between frames each camera should aim for under the current load."""
+        now = time.monotonic() if now is None else now
+        floor = 1.0 / self.rate
+        if self._service_s is None:
+            return floor
+        return max(floor, self._active_cameras(now) * self._service_s / self.max_inflight)
+
+    def _shed(self, reason, retry_after, now):
+        self.counters[reason] += 1
+        interval = self.frame_interval(now)
+        return Shed(reason, max(retry_after, 0.0) if retry_after is not None else interval, interval)
+
+    @asynccontextmanager
+    async def slot(self, cam_id):
+        """Hold one inference slot for a frame from `cam_id`; raises Shed if refused."""
+        now = time.monotonic()
+        bucket = self._buckets.get(cam_id)
+        if bucket is None:
+            bucket = self._buckets[cam_id] = TokenBucket(self.rate, self.burst, now)
+        wait = bucket.take(now)
+        if wait:
+            raise self._shed("rate", wait, now)
+
+        if self._inflight < self.max_inflight and not self._waiting:
+            self._inflight += 1
+        else:
+            older = self._waiting.get(cam_id)
+            if older is None and len(self._waiting) >= self.max_queue:
+                raise self._shed("overload", None, now)
+            fut = asyncio.get_running_loop().create_future()
+            self._waiting[cam_id] = fut  # an existing key keeps its place in line
+            if older is not None and not older.done():
+                older.set_exception(self._shed("superseded", None, now))
+            try:
+                await fut
+            except asyncio.CancelledError:
+                if self._waiting.get(cam_id) is fut:
+                    del self._waiting[cam_id]
+                if fut.done() and not fut.cancelled() and fut.exception() is None:
+                    self._release()  # the slot was handed over just as we were cancelled
+                raise
+            ADMISSION_WAIT_SECONDS.observe(time.monotonic() - now)
+
+        self.counters["admitted"] += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            held = time.monotonic() - started
+            self._service_s = held if self._service_s is None else 0.8 * self._service_s + 0.2 * held
+            self._release()
+
+    def _release(self):
+        # Hand the slot straight to the oldest waiter (inflight unchanged), else free it
+        while self._waiting:
+            _, fut = self._waiting.popitem(last=False)
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self._inflight -= 1
+
+    def stats(self):
+        return {
+            **self.counters,
+            "inflight": self._inflight,
+            "queued": len(self._waiting),
+            "cameras": len(self._buckets),
+            "service_ms": round(self._service_s * 1000, 1) if self._service_s is not None else None,
+            "frame_interval_ms": round(self.frame_interval() * 1000),
+            "rate_per_camera": self.rate,
+            "max_inflight": self.max_inflight,
+            "max_queue": self.max_queue,
+        }
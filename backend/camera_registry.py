@@ -0,0 +1,171 @@
+"""
+In-memory camera-node registry.
+
+Holds `camera_nodes` metadata and liveness so request handlers never query
+the table themselves:
+
+* reads   - served from memory only (never block a request on the DB); a
+            background thread re-reads the table every `ttl` seconds, and
+            `register()` refreshes it immediately.
+* beats   - `heartbeat()` only touches memory and marks the node dirty; a
+            background thread bulk-upserts all dirty nodes every
+            `flush_interval` seconds, so N frames/s become one write per node
+            per interval.
+* fallback- cameras.json seeds the registry, so enrichment keeps working when
+            the DB is unreachable.
+"""
+import threading
+import time
+
+from timeutils import parse_timestamp, format_timestamp
+
+
+class CameraRegistry:
+    def __init__(self, client, static_config=None, ttl=30.0, flush_interval=5.0, online_window=30.0):
+        self.client = client
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.online_window = online_window
+
+        self._lock = threading.Lock()
+        self._nodes = {}
+        self._dirty = set()
+        self._loaded_at = 0.0
+        self._thread = None
+        self.counters = {"refreshes": 0, "heartbeats": 0, "flushes": 0, "flushed_rows": 0, "db_errors": 0}
+
+        for cam_id, cfg in (static_config or {}).items():
+            self._nodes[cam_id] = {
+                "id": cam_id,
+                "name": cfg.get("name", cam_id),
+                "lat": cfg.get("lat", 0.0),
+                "lon": cfg.get("lon", 0.0),
+                "status": "offline",
+                "last_heartbeat": 0.0,  # epoch seconds
+            }
+
+    # --- reads ---
+
+    def refresh(self, force=False):
+        """Re-read camera_nodes if the cache is older than `ttl`."""
+        if not force and time.time() - self._loaded_at < self.ttl:
+            return
+        try:
+            rows = self.client.table("camera_nodes").select("*").execute().data
+        except Exception as e:
+            self.counters["db_errors"] += 1
+            print(f"⚠️ Camera registry refresh failed: {e}")
+            self._loaded_at = time.time()  # do not hammer a failing DB; retry after ttl
+            return
+        with self._lock:
+            for row in rows:
+                beat = parse_timestamp(row.get("last_heartbeat")) if row.get("last_heartbeat") else 0.0
+                node = self._nodes.get(row["id"], {})
+                # Keep an in-memory heartbeat that has not been flushed yet
+                if row["id"] in self._dirty and node.get("last_heartbeat", 0.0) > beat:
+                    beat = node["last_heartbeat"]
+                self._nodes[row["id"]] = {
+                    "id": row["id"],
+                    "name": row.get("name") or node.get("name") or row["id"],
+                    "lat": row.get("lat") if row.get("lat") is not None else node.get("lat", 0.0),
+                    "lon": row.get("lon") if row.get("lon") is not None else node.get("lon", 0.0),
+                    "status": row.get("status", "offline"),
+                    "last_heartbeat": beat,
+                }
+            self._loaded_at = time.time()
+        self.counters["refreshes"] += 1
+
+    def get(self, cam_id):
+        return self._nodes.get(cam_id)
+
+    def is_online(self, node):
+        return time.time() - node.get("last_heartbeat", 0.0) < self.online_window
+
+    def config(self):
+        """`/config/cameras` shape: {id: {name, lat, lon, status, last_active}}."""
+        with self._lock:
+            nodes = list(self._nodes.values())
+        return {
+            n["id"]: {
+                "name": n["name"],
+                "lat": n["lat"],
+                "lon": n["lon"],
+                "status": "online" if self.is_online(n) else "offline",
+                "last_active": format_timestamp(n["last_heartbeat"]) if n["last_heartbeat"] else None,
+            }
+            for n in nodes
+        }
+
+    def online_count(self):
+        with self._lock:
+            return sum(1 for n in self._nodes.values() if self.is_online(n))
+
+    def locate(self, cam_id, lat=0.0, lon=0.0):
+        """(name, lat, lon) for a sighting: the sighting's own GPS wins, else the node's location."""
+        node = self.get(cam_id) or {}
+        name = node.get("name") or cam_id
+        if lat and lon:
+            return name, lat, lon
+        return name, node.get("lat") or 0.0, node.get("lon") or 0.0
+
+    # --- writes ---
+
+    def heartbeat(self, cam_id, lat=0.0, lon=0.0, name=None):
+        """Record liveness in memory; persisted by the next coalesced flush."""
+        now = time.time()
+        with self._lock:
+            node = self._nodes.get(cam_id)
+            if node is None:
+                node = self._nodes[cam_id] = {
+                    "id": cam_id, "name": name or f"Mobile Node: {cam_id}",
+                    "lat": 0.0, "lon": 0.0, "status": "online", "last_heartbeat": now,
+                }
+            node["last_heartbeat"] = now
+            node["status"] = "online"
+            if lat and lon:  # mobile nodes report GPS; a 0,0 fix must not erase the map position
+                node["lat"], node["lon"] = lat, lon
+            self._dirty.add(cam_id)
+        self.counters["heartbeats"] += 1
+
+    def register(self, node):
+        """Write-through upsert for explicit registrations, then reload the cache."""
+        row = {**node, "last_heartbeat": format_timestamp(time.time())}
+        self.client.table("camera_nodes").upsert(row).execute()
+        self.refresh(force=True)
+
+    def flush(self):
+        """Bulk-upsert every node with a pending heartbeat (one DB call)."""
+        with self._lock:
+            rows = [{
+                "id": n["id"], "name": n["name"], "lat": n["lat"], "lon": n["lon"],
+                "status": "online", "last_heartbeat": format_timestamp(n["last_heartbeat"]),
+            } for n in (self._nodes[c] for c in self._dirty)]
+            self._dirty.clear()
+        if not rows:
+            return 0
+        try:
+            self.client.table("camera_nodes").upsert(rows).execute()
+        except Exception as e:
+            self.counters["db_errors"] += 1
+            print(f"⚠️ Heartbeat flush failed: {e}")
+            with self._lock:
+                self._dirty.update(r["id"] for r in rows)
+            return 0
+        self.counters["flushes"] += 1
+        self.counters["flushed_rows"] += len(rows)
+        return len(rows)
+
+    def start(self):
+        def loop():
+            while True:
+                self.flush()
+                self.refresh()
+                time.sleep(self.flush_interval)
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=loop, name="camera-registry", daemon=True)
+            self._thread.start()
+        return self
+
+    def stats(self):
+        return {**self.counters, "nodes": len(self._nodes), "pending": len(self._dirty)}
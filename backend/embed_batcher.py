@@ -0,0 +1,109 @@
+"""
+Cross-request micro-batching for ArcFace embeddings.
+
+Concurrent /analyze_frame requests detect faces independently, then hand their
+aligned crops to `EmbedBatcher.embed()`. A single collector task gathers crops
+from all requests until `max_batch` crops are waiting or `max_wait_ms` has
+passed since the first one, runs ONE forward pass on the model pool, and
+resolves each request's future with its own embeddings.
+
+The wait only applies while the model pool is busy: an idle pool takes
+whatever is queued immediately, so light traffic pays no batching latency and
+batch size grows with load.
+"""
+import asyncio
+import time
+
+
+class EmbedBatcher:
+    def __init__(self, model_service, max_batch=16, max_wait_ms=5.0):
+        self.model_service = model_service
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = None
+        self._task = None
+        self._inflight = None
+        self.totals = {"batches": 0, "crops": 0, "max_batch_seen": 0}
+
+    def _ensure_started(self):
+        # Created lazily so the queue binds to the running event loop
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._inflight = asyncio.Semaphore(self.model_service.workers)
+            self._task = asyncio.get_running_loop().create_task(self._collect())
+
+    async def embed(self, faces):
+        """Embed a list of aligned crops from one request. Returns (embeddings, timing_ms)."""
+        if not faces:
+            return [], {}
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        enqueued = time.perf_counter()
+        futures = []
+        for face in faces:
+            fut = loop.create_future()
+            futures.append(fut)
+            await self._queue.put((face, fut))
+        results = await asyncio.gather(*futures)
+        embeddings = [r[0] for r in results]
+        # All crops of one request finish together or in consecutive batches; report the slowest
+        batch_timing = max((r[1] for r in results), key=lambda t: t.get("inference_ms", 0))
+        return embeddings, {
+            **batch_timing,
+            "batch_wait_ms": round((time.perf_counter() - enqueued) * 1000 - batch_timing.get("inference_ms", 0), 1),
+        }
+
+    async def _collect(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            # Only hold the batch open while the pool is busy; an idle pool runs it at once
+            deadline = time.perf_counter() + (self.max_wait if self._inflight.locked() else 0.0)
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            # Cap concurrent batches at the pool size; more crops keep queueing meanwhile
+            await self._inflight.acquire()
+            asyncio.get_running_loop().create_task(self._run(batch))
+
+    async def _run(self, batch):
+        try:
+            embeddings, timing = await self.model_service.run(
+                self.model_service.embed_batch, [face for face, _ in batch]
+            )
+            timing["batch_size"] = len(batch)
+            for (_, fut), emb in zip(batch, embeddings):
+                if not fut.done():
+                    fut.set_result((emb, timing))
+            self.totals["batches"] += 1
+            self.totals["crops"] += len(batch)
+            self.totals["max_batch_seen"] = max(self.totals["max_batch_seen"], len(batch))
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+        finally:
+            self._inflight.release()
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        batches = self.totals["batches"] or 1
+        return {
+            **self.totals,
+            "avg_batch": round(self.totals["crops"] / batches, 2),
+            "queued": self._queue.qsize() if self._queue else 0,
+        }
@@ -0,0 +1,185 @@
+"""
+Compact embedding codecs and a packed binary wire format.
+
+Embeddings used to travel as JSON lists of Python floats: roughly 10 KB of
+text per 512-d ArcFace vector, parsed back into 512 Python objects on every
+hop. Here they stay numpy arrays end to end:
+
+* f32 - 4 bytes/dim, exact.
+* f16 - 2 bytes/dim; cosine error ~1e-4, no effect on matching.
+* i8  - 1 byte/dim + one float32 scale per vector (symmetric, per vector).
+* PQ  - ProductQuantizer, `m` bytes per vector (64 -> 32x smaller than f32).
+        Needs a trained codebook, so it is for storage and archives, not the wire.
+
+Packed wire format (`application/x-kr-embeddings`), little-endian:
+
+    b"KRE1" | u8 codec (0 f32, 1 f16, 2 i8) | u8 flags | u16 dim | u32 count
+    count x dim codes
+    count x f32 scales                       (i8 only)
+    u32 length + UTF-8 JSON list             (flags bit 0: one metadata dict per row)
+
+`format_vector()` is the compact pgvector text form for the places that still
+have to speak JSON (PostgREST inserts and RPC arguments).
+"""
+import json
+import struct
+
+import numpy as np
+
+MEDIA_TYPE = "application/x-kr-embeddings"
+MAGIC = b"KRE1"
+HEADER = struct.Struct("<4sBBHI")
+CODECS = {"f32": 0, "f16": 1, "i8": 2}
+FLAG_META = 1
+
+
+class CodecError(ValueError):
+    """Malformed packed embedding payload."""
+
+
+# --- SCALAR QUANTIZATION ---
+
+def quantize_int8(vectors):
+    """Symmetric per-vector int8: returns (codes int8 (n, dim), scales float32 (n,))."""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def dequantize_int8(codes, scales):
+    return codes.astype(np.float32) * np.asarray(scales, dtype=np.float32)[:, None]
+
+
+def encode(vectors, codec):
+    """(codes, scales-or-None) for a float matrix."""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    if codec == "f32":
+        return vectors, None
+    if codec == "f16":
+        return vectors.astype(np.float16), None
+    if codec == "i8":
+        return quantize_int8(vectors)
+    raise ValueError(f"Unknown embedding codec: {codec}")
+
+
+def decode(codes, scales=None):
+    if codes.dtype == np.int8:
+        return dequantize_int8(codes, scales)
+    return codes.astype(np.float32)
+
+
+# --- WIRE FORMAT ---
+
+def pack(vectors, codec="f16", meta=None):
+    """Serialise an (n, dim) matrix (+ optional per-row metadata dicts) to bytes."""
+    codes, scales = encode(vectors, codec)
+    n, dim = codes.shape
+    if meta is not None and len(meta) != n:
+        raise ValueError(f"{len(meta)} metadata rows for {n} vectors")
+    parts = [HEADER.pack(MAGIC, CODECS[codec], FLAG_META if meta is not None else 0, dim, n),
+             codes.astype(codes.dtype.newbyteorder("<"), copy=False).tobytes()]
+    if scales is not None:
+        parts.append(scales.astype("<f4", copy=False).tobytes())
+    if meta is not None:
+        blob = json.dumps(meta, separators=(",", ":")).encode()
+        parts += [struct.pack("<I", len(blob)), blob]
+    return b"".join(parts)
+
+
+def unpack(data):
+    """bytes -> (float32 (n, dim) matrix, metadata list or None). Raises CodecError."""
+    if len(data) < HEADER.size:
+        raise CodecError("Payload shorter than header")
+    magic, codec, flags, dim, n = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise CodecError("Not a packed embedding payload")
+    dtype = {0: "<f4", 1: "<f2", 2: "i1"}.get(codec)
+    if dtype is None:
+        raise CodecError(f"Unknown codec id {codec}")
+
+    offset = HEADER.size
+    size = n * dim * np.dtype(dtype).itemsize
+    if len(data) < offset + size:
+        raise CodecError("Truncated vector block")
+    codes = np.frombuffer(data, dtype=dtype, count=n * dim, offset=offset).reshape(n, dim)
+    offset += size
+    scales = None
+    if codec == CODECS["i8"]:
+        if len(data) < offset + 4 * n:
+            raise CodecError("Truncated scale block")
+        scales = np.frombuffer(data, dtype="<f4", count=n, offset=offset)
+        offset += 4 * n
+
+    meta = None
+    if flags & FLAG_META:
+        if len(data) < offset + 4:
+            raise CodecError("Truncated metadata length")
+        (length,) = struct.unpack_from("<I", data, offset)
+        try:
+            meta = json.loads(data[offset + 4:offset + 4 + length])
+        except ValueError as e:
+            raise CodecError(f"Bad metadata: {e}")
+        if not isinstance(meta, list) or len(meta) != n:
+            raise CodecError("Metadata must be a list with one entry per vector")
+    return decode(codes, scales), meta
+
+
+def format_vector(vector, digits=6):
+    """pgvector text '[0.0123,-0.0456,...]' with `digits` significant digits (float32 has ~7)."""
+    fmt = f"{{:.{digits}g}}".format
+    return "[" + ",".join(map(fmt, np.asarray(vector, dtype=np.float32).ravel().tolist())) + "]"
+
+
+# --- PRODUCT QUANTIZATION (optional) ---
+
+class ProductQuantizer:
+    """Split vectors into `m` sub-spaces and k-means each into `ks` (<= 256) centroids; one byte per sub-space."""
+
+    def __init__(self, dim=512, m=64, ks=256):
+        if dim % m:
+            raise ValueError(f"dim {dim} is not divisible by m={m}")
+        self.dim, self.m, self.ks = dim, m, ks
+        self.sub = dim // m
+        self.codebooks = None  # (m, ks, sub)
+
+    def train(self, sample, iterations=12, seed=0):
+        sample = np.asarray(sample, dtype=np.float32).reshape(-1, self.m, self.sub)
+        rng = np.random.default_rng(seed)
+        books = np.empty((self.m, self.ks, self.sub), dtype=np.float32)
+        for j in range(self.m):
+            x = sample[:, j]
+            c = x[rng.choice(x.shape[0], self.ks, replace=x.shape[0] < self.ks)].copy()
+            for _ in range(iterations):
+                assign = self._nearest(x, c)
+                counts = np.bincount(assign, minlength=self.ks)
+                sums = np.zeros_like(c)
+                np.add.at(sums, assign, x)
+                live = counts > 0
+                c[live] = sums[live] / counts[live, None]
+                # Re-seed dead centroids from random points
+                c[~live] = x[rng.choice(x.shape[0], int((~live).sum()))]
+            books[j] = c
+        self.codebooks = books
+        return self
+
+    @staticmethod
+    def _nearest(x, c):
+        return np.argmin((c * c).sum(1)[None, :] - 2 * x @ c.T, axis=1)
+
+    def encode(self, vectors):
+        x = np.asarray(vectors, dtype=np.float32).reshape(-1, self.m, self.sub)
+        codes = np.empty((x.shape[0], self.m), dtype=np.uint8)
+        for j in range(self.m):
+            codes[:, j] = self._nearest(x[:, j], self.codebooks[j])
+        return codes
+
+    def decode(self, codes):
+        return self.codebooks[np.arange(self.m), codes].reshape(codes.shape[0], self.dim)
+
+    def scores(self, query, codes):
+        """Asymmetric inner products query . decode(codes) via per-sub-space lookup tables."""
+        q = np.asarray(query, dtype=np.float32).reshape(self.m, 1, self.sub)
+        tables = (self.codebooks * q).sum(-1)  # (m, ks)
+        return tables[np.arange(self.m), codes].sum(axis=1)
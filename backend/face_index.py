@@ -0,0 +1,838 @@
+"""
+In-process ANN index over sighting embeddings.
+
+The `sightings` table stays the system of record. This index is a derived,
+rebuildable copy of `face_vector` that lets /search/biometric answer without
+the full-scan `match_faces` RPC:
+
+* EmbeddingStore - append-only, memory-mapped float32 vectors + packed
+  metadata (id, seen_at, lat, lon, cam) on local disk. With a `codec` of
+  f16 or i8 it also keeps a quantized copy (2x / 4x smaller) that searches
+  scan instead; the float32 file is only read to rescore the shortlist.
+* FaceIndex      - IVF (inverted file) over the store. A spherical k-means
+  coarse quantizer splits the gallery into `nlist` cells; a query only scans
+  the `nprobe` closest cells. Below `train_min` vectors it falls back to an
+  exact flat scan.
+
+Every row also belongs to one (time bucket, camera) partition. A search with
+a SearchFilter (time window, cameras, lat/lon box) gathers only the rows of
+the partitions that can match, instead of post-filtering a global scan; small
+selections are scanned exactly, large ones are intersected with the IVF probe.
+
+Sightings moved to the cold archive (sighting_archive.py) are evicted: the
+store is compacted in place and partitions / IVF lists are rebuilt.
+
+Quantized scans rescore the best `match_count * rescore` candidates exactly,
+so results stay within the recall tolerance measured by
+benchmarks/bench_embedding_codec.py (top-50 recall >= 0.99 for i8, rescore 4).
+
+Results have the same shape as `match_faces` (plus the sighting id):
+    [{"id", "cam_id", "seen_at", "lat", "lon", "similarity"}, ...]
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from array import array
+
+import numpy as np
+
+from embedding_codec import encode
+from tail_cursor import TailCursor
+from timeutils import parse_timestamp, format_timestamp
+
+EMBEDDING_DIM = 512
+
+META_DTYPE = np.dtype([
+    ("id", "<i8"),
+    ("seen_at", "<f8"),  # epoch seconds (UTC)
+    ("lat", "<f4"),
+    ("lon", "<f4"),
+    ("cam", "<i4"),      # index into the store's camera vocabulary
+])
+
+CODE_DTYPES = {"f16": np.float16, "i8": np.int8}
+# How far below the threshold a quantized score may sit and still be rescored
+CODEC_MARGIN = {"f16": 0.002, "i8": 0.02}
+
+
+# --- HELPERS ---
+
+def parse_vector(value, dim=EMBEDDING_DIM):
+    """pgvector comes back from PostgREST as the string '[0.1,0.2,...]'."""
+    if isinstance(value, str):
+        value = json.loads(value)
+    vec = np.asarray(value, dtype=np.float32).reshape(-1)
+    if vec.shape[0] != dim:
+        raise ValueError(f"Expected {dim}-d embedding, got {vec.shape[0]}")
+    return vec
+
+
+def normalize(vectors):
+    """L2-normalise rows so that dot product == cosine similarity."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k(similarities, k):
+    """Indices of the k largest similarities, best first."""
+    if similarities.shape[0] <= k:
+        return np.argsort(-similarities)
+    part = np.argpartition(-similarities, k - 1)[:k]
+    return part[np.argsort(-similarities[part])]
+
+
+class SearchFilter:
+    """
+    Where/when restriction for a search: [since, until) as ISO strings or epoch
+    seconds, a set of camera ids, and/or a (min_lat, min_lon, max_lat, max_lon)
+    box over the sighting GPS. Empty filter = whole gallery.
+    """
+
+    def __init__(self, since=None, until=None, cam_ids=None, bbox=None):
+        self.since = _epoch(since)
+        self.until = _epoch(until)
+        self.cam_ids = set(cam_ids) if cam_ids else None
+        if bbox is not None:
+            if len(bbox) != 4:
+                raise ValueError("bbox needs min_lat,min_lon,max_lat,max_lon")
+            min_lat, min_lon, max_lat, max_lon = (float(v) for v in bbox)
+            if min_lat > max_lat or min_lon > max_lon:
+                raise ValueError("bbox minimums must not exceed maximums")
+            bbox = (min_lat, min_lon, max_lat, max_lon)
+        self.bbox = bbox
+        if self.since is not None and self.until is not None and self.since >= self.until:
+            raise ValueError("since must be before until")
+
+    @classmethod
+    def parse(cls, since=None, until=None, cams=None, bbox=None):
+        """From request strings: cams "Gate_1,Ghat_3", bbox "25.40,81.80,25.46,81.90"."""
+        cam_ids = [c.strip() for c in cams.split(",") if c.strip()] if cams else None
+        box = [v for v in bbox.split(",")] if bbox else None
+        return cls(since, until, cam_ids, box)
+
+    def __bool__(self):
+        return any(v is not None for v in (self.since, self.until, self.cam_ids, self.bbox))
+
+    def matches(self, row):
+        """Row-level check for results from paths without partitions (the RPC fallback)."""
+        if self.cam_ids is not None and row.get("cam_id") not in self.cam_ids:
+            return False
+        if self.since is not None or self.until is not None:
+            ts = parse_timestamp(row.get("seen_at"))
+            if (self.since is not None and ts < self.since) or (self.until is not None and ts >= self.until):
+                return False
+        if self.bbox is not None:
+            lat, lon = row.get("lat") or 0.0, row.get("lon") or 0.0
+            if not (self.bbox[0] <= lat <= self.bbox[2] and self.bbox[1] <= lon <= self.bbox[3]):
+                return False
+        return True
+
+    def rpc_params(self):
+        """Arguments for the match_faces_filtered SQL function (db_setup.sql)."""
+        return {
+            "since": format_timestamp(self.since) if self.since is not None else None,
+            "until": format_timestamp(self.until) if self.until is not None else None,
+            "cam_ids": sorted(self.cam_ids) if self.cam_ids is not None else None,
+            "min_lat": self.bbox[0] if self.bbox else None,
+            "min_lon": self.bbox[1] if self.bbox else None,
+            "max_lat": self.bbox[2] if self.bbox else None,
+            "max_lon": self.bbox[3] if self.bbox else None,
+        }
+
+
+def _epoch(value):
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return parse_timestamp(value)
+
+
+# --- STORAGE ---
+
+class EmbeddingStore:
+    """Append-only memory-mapped vectors + metadata (compacted by retain()). Grows by doubling."""
+
+    VECTOR_FILE = "vectors.f32"
+    META_FILE = "meta.bin"
+    HEADER_FILE = "store.json"
+    SCALE_FILE = "scales.f32"
+
+    def __init__(self, path, dim=EMBEDDING_DIM, initial_capacity=4096, codec="f32"):
+        if codec != "f32" and codec not in CODE_DTYPES:
+            raise ValueError(f"Unknown index codec: {codec}")
+        self.path = path
+        self.dim = dim
+        self.codec = codec
+        self.codes = None
+        self.scales = None
+        os.makedirs(path, exist_ok=True)
+
+        header = {}
+        header_path = os.path.join(path, self.HEADER_FILE)
+        if os.path.exists(header_path):
+            with open(header_path, "r") as f:
+                header = json.load(f)
+            if header.get("dim", dim) != dim:
+                raise ValueError(f"Index at {path} was built for {header['dim']}-d vectors")
+
+        self.count = header.get("count", 0)
+        self.cams = header.get("cams", [])
+        self.synced_id = header.get("synced_id")  # FaceIndex's stable DB sync id (None: older file)
+        self._cam_lookup = {c: i for i, c in enumerate(self.cams)}
+        self.capacity = 0
+        self.vectors = None
+        self.meta = None
+        self._open(max(header.get("capacity", 0), initial_capacity))
+        self.ids = set(int(i) for i in self.meta["id"][:self.count])
+        if codec != "f32" and header.get("codec", "f32") != codec:
+            self._rebuild_codes()
+
+    @property
+    def code_file(self):
+        return f"codes.{self.codec}"
+
+    def _open(self, capacity):
+        files = [(self.VECTOR_FILE, 4 * self.dim), (self.META_FILE, META_DTYPE.itemsize)]
+        if self.codec != "f32":
+            files.append((self.code_file, np.dtype(CODE_DTYPES[self.codec]).itemsize * self.dim))
+        if self.codec == "i8":
+            files.append((self.SCALE_FILE, 4))
+        for fname, itemsize in files:
+            fpath = os.path.join(self.path, fname)
+            with open(fpath, "a+b") as f:
+                if os.path.getsize(fpath) < capacity * itemsize:
+                    f.truncate(capacity * itemsize)
+        self.vectors = np.memmap(os.path.join(self.path, self.VECTOR_FILE), dtype=np.float32,
+                                 mode="r+", shape=(capacity, self.dim))
+        self.meta = np.memmap(os.path.join(self.path, self.META_FILE), dtype=META_DTYPE,
+                              mode="r+", shape=(capacity,))
+        if self.codec != "f32":
+            self.codes = np.memmap(os.path.join(self.path, self.code_file), dtype=CODE_DTYPES[self.codec],
+                                   mode="r+", shape=(capacity, self.dim))
+        if self.codec == "i8":
+            self.scales = np.memmap(os.path.join(self.path, self.SCALE_FILE), dtype=np.float32,
+                                    mode="r+", shape=(capacity,))
+        self.capacity = capacity
+
+    def _write_codes(self, start, vectors):
+        codes, scales = encode(vectors, self.codec)
+        self.codes[start:start + len(codes)] = codes
+        if scales is not None:
+            self.scales[start:start + len(codes)] = scales
+
+    def _rebuild_codes(self, chunk=65536):
+        """Quantize existing float32 rows (index opened with a new codec)."""
+        for s in range(0, self.count, chunk):
+            self._write_codes(s, np.asarray(self.vectors[s:min(s + chunk, self.count)]))
+        self.flush()
+
+    def _reserve(self, extra):
+        needed = self.count + extra
+        if needed <= self.capacity:
+            return
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        self.vectors.flush()
+        self.meta.flush()
+        self._open(capacity)
+
+    def cam_code(self, cam_id):
+        code = self._cam_lookup.get(cam_id)
+        if code is None:
+            code = len(self.cams)
+            self.cams.append(cam_id)
+            self._cam_lookup[cam_id] = code
+        return code
+
+    def append(self, ids, vectors, cam_ids, seen_ats, lats, lons):
+        """Append rows (vectors must already be normalised). Returns the new row range."""
+        n = len(ids)
+        self._reserve(n)
+        start = self.count
+        self.vectors[start:start + n] = vectors
+        if self.codec != "f32":
+            self._write_codes(start, vectors)
+        rows = self.meta[start:start + n]
+        rows["id"] = ids
+        rows["seen_at"] = seen_ats
+        rows["lat"] = lats
+        rows["lon"] = lons
+        rows["cam"] = [self.cam_code(c) for c in cam_ids]
+        self.count += n
+        self.ids.update(int(i) for i in ids)
+        return start, self.count
+
+    def retain(self, keep, chunk=65536):
+        """Keep only rows `keep` (ascending), shifted down in place. The header is
+        removed first, so a crash mid-way reopens as an empty store and resyncs."""
+        header_path = os.path.join(self.path, self.HEADER_FILE)
+        if os.path.exists(header_path):
+            os.remove(header_path)
+        for s in range(0, len(keep), chunk):
+            # Destination s.. never overtakes the source rows still to be read (keep[i] >= i)
+            src = keep[s:s + chunk]
+            self.vectors[s:s + len(src)] = self.vectors[src]
+            self.meta[s:s + len(src)] = self.meta[src]
+            if self.codes is not None:
+                self.codes[s:s + len(src)] = self.codes[src]
+            if self.scales is not None:
+                self.scales[s:s + len(src)] = self.scales[src]
+        self.count = len(keep)
+        self.ids = set(int(i) for i in self.meta["id"][:self.count])
+        self.flush()
+
+    def scores(self, query, rows=None, chunk=4096):
+        """Approximate similarities from the quantized codes (all rows, or `rows`) for one
+        query (dim,) or several as columns (dim, m). Small chunks keep the float32 upcast
+        in cache, so an i8 scan runs at about f32 speed on a quarter of the memory;
+        numpy's f16 upcast is several times slower."""
+        n = self.count if rows is None else len(rows)
+        out = np.empty((n,) + query.shape[1:], dtype=np.float32)
+        for s in range(0, n, chunk):
+            r = slice(s, min(s + chunk, n)) if rows is None else rows[s:s + chunk]
+            sims = np.asarray(self.codes[r], dtype=np.float32) @ query
+            if self.scales is not None:
+                sims *= self.scales[r].reshape((-1,) + (1,) * (query.ndim - 1))
+            out[s:s + chunk] = sims
+        return out
+
+    def row(self, i):
+        m = self.meta[i]
+        return {
+            "id": int(m["id"]),
+            "cam_id": self.cams[int(m["cam"])],
+            "seen_at": format_timestamp(m["seen_at"]),
+            "lat": float(m["lat"]),
+            "lon": float(m["lon"]),
+        }
+
+    def flush(self):
+        self.vectors.flush()
+        self.meta.flush()
+        if self.codes is not None:
+            self.codes.flush()
+        if self.scales is not None:
+            self.scales.flush()
+        header_path = os.path.join(self.path, self.HEADER_FILE)
+        with open(header_path + ".tmp", "w") as f:
+            json.dump({"dim": self.dim, "count": self.count, "capacity": self.capacity,
+                       "cams": self.cams, "codec": self.codec, "synced_id": self.synced_id}, f)
+        os.replace(header_path + ".tmp", header_path)
+
+
+# --- INDEX ---
+
+def train_centroids(sample, nlist, iterations=10, seed=0):
+    """Spherical k-means on a (normalised) sample."""
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(sample.shape[0], nlist, replace=False)].copy()
+    for _ in range(iterations):
+        sums = cell_sums(sample, assign_cells(sample, centroids), nlist)
+        empty = np.linalg.norm(sums, axis=1) == 0
+        # Re-seed empty cells from random points so no list stays dead
+        sums[empty] = sample[rng.choice(sample.shape[0], int(empty.sum()))]
+        centroids = normalize(sums)
+    return centroids
+
+
+def cell_sums(vectors, assign, nlist):
+    order = np.argsort(assign, kind="stable")
+    cells, starts = np.unique(assign[order], return_index=True)
+    sums = np.zeros((nlist, vectors.shape[1]), dtype=np.float32)
+    sums[cells] = np.add.reduceat(vectors[order], starts, axis=0)
+    return sums
+
+
+def group_cells(assign, nlist):
+    """Row ids per cell, as growable int64 arrays."""
+    order = np.argsort(assign, kind="stable")
+    bounds = np.searchsorted(assign[order], np.arange(nlist + 1))
+    return [array("q", order[bounds[c]:bounds[c + 1]].tolist()) for c in range(nlist)]
+
+
+def assign_cells(vectors, centroids, chunk=65536):
+    out = np.empty(vectors.shape[0], dtype=np.int64)
+    for s in range(0, vectors.shape[0], chunk):
+        out[s:s + chunk] = np.argmax(np.asarray(vectors[s:s + chunk]) @ centroids.T, axis=1)
+    return out
+
+
+class FaceIndex:
+    """IVF index over an EmbeddingStore, updated incrementally as sightings arrive."""
+
+    def __init__(self, path, dim=EMBEDDING_DIM, nlist=None, nprobe=16, train_min=20000,
+                 codec="f32", rescore=4, partition_seconds=3600, lazy=False, sync_overlap=30.0):
+        """lazy: leave loading the store (and training) to open(), which the sync thread
+        calls first, so constructing the index costs nothing at process start.
+        sync_overlap: seconds of trailing ids each DB sync re-reads (see tail_cursor.py)."""
+        self.path = path
+        self.codec = codec
+        self.store = None  # EmbeddingStore once open()
+        self.partition_seconds = partition_seconds
+        self.rescore = rescore
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_min = train_min
+        self.centroids = None
+        self.lists = []
+        self.trained_count = 0
+        self._training = False  # a fit is running (off the lock, see _train)
+        self._train_thread = None
+        self.ready = False  # True once the initial DB sync has completed
+        self.error = None  # last sync failure, until a sync succeeds
+        self.generation = 0  # bumped when rows are evicted (row numbers shift)
+        self.cursor = TailCursor(sync_overlap)
+        self._lock = threading.RLock()
+        self._sync_thread = None
+        self.partitions = {}  # time bucket -> {cam code -> rows, ascending}
+        self._buckets = []  # sorted time buckets
+        self.partition_boxes = {}  # (bucket, cam code) -> [min_lat, min_lon, max_lat, max_lon]
+        if not lazy:
+            self.open()
+
+    def open(self):
+        """Load the store from disk, partition it and train the coarse quantizer. Idempotent."""
+        due = None
+        with self._lock:
+            if self.store is None:
+                self.store = EmbeddingStore(self.path, dim=self.dim, codec=self.codec)
+                last_id = max(self.store.ids) if self.store.ids else 0
+                self.cursor.resume(last_id if self.store.synced_id is None else self.store.synced_id, last_id)
+                self._partition(0, self.store.count)
+                due = self._training_due()
+        if due:
+            self._train(due)
+        return self
+
+    @property
+    def state(self):
+        """cold -> loading (disk load + DB backfill) -> ready | failed."""
+        if self.ready:
+            return "ready"
+        if self.error:
+            return "failed"
+        return "loading" if self._sync_thread is not None else "cold"
+
+    @classmethod
+    def from_env(cls, lazy=False):
+        nlist = os.getenv("FACE_INDEX_NLIST")
+        return cls(
+            path=os.getenv("FACE_INDEX_DIR", "face_index"),
+            nlist=int(nlist) if nlist else None,
+            nprobe=int(os.getenv("FACE_INDEX_NPROBE", "16")),
+            train_min=int(os.getenv("FACE_INDEX_TRAIN_MIN", "20000")),
+            codec=os.getenv("FACE_INDEX_CODEC", "f32"),
+            rescore=int(os.getenv("FACE_INDEX_RESCORE", "4")),
+            partition_seconds=int(os.getenv("FACE_INDEX_PARTITION_SECONDS", "3600")),
+            lazy=lazy,
+            sync_overlap=float(os.getenv("SYNC_OVERLAP_SECONDS", "30")),
+        )
+
+    def __len__(self):
+        return self.store.count if self.store is not None else 0
+
+    # --- write path ---
+
+    def add(self, sighting_id, vector, cam_id, seen_at=None, lat=0.0, lon=0.0):
+        return self.add_batch([{
+            "id": sighting_id, "face_vector": vector, "cam_id": cam_id,
+            "seen_at": seen_at, "lat": lat, "lon": lon,
+        }])
+
+    def add_batch(self, rows):
+        """Add `sightings` rows (dicts with id/face_vector/cam_id/seen_at/lat/lon). Skips known ids."""
+        if self.store is None:
+            return 0  # not loaded yet: the first sync picks these rows up from the DB
+        # Cheap pre-filter (skips parsing known rows); add_vectors re-checks under the lock
+        rows = [r for r in rows if int(r["id"]) not in self.store.ids]
+        if not rows:
+            return 0
+        return self.add_vectors(
+            ids=[int(r["id"]) for r in rows],
+            vectors=np.stack([parse_vector(r["face_vector"], self.dim) for r in rows]),
+            cam_ids=[r.get("cam_id") or "UNKNOWN" for r in rows],
+            seen_ats=[parse_timestamp(r.get("seen_at")) for r in rows],
+            lats=[r.get("lat") or 0.0 for r in rows],
+            lons=[r.get("lon") or 0.0 for r in rows],
+        )
+
+    def add_vectors(self, ids, vectors, cam_ids, seen_ats, lats, lons):
+        """Bulk numpy path (backfills, benchmarks). Ids already indexed (or repeated in the
+        batch) are skipped under the lock, so a live add racing the sync thread cannot
+        store a sighting twice. A retrain that falls due runs in a background thread
+        (join_training() waits for it)."""
+        with self._lock:
+            keep, batch = [], set()
+            for i, sid in enumerate(ids):
+                sid = int(sid)
+                if sid not in self.store.ids and sid not in batch:
+                    batch.add(sid)
+                    keep.append(i)
+            if not keep:
+                return 0
+            if len(keep) < len(ids):
+                ids, cam_ids, seen_ats, lats, lons = ([seq[i] for i in keep]
+                                                      for seq in (ids, cam_ids, seen_ats, lats, lons))
+                vectors = np.asarray(vectors)[keep]
+            vectors = normalize(vectors)
+            start, end = self.store.append(ids, vectors, cam_ids, seen_ats, lats, lons)
+            self._partition(start, end)
+            if self.centroids is not None:
+                for row, cell in zip(range(start, end), assign_cells(vectors, self.centroids)):
+                    self.lists[cell].append(row)
+            due = self._training_due()
+        if due:
+            # Never in the caller's thread: that may be a request waiting on its upload
+            self._train_thread = threading.Thread(target=self._train, args=(due,), name="face-index-train",
+                                                  daemon=True)
+            self._train_thread.start()
+        return end - start
+
+    def join_training(self, timeout=None):
+        """Wait for a background retrain started by add_vectors (benchmarks, backfills)."""
+        thread = self._train_thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def evict(self, sighting_ids):
+        """Drop sightings (moved to the cold archive). Rows are compacted in place and
+        partitions / IVF lists rebuilt with the current centroids. Returns rows removed."""
+        self.open()  # archived rows must leave the on-disk store too
+        with self._lock:
+            n = self.store.count
+            drop = np.isin(self.store.meta["id"][:n], np.asarray(sighting_ids, dtype=np.int64))
+            if not drop.any():
+                return 0
+            self.store.retain(np.nonzero(~drop)[0])
+            self.partitions, self._buckets, self.partition_boxes = {}, [], {}
+            self._partition(0, self.store.count)
+            if self.centroids is not None and self.store.count >= self.train_min:
+                self.lists = group_cells(assign_cells(self.store.vectors[:self.store.count], self.centroids),
+                                         len(self.centroids))
+                self.trained_count = min(self.trained_count, self.store.count)
+            else:
+                self.centroids, self.lists, self.trained_count = None, [], 0
+            self.generation += 1
+            return int(drop.sum())
+
+    def _partition(self, start, end):
+        """File rows [start, end) under their (time bucket, camera) partition."""
+        if end <= start:
+            return
+        meta = np.asarray(self.store.meta[start:end])
+        buckets = np.floor(meta["seen_at"] / self.partition_seconds).astype(np.int64)
+        keys = buckets * (1 << 20) + meta["cam"]
+        order = np.argsort(keys, kind="stable")
+        groups, firsts = np.unique(keys[order], return_index=True)
+        for group, lo, hi in zip(groups, firsts, list(firsts[1:]) + [len(order)]):
+            part = order[lo:hi]
+            bucket, cam = int(group) >> 20, int(group) & ((1 << 20) - 1)
+            if bucket not in self.partitions:
+                self.partitions[bucket] = {}
+                bisect.insort(self._buckets, bucket)
+            self.partitions[bucket].setdefault(cam, array("q")).extend((part + start).tolist())
+            lat, lon = meta["lat"][part], meta["lon"][part]
+            box = [float(lat.min()), float(lon.min()), float(lat.max()), float(lon.max())]
+            old = self.partition_boxes.get((bucket, cam))
+            if old is not None:
+                box = [min(old[0], box[0]), min(old[1], box[1]), max(old[2], box[2]), max(old[3], box[3])]
+            self.partition_boxes[(bucket, cam)] = box
+
+    def _select_partitions(self, flt):
+        """Row lists of the partitions that can hold matches for `flt`: a bisect over the
+        time buckets, then the requested cameras, then a box-overlap check."""
+        lo = 0 if flt.since is None else bisect.bisect_left(
+            self._buckets, int(np.floor(flt.since / self.partition_seconds)))
+        hi = len(self._buckets) if flt.until is None else bisect.bisect_right(
+            self._buckets, int(np.floor(flt.until / self.partition_seconds)))
+        cams = None
+        if flt.cam_ids is not None:
+            cams = [self.store._cam_lookup[c] for c in flt.cam_ids if c in self.store._cam_lookup]
+        parts = []
+        for bucket in self._buckets[lo:hi]:
+            by_cam = self.partitions[bucket]
+            for cam in (by_cam if cams is None else (c for c in cams if c in by_cam)):
+                if flt.bbox is not None:
+                    box = self.partition_boxes[(bucket, cam)]
+                    if box[0] > flt.bbox[2] or box[2] < flt.bbox[0] or box[1] > flt.bbox[3] or box[3] < flt.bbox[1]:
+                        continue
+                parts.append(by_cam[cam])
+        return parts
+
+    def _mask(self, rows, flt):
+        """Exact per-row check on the (28-byte) metadata; partitions only bound time and place."""
+        if flt.since is None and flt.until is None and flt.bbox is None and flt.cam_ids is None:
+            return rows
+        meta = self.store.meta[rows]
+        keep = np.ones(len(rows), dtype=bool)
+        if flt.since is not None:
+            keep &= meta["seen_at"] >= flt.since
+        if flt.until is not None:
+            keep &= meta["seen_at"] < flt.until
+        if flt.cam_ids is not None:
+            keep &= np.isin(meta["cam"], [self.store._cam_lookup[c] for c in flt.cam_ids
+                                          if c in self.store._cam_lookup])
+        if flt.bbox is not None:
+            keep &= (meta["lat"] >= flt.bbox[0]) & (meta["lat"] <= flt.bbox[2]) \
+                & (meta["lon"] >= flt.bbox[1]) & (meta["lon"] <= flt.bbox[3])
+        return rows[keep]
+
+    def _filtered_rows(self, flt, parts=None):
+        """Every row matching `flt`, gathered from the selected partitions only."""
+        parts = self._select_partitions(flt) if parts is None else parts
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        rows = np.sort(np.concatenate([np.frombuffer(p, dtype=np.int64) for p in parts]))
+        # Only the edge buckets (and boxes) overlap partially, but the check is cheap
+        if flt.since is not None or flt.until is not None or flt.bbox is not None:
+            rows = self._mask(rows, SearchFilter(flt.since, flt.until, None, flt.bbox))
+        return rows
+
+    def _training_due(self):
+        """Claim a (re)fit if one is due and none is running: (rows, generation), else None.
+        Caller holds the lock; the fit itself runs outside it (_train)."""
+        n = self.store.count
+        if self._training or n < self.train_min:
+            return None
+        # Retrain when the gallery has grown 4x since the last fit
+        if self.centroids is not None and n < 4 * self.trained_count:
+            return None
+        self._training = True
+        return n, self.generation
+
+    def _train(self, due):
+        """k-means over a snapshot of the first n rows without holding the lock, so adds
+        and searches carry on during the fit. Rows appended meanwhile are assigned when the
+        result is installed; a fit overtaken by an eviction (rows renumbered) is dropped."""
+        n, generation = due
+        try:
+            vectors = self.store.vectors  # rows [0, n) stay put in this mapping while we read
+            nlist = self.nlist or int(np.clip(np.sqrt(n), 16, 4096))
+            rng = np.random.default_rng(n)
+            sample_idx = np.sort(rng.choice(n, min(n, nlist * 64), replace=False))
+            centroids = train_centroids(np.asarray(vectors[sample_idx]), nlist)
+            assign = assign_cells(vectors[:n], centroids)
+            with self._lock:
+                if self.generation != generation:
+                    return
+                count = self.store.count
+                if count > n:
+                    assign = np.concatenate([assign, assign_cells(self.store.vectors[n:count], centroids)])
+                self.centroids, self.lists, self.trained_count = centroids, group_cells(assign, nlist), n
+            print(f"✅ Face Index trained: {n} vectors, {nlist} cells")
+        finally:
+            self._training = False
+
+    # --- read path ---
+
+    def _probe_cells(self, queries, nprobe):
+        """The nprobe nearest cells of each query; None = flat scan."""
+        if self.centroids is None or nprobe >= len(self.lists):
+            return None
+        k = min(nprobe, len(self.lists))
+        return [top_k(c, k) for c in queries @ self.centroids.T]
+
+    def _scan(self, rows, queries):
+        """rows x probes scores: exact for f32, approximate from the codes otherwise."""
+        if self.store.codec != "f32":
+            return self.store.scores(queries.T, rows)
+        return self._similarities(rows, queries)
+
+    def _similarities(self, rows, queries, chunk=65536):
+        """float32 rows x probes similarity matrix, one matmul per chunk of rows.
+        BLAS matrix-matrix kernels only beat matrix-vector from ~4 probes, so fewer
+        probes run one matrix-vector product each over small, cache-resident chunks."""
+        m = len(queries)
+        chunk = chunk if m >= 4 or m == 1 else 1024
+        out = np.empty((len(rows), m), dtype=np.float32)
+        for s in range(0, len(rows), chunk):
+            r = rows[s:s + chunk]
+            # Contiguous row ranges (flat scans) slice the memmap instead of gathering
+            block = self.store.vectors[r[0]:r[-1] + 1] if r[-1] - r[0] + 1 == len(r) else self.store.vectors[r]
+            block = np.asarray(block)
+            if 1 < m < 4:
+                for j in range(m):
+                    out[s:s + chunk, j] = block @ queries[j]
+            else:
+                out[s:s + chunk] = block @ queries.T
+        return out
+
+    def _scan_cells(self, queries, cells, where=None):
+        """IVF scan for several probes: each probed cell is read once and scored only
+        against the probes that picked it. Returns [(rows, scores)] per probe."""
+        by_cell = {}
+        for j, picked in enumerate(cells):
+            for c in picked:
+                by_cell.setdefault(int(c), []).append(j)
+        hits = [([], []) for _ in queries]
+        for cell, probes in by_cell.items():
+            rows = np.array(self.lists[cell], dtype=np.int64)
+            if where:
+                rows = self._mask(rows, where)
+            if not len(rows):
+                continue
+            scores = self._scan(rows, queries[probes])
+            for col, j in enumerate(probes):
+                hits[j][0].append(rows)
+                hits[j][1].append(scores[:, col])
+        return [(np.concatenate(r), np.concatenate(s)) if r else
+                (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for r, s in hits]
+
+    def search(self, query_embedding, match_threshold=0.45, match_count=50, nprobe=None, where=None):
+        """Top-k cosine matches above threshold, same shape as the `match_faces` RPC.
+        `where` (SearchFilter) restricts the scan to the matching partitions."""
+        return self.search_batch([query_embedding], match_threshold, match_count, nprobe, where)[0][0]
+
+    def search_batch(self, query_embeddings, match_threshold=0.45, match_count=50, nprobe=None,
+                     where=None, fuse=None):
+        """
+        Several probes (photos / faces of one person) against the gallery in one pass.
+        Flat and filtered scans score a shared candidate set as one rows x probes matmul;
+        IVF reads each probed cell once for all probes that chose it.
+        Returns (per-probe match lists, fused list or None). `fuse` = "max" | "mean"
+        ranks sightings by their best / average similarity over all probes.
+        """
+        queries = normalize(np.stack([parse_vector(q, self.dim) for q in query_embeddings]))
+        with self._lock:
+            nprobe = nprobe or self.nprobe
+            cells = self._probe_cells(queries, nprobe)
+            shared = None
+            if where:
+                parts = self._select_partitions(where)
+                # A filter narrower than an IVF probe is scanned exactly
+                if cells is None or sum(len(p) for p in parts) * len(self.lists) <= self.store.count * nprobe:
+                    shared = self._filtered_rows(where, parts)
+            elif cells is None:
+                shared = np.arange(self.store.count)
+
+            if shared is not None:
+                scores = self._scan(shared, queries)
+                hits = [(shared, scores[:, j]) for j in range(len(queries))]
+            else:
+                hits = self._scan_cells(queries, cells, where)
+
+            full = None  # (rows, exact rows x probes) when every probe was scored on the same rows
+            if self.store.codec != "f32":
+                # Rescore the union of the per-probe shortlists exactly
+                full = self._exact(queries, [self._shortlist(r, s, match_threshold - CODEC_MARGIN[self.store.codec],
+                                                              match_count * self.rescore) for r, s in hits])
+                hits = [(full[0], full[1][:, j]) for j in range(len(queries))]
+            elif shared is not None:
+                full = (shared, scores)
+
+            per_probe = [self._ranked(r, s, match_threshold, match_count) for r, s in hits]
+            fused = None
+            if fuse:
+                if full is None:
+                    full = self._exact(queries, [self._shortlist(r, s, match_threshold, match_count * self.rescore)
+                                                 for r, s in hits])
+                rows, sims = full
+                fused = self._ranked(rows, sims.max(axis=1) if fuse == "max" else sims.mean(axis=1),
+                                     match_threshold, match_count,
+                                     probe_hits=(sims > match_threshold).sum(axis=1))
+            return per_probe, fused
+
+    def search_since(self, query_embedding, start, match_threshold=0.45, match_count=50, where=None):
+        """Exact scan of only the rows appended at or after row `start` (a previous
+        len(index)). Returns (matches, new watermark), or None if the index no longer
+        reaches `start` (rebuilt), in which case the caller must search in full."""
+        query = normalize(parse_vector(query_embedding, self.dim))[None, :]
+        with self._lock:
+            end = self.store.count
+            if start > end:
+                return None
+            rows = np.arange(start, end)
+            if where and len(rows):
+                rows = self._mask(rows, where)
+            if not len(rows):
+                return [], end
+            scores = self._similarities(rows, query)[:, 0]
+            return self._ranked(rows, scores, match_threshold, match_count), end
+
+    @staticmethod
+    def _shortlist(rows, scores, floor, size):
+        keep = np.nonzero(scores > floor)[0]
+        return rows[keep[top_k(scores[keep], size)]]
+
+    def _exact(self, queries, shortlists):
+        rows = np.unique(np.concatenate(shortlists))
+        return rows, self._similarities(rows, queries)
+
+    def _ranked(self, rows, scores, match_threshold, match_count, **extra):
+        keep = np.nonzero(scores > match_threshold)[0]
+        best = keep[top_k(scores[keep], match_count)]
+        return [{**self.store.row(rows[i]), "similarity": float(scores[i]),
+                 **{k: int(v[i]) for k, v in extra.items()}} for i in best]
+
+    # --- DB sync ---
+
+    def sync_from_db(self, client, page_size=1000):
+        """Pull sightings past the sync cursor (covers rows written by indexer.py). The
+        trailing window is re-read each pass, so rows that commit out of id order are not
+        missed; add_batch skips the ones already indexed before parsing their vectors."""
+        self.open()
+        added = 0
+        after = self.cursor.floor()
+        while True:
+            res = client.table("sightings") \
+                .select("id, cam_id, seen_at, lat, lon, face_vector") \
+                .gt("id", after) \
+                .order("id") \
+                .limit(page_size) \
+                .execute()
+            rows = [r for r in res.data if r.get("face_vector") is not None]
+            if rows:
+                added += self.add_batch(rows)
+            if res.data:
+                self.cursor.read(r["id"] for r in res.data)
+                after = max(int(r["id"]) for r in res.data)
+            if len(res.data) < page_size:
+                break
+        self.cursor.mark()
+        with self._lock:
+            self.store.synced_id = self.cursor.stable_id
+            self.store.flush()
+        return added
+
+    def start_sync(self, client, interval=15.0):
+        """Initial backfill + periodic catch-up in a daemon thread."""
+        def loop():
+            while True:
+                try:
+                    added = self.sync_from_db(client)
+                    if not self.ready:
+                        print(f"✅ Face Index ready: {len(self)} vectors")
+                    elif added:
+                        print(f"🔄 Face Index synced {added} new sightings")
+                    self.ready = True
+                    self.error = None
+                except Exception as e:
+                    self.error = str(e)
+                    print(f"⚠️ Face Index sync failed: {e}")
+                time.sleep(interval)
+
+        if self._sync_thread is None:
+            self._sync_thread = threading.Thread(target=loop, daemon=True)
+            self._sync_thread.start()
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "vectors": len(self),
+            "cells": len(self.lists),
+            "nprobe": self.nprobe,
+            "codec": self.codec,
+            "partitions": len(self.partition_boxes),
+            "trained_on": self.trained_count,
+            "generation": self.generation,
+            "synced_to_id": self.cursor.stable_id,
+            "ready": self.ready,
+        }
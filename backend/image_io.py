@@ -0,0 +1,70 @@
+"""
+In-memory image decoding for uploaded frames and probe photos.
+
+Uploads are decoded straight from the request bytes into a BGR numpy array
+(what DeepFace accepts as `img_path`), so nothing touches the filesystem. For
+JPEGs a `max_side` bound is applied during decode via libjpeg's DCT scaling
+(IMREAD_REDUCED_COLOR_2/4/8), which is much cheaper than a full decode plus
+resize; whatever is left over is finished with a bilinear resize.
+"""
+import struct
+
+import cv2
+import numpy as np
+
+_REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+# JPEG start-of-frame markers that carry the image size (baseline, extended, progressive, ...)
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+class ImageDecodeError(Exception):
+    """Upload is empty or not an image OpenCV can read."""
+
+
+def jpeg_size(data):
+    """(width, height) from the JPEG header without decoding, or None if not a JPEG."""
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        length = struct.unpack(">H", data[i + 2:i + 4])[0]
+        if marker in _SOF_MARKERS:
+            height, width = struct.unpack(">HH", data[i + 5:i + 9])
+            return width, height
+        i += 2 + length
+    return None
+
+
+def decode_image(data, max_side=None):
+    """Upload bytes -> BGR ndarray, optionally bounded to `max_side` pixels on the long edge."""
+    if not data:
+        raise ImageDecodeError("Empty upload")
+    buf = np.frombuffer(data, dtype=np.uint8)
+
+    flag = cv2.IMREAD_COLOR
+    if max_side:
+        size = jpeg_size(data)
+        if size is not None:
+            long_side = max(size)
+            for factor, reduced in _REDUCED_FLAGS:
+                if long_side // factor >= max_side:
+                    flag = reduced
+                    break
+
+    img = cv2.imdecode(buf, flag)
+    if img is None:
+        raise ImageDecodeError("Could not decode image")
+
+    if max_side:
+        height, width = img.shape[:2]
+        long_side = max(height, width)
+        if long_side > max_side:
+            scale = max_side / long_side
+            img = cv2.resize(img, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_LINEAR)
+    return img
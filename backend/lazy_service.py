@@ -0,0 +1,83 @@
+"""
+Heavy dependencies started on first use, with an explicit readiness state.
+
+The API and the indexer used to build everything while importing: the
+Supabase client (and its ~0.3 s of imports) at module load, raising if the
+secrets were missing. A `LazyService` wraps one such dependency behind a
+factory that runs on first use, or ahead of time in a daemon thread via
+`start()`, so a process can answer health checks before its dependencies are
+up. Health endpoints report each service's state:
+
+    cold -> starting -> ready | failed
+
+A failed start is retried on the next use once `retry_after` seconds have
+passed; uses in between raise ServiceUnavailable at once (the API maps it to
+503). Attribute access is forwarded to the built object, so a LazyService can
+be handed to components in place of it (`supabase.table(...)` works as before).
+"""
+import threading
+import time
+
+
+class ServiceUnavailable(Exception):
+    """A lazy service is not (yet) available; API handlers map it to 503."""
+
+
+class LazyService:
+    def __init__(self, name, factory, retry_after=10.0):
+        self._name = name
+        self._factory = factory
+        self._retry_after = retry_after
+        self._value = None
+        self._failed_at = None
+        self._lock = threading.Lock()
+        self.state = "cold"
+        self.error = None
+        self.startup_s = None
+
+    def get(self):
+        """The built object; builds it (once, thread-safe) if needed."""
+        if self.state == "ready":
+            return self._value
+        with self._lock:
+            if self.state == "ready":
+                return self._value
+            if self.state == "failed" and time.monotonic() - self._failed_at < self._retry_after:
+                raise ServiceUnavailable(f"{self._name} unavailable: {self.error}")
+            self.state = "starting"
+            t0 = time.perf_counter()
+            try:
+                self._value = self._factory()
+            except Exception as e:
+                self.state, self.error, self._failed_at = "failed", str(e), time.monotonic()
+                print(f"❌ {self._name} failed to start: {e}")
+                raise ServiceUnavailable(f"{self._name} unavailable: {e}") from e
+            self.startup_s = time.perf_counter() - t0
+            self.error = None
+            self.state = "ready"
+            print(f"✅ {self._name} ready in {self.startup_s:.2f}s")
+            return self._value
+
+    def start(self):
+        """Build in the background (startup warm-up); a failure is only recorded."""
+        def warm():
+            try:
+                self.get()
+            except ServiceUnavailable:
+                pass
+
+        if self.state == "cold":
+            threading.Thread(target=warm, name=f"start-{self._name}", daemon=True).start()
+        return self
+
+    def __getattr__(self, attr):
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self.get(), attr)
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "startup_s": round(self.startup_s, 3) if self.startup_s is not None else None,
+            "error": self.error,
+        }
@@ -0,0 +1,290 @@
+"""
+Push-based live sighting feed.
+
+Dashboards used to poll /feed/live, which re-read the newest rows (including
+the 512-float face_vector) and re-enriched each one on every poll. Now the
+ingestion path publishes every new sighting once into an in-process
+LiveFeedBus, and each dashboard holds one Server-Sent Events stream:
+
+* events   - slim: id, cam_id, cam_name, seen_at, lat, lon, cursor (no vector),
+             enriched once at publish time.
+* cursors  - keyset (seen_at, id) as "<seen_at>,<id>". A stream started with
+             `after=` (or EventSource's Last-Event-ID) first replays what it
+             missed, then continues live; /feed/live pages history with `before=`.
+* sources  - publish() from /analyze_frame and /sightings/bulk, plus an id-tail
+             of `sightings` for rows written by indexer.py. The tail re-reads a
+             trailing window of ids each pass, so rows that commit out of id
+             order still get published (tail_cursor.py); ids already published
+             are remembered until they fall below the cursor's stable id.
+* slow     - each subscriber has a bounded queue. When it overflows, queued
+             events are dropped and the subscriber is flagged `lagged`; its
+             stream then resumes from its own cursor (ring buffer, else DB), so
+             a slow dashboard costs bounded memory and never blocks ingestion.
+
+Rows that arrive late with an older seen_at (edge spill replays) show up in
+history but are behind a resuming client's cursor.
+
+The bus is not specific to sightings: `table`, `columns`, `kind` and `extra`
+let the watchlist push `watch_alerts` rows the same way (/watchlist/alerts/stream).
+"""
+import asyncio
+import bisect
+import json
+import threading
+import time
+
+from tail_cursor import TailCursor
+from timeutils import parse_timestamp, format_timestamp
+
+SLIM_COLUMNS = "id, cam_id, seen_at, lat, lon"
+
+
+def make_cursor(seen_at, sighting_id):
+    return f"{format_timestamp(parse_timestamp(seen_at))},{int(sighting_id)}"
+
+
+def parse_cursor(cursor):
+    """'<seen_at>,<id>' -> (epoch, id); raises ValueError on garbage."""
+    seen_at, _, sighting_id = str(cursor).rpartition(",")
+    if not seen_at:
+        raise ValueError(f"Bad feed cursor: {cursor!r}")
+    return parse_timestamp(seen_at), int(sighting_id)
+
+
+def keyset_filter(cursor, direction):
+    """PostgREST `or` filter for rows strictly after ('gt') / before ('lt') a cursor."""
+    epoch, sighting_id = parse_cursor(cursor)
+    ts = format_timestamp(epoch)
+    return f"seen_at.{direction}.{ts},and(seen_at.eq.{ts},id.{direction}.{sighting_id})"
+
+
+class Subscriber:
+    def __init__(self, loop, max_queue):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.lagged = False
+        self.cursor = None  # cursor of the newest event delivered
+        self.dropped = 0
+
+    def _put(self, event):
+        if self.lagged:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Backpressure: drop what is queued, resume later from our own cursor
+            self.dropped += self.queue.qsize() + 1
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.lagged = True
+            self.queue.put_nowait(None)  # wake the stream
+
+    def offer(self, event):
+        self.loop.call_soon_threadsafe(self._put, event)
+
+
+class LiveFeedBus:
+    def __init__(self, locate=None, buffer=2000, max_queue=256, table="sightings",
+                 columns=SLIM_COLUMNS, kind="sighting", extra=(), sync_overlap=30.0):
+        """locate(cam_id, lat, lon) -> (name, lat, lon), e.g. CameraRegistry.locate.
+        `extra` row fields are copied into events as they are."""
+        self.locate = locate
+        self.table = table
+        self.columns = columns
+        self.kind = kind
+        self.extra = tuple(extra)
+        self.buffer = buffer
+        self.max_queue = max_queue
+        self.cursor = TailCursor(sync_overlap)
+        self.ready = False
+        self._keys = []    # (epoch, id) of the last `buffer` events, sorted
+        self._recent = []  # events, same order as _keys
+        self._seen = set()  # ids published (or seeded) above the cursor's stable id
+        self._subs = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.counters = {"published": 0, "lag_resyncs": 0, "dropped": 0}
+
+    @property
+    def last_synced_id(self):
+        return self.cursor.stable_id
+
+    # --- publish ---
+
+    def event(self, row):
+        cam_id = row.get("cam_id") or "UNKNOWN"
+        lat, lon = row.get("lat") or 0.0, row.get("lon") or 0.0
+        name = cam_id
+        if self.locate:
+            name, lat, lon = self.locate(cam_id, lat, lon)
+        seen_at = format_timestamp(parse_timestamp(row.get("seen_at")))
+        return {
+            "id": int(row["id"]), "cam_id": cam_id, "cam_name": name,
+            "seen_at": seen_at, "lat": lat, "lon": lon,
+            **{field: row.get(field) for field in self.extra},
+            "cursor": make_cursor(seen_at, row["id"]),
+        }
+
+    def _publish(self, rows):
+        events = [self.event(r) for r in rows]
+        with self._lock:
+            for ev in events:
+                key = parse_cursor(ev["cursor"])
+                i = bisect.bisect_right(self._keys, key)
+                self._keys.insert(i, key)
+                self._recent.insert(i, ev)
+            overflow = max(len(self._keys) - self.buffer, 0)
+            del self._keys[:overflow], self._recent[:overflow]
+            self.counters["published"] += len(events)
+            subs = list(self._subs)
+        for sub in subs:
+            for ev in events:
+                sub.offer(ev)
+
+    def publish(self, row):
+        """Live path: a row just inserted by this process (needs id, cam_id, seen_at)."""
+        sid = int(row["id"])
+        with self._lock:
+            if sid <= self.cursor.stable_id or sid in self._seen:
+                return
+            self._seen.add(sid)
+        self._publish([row])
+
+    def add_rows(self, rows):
+        """Tail path: rows pulled in id order; skips ids already published (live or
+        an earlier pass). Returns how many were published."""
+        fresh = []
+        with self._lock:
+            for row in rows:
+                sid = int(row["id"])
+                if sid <= self.cursor.stable_id or sid in self._seen:
+                    continue
+                self._seen.add(sid)
+                fresh.append(row)
+            self.cursor.read(int(row["id"]) for row in rows)
+        if fresh:
+            self._publish(fresh)
+        return len(fresh)
+
+    def sync(self, client, page_size=1000):
+        if not self.ready:
+            # Start at the head of the table; keep the newest rows for catch-up
+            res = client.table(self.table).select(self.columns) \
+                .order("id", desc=True).limit(self.buffer).execute()
+            rows = sorted(res.data, key=lambda r: int(r["id"]))
+            with self._lock:
+                ids = [int(r["id"]) for r in rows]
+                # Rows below the oldest seeded id that commit late are history only
+                self.cursor.resume(ids[0] if ids else 0, ids[-1] if ids else 0)
+                self._seen.update(ids)
+            if rows:
+                self._publish(rows)
+            self.cursor.mark()
+            self.ready = True
+            return len(rows)
+        added = 0
+        with self._lock:
+            after = self.cursor.floor()
+            self._seen = {i for i in self._seen if i > after}
+        while True:
+            res = client.table(self.table).select(self.columns) \
+                .gt("id", after).order("id").limit(page_size).execute()
+            added += self.add_rows(res.data)
+            if res.data:
+                after = max(int(r["id"]) for r in res.data)
+            if len(res.data) < page_size:
+                break
+        self.cursor.mark()
+        return added
+
+    def start_sync(self, client, interval=2.0):
+        def loop():
+            while True:
+                try:
+                    self.sync(client)
+                except Exception as e:
+                    print(f"⚠️ Live feed sync failed ({self.table}): {e}")
+                time.sleep(interval)
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=loop, name=f"live-feed-{self.kind}", daemon=True)
+            self._thread.start()
+
+    # --- subscribe ---
+
+    def since(self, cursor, limit=500):
+        """Buffered events strictly after `cursor`, oldest first, and whether the buffer
+        reaches back far enough to be complete."""
+        key = parse_cursor(cursor)
+        with self._lock:
+            start = bisect.bisect_right(self._keys, key)
+            complete = start > 0 or len(self._keys) < self.buffer
+            return self._recent[start:start + limit], complete
+
+    def subscribe(self):
+        sub = Subscriber(asyncio.get_running_loop(), self.max_queue)
+        with self._lock:
+            self._subs.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subs.discard(sub)
+            self.counters["dropped"] += sub.dropped
+
+    async def _catch_up(self, cursor, history):
+        """Everything strictly after `cursor`: ring buffer, or the DB when the buffer
+        does not reach back that far. Returns events oldest first."""
+        out = []
+        while True:
+            events, complete = self.since(cursor)
+            if not complete and history is not None:
+                events = [self.event(r) for r in await history(cursor, 500)]
+            out += events
+            if len(events) < 500:
+                return out
+            cursor = events[-1]["cursor"]
+
+    async def stream(self, sub, after=None, history=None, heartbeat=15.0):
+        """SSE chunks for one subscriber. history(cursor, limit) -> rows after the cursor
+        from the DB, oldest first (used when the ring buffer does not reach back)."""
+        def fmt(ev):
+            sub.cursor = ev["cursor"] if sub.cursor is None else \
+                max(sub.cursor, ev["cursor"], key=parse_cursor)
+            return f"id: {ev['cursor']}\nevent: {self.kind}\ndata: {json.dumps(ev)}\n\n".encode()
+
+        replayed = set()  # ids sent by the last catch-up that may also sit in the live queue
+        try:
+            yield b"retry: 3000\n\n"
+            if after:
+                sub.cursor = after
+                for ev in await self._catch_up(after, history):
+                    replayed.add(ev["id"])
+                    yield fmt(ev)
+            while True:
+                try:
+                    ev = await asyncio.wait_for(sub.queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                if sub.lagged:
+                    # Overflowed: everything queued was dropped, resume from our cursor
+                    self.counters["lag_resyncs"] += 1
+                    while not sub.queue.empty():
+                        sub.queue.get_nowait()
+                    sub.lagged = False
+                    replayed = set()
+                    if sub.cursor:
+                        for ev in await self._catch_up(sub.cursor, history):
+                            replayed.add(ev["id"])
+                            yield fmt(ev)
+                    continue
+                if ev is None or ev["id"] in replayed:
+                    continue
+                yield fmt(ev)
+        finally:
+            self.unsubscribe(sub)
+
+    def stats(self):
+        return {**self.counters, "subscribers": len(self._subs), "buffered": len(self._keys),
+                "synced_to_id": self.last_synced_id, "ready": self.ready}
@@ -1,42 +1,166 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-import uvicorn
+from fastapi.responses import JSONResponse, StreamingResponse, Response, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
 import os
+import math
+import contextlib
 import json
-import shutil
 from datetime import datetime
 from dotenv import load_dotenv
-from supabase import create_client
-from supabase import create_client
-# from deepface import DeepFace # MOVED TO INSIDE FUNCTION TO SAVE RAM
 import time
-import argparse
-import gc
+import threading
+import asyncio
 from pydantic import BaseModel
 from pathlib import Path
+from typing import List
+import sys
+
+# Backend modules are flat (Docker runs `main:app` from backend/); also allow `backend.main:app` from root
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from face_index import FaceIndex, SearchFilter
+from model_service import ModelService, ModelBusy, represented
+from embed_batcher import EmbedBatcher
+from camera_registry import CameraRegistry
+from sighting_stats import SightingStats
+from image_io import decode_image, ImageDecodeError
+from embedding_codec import unpack, format_vector, CodecError
+from live_feed import LiveFeedBus, SLIM_COLUMNS, keyset_filter, parse_cursor
+from watchlist import Watchlist, ALERT_COLUMNS
+from admission import AdmissionControl, Shed
+from lazy_service import LazyService, ServiceUnavailable
+from search_cache import SearchCache, merge_matches
+from sighting_archive import SightingArchive, Retention
+import metrics
+import numpy as np
+from timeutils import format_timestamp
 
 # Load Config
 load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-if not SUPABASE_URL:
-    raise RuntimeError("Supabase secrets missing")
+def connect_db():
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        raise ServiceUnavailable("Supabase secrets missing (SUPABASE_URL / SUPABASE_KEY)")
+    from supabase import create_client  # ~0.3 s of imports, kept off the import path
+    return create_client(SUPABASE_URL, SUPABASE_KEY)
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+# DB client built on first use (warmed in the background at startup); /ready reports when it is up
+supabase = LazyService("database", connect_db)
 
 app = FastAPI(title="Kumbh-Rakshak API", version="2.0")
 
-# @app.on_event("startup")
-# async def startup_event():
-#     print("✅ STARTUP: Loading ArcFace Model...")
-#     # Pre-warm model to catch errors early
-#     try:
-#         DeepFace.build_model("ArcFace")
-#         print("✅ STARTUP: ArcFace Model Loaded Successfully.")
-#     except Exception as e:
-#         print(f"❌ STARTUP ERROR: Could not load ArcFace. {e}")
+@app.on_event("startup")
+async def start_database():
+    supabase.start()
+
+@app.exception_handler(ServiceUnavailable)
+async def service_unavailable(request: Request, exc: ServiceUnavailable):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "10"})
+
+# Instrumentation (Prometheus text at /metrics; shared module with indexer.py)
+REQUEST_SECONDS = metrics.histogram("kumbh_request_seconds", "HTTP request latency until the response starts")
+STAGE_SECONDS = metrics.histogram("kumbh_stage_seconds", "Latency of each stage inside analyze_frame / search_face")
+VECTOR_SEARCH_SECONDS = metrics.histogram("kumbh_vector_search_seconds", "Similarity search latency by backend")
+FACES_DETECTED = metrics.counter("kumbh_faces_detected_total", "Faces detected in uploaded frames")
+FRAMES_DROPPED = metrics.counter("kumbh_frames_dropped_total", "Frames not indexed, by reason")
+DB_RETRIES = metrics.counter("kumbh_db_retries_total", "Retried DB calls")
+DB_ERRORS = metrics.counter("kumbh_db_errors_total", "Failed DB calls")
+
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    t0 = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    REQUEST_SECONDS.observe(time.perf_counter() - t0, method=request.method,
+                            route=getattr(route, "path", "unmatched"), status=response.status_code)
+    return response
+
+# In-process ANN index over sightings (DB stays the system of record; set FACE_INDEX=off to use the RPC only).
+# Loaded from disk (and trained) by its sync thread; searches use the RPC until it is ready
+face_index = FaceIndex.from_env(lazy=True) if os.getenv("FACE_INDEX", "on") != "off" else None
+
+@app.on_event("startup")
+async def start_face_index():
+    if face_index is not None:
+        face_index.start_sync(supabase, interval=float(os.getenv("FACE_INDEX_SYNC_SECONDS", "15")))
+
+# Cold archive: aged segments of `sightings` compacted into memory-mapped tracks + rollups.
+# RETENTION_HOURS=0 keeps everything in the table; run retention in one API process only,
+# the others follow its parts through a shared ARCHIVE_DIR (ARCHIVE_FOLLOW_SECONDS).
+sighting_archive = SightingArchive.from_env()
+RETENTION_HOURS = float(os.getenv("RETENTION_HOURS", "0"))
+retention = Retention(supabase, sighting_archive, hot_seconds=RETENTION_HOURS * 3600,
+                      chunk_rows=int(os.getenv("ARCHIVE_CHUNK_ROWS", "50000"))) if RETENTION_HOURS > 0 else None
+
+# Per-camera, per-time-bucket sighting counters for /stats and /stats/heatmap
+sighting_stats = SightingStats(base_bucket=int(os.getenv("STATS_BUCKET_SECONDS", "300")),
+                               sync_overlap=float(os.getenv("SYNC_OVERLAP_SECONDS", "30")))
+
+@app.on_event("startup")
+async def start_sighting_stats():
+    interval = float(os.getenv("STATS_SYNC_SECONDS", "15"))
+
+    def warm():
+        # Off the startup path: both steps wait for the DB
+        while retention is not None:
+            try:
+                retention.resume()  # a purge cut short by a restart, before the backfill counts those rows
+            except Exception as e:
+                print(f"⚠️ Retention resume failed: {e}")
+                time.sleep(interval)
+            else:
+                break
+        sighting_stats.add_rollups(sighting_archive.rollups(sighting_stats.base_bucket))
+        sighting_stats.start_sync(supabase, interval=interval)
+        # Only once the initial backfills are in: a purge racing them would hand the
+        # index ids it has not loaded yet and delete rows the stats have not counted
+        while not sighting_stats.ready or (face_index is not None and not face_index.ready):
+            time.sleep(1.0)
+        if retention is not None:
+            retention.start(interval=float(os.getenv("RETENTION_INTERVAL_SECONDS", "600")))
+        elif float(os.getenv("ARCHIVE_FOLLOW_SECONDS", "60")) > 0:
+            sighting_archive.start_follow(forget_archived, interval=float(os.getenv("ARCHIVE_FOLLOW_SECONDS", "60")))
+
+    threading.Thread(target=warm, name="sighting-stats-warm", daemon=True).start()
+
+# Resident ArcFace: loaded once, inference on a bounded pool (off the event loop).
+# One detector pass per image at DETECT_MAX_SIDE; faces under MIN_FACE_SIZE px are never embedded.
+model_service = ModelService(
+    model_name="ArcFace",
+    detector_backend=os.getenv("DETECTOR_BACKEND", "opencv"),
+    workers=int(os.getenv("MODEL_WORKERS", "1")),
+    max_pending=int(os.getenv("MODEL_MAX_PENDING", "16")),
+    detect_side=int(os.getenv("DETECT_MAX_SIDE", "640")),
+    min_face=int(os.getenv("MIN_FACE_SIZE", "40")),
+)
+
+# Cross-request micro-batching of face crops for /analyze_frame (EMBED_BATCHING=off -> batch size 1)
+embed_batcher = EmbedBatcher(
+    model_service,
+    max_batch=int(os.getenv("EMBED_BATCH_MAX", "16")),
+    max_wait_ms=float(os.getenv("EMBED_BATCH_WAIT_MS", "5")),
+) if os.getenv("EMBED_BATCHING", "on") != "off" else None
+
+# Admission for /analyze_frame: per-camera token buckets, bounded inference slots + queue
+# (one queued frame per camera, newest wins); refusals get 429 + a suggested frame interval
+admission = AdmissionControl(
+    rate=float(os.getenv("FRAME_RATE_PER_CAMERA", "2")),
+    burst=int(os.getenv("FRAME_BURST", "4")),
+    max_inflight=int(os.getenv("ADMISSION_MAX_INFLIGHT", "16")),
+    max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "32")),
+) if os.getenv("ADMISSION", "on") != "off" else None
+
+# Uploads are decoded in memory; long edge bounded during JPEG decode (0 = full resolution)
+DECODE_MAX_SIDE = int(os.getenv("DECODE_MAX_SIDE", "1280")) or None
+
+@app.on_event("startup")
+async def startup_event():
+    # MODEL_PRELOAD=1 warms ArcFace + detector in the background at boot (costs RAM up front)
+    if os.getenv("MODEL_PRELOAD", "0") == "1":
+        print("✅ STARTUP: Pre-warming ArcFace Model...")
+        model_service.preload()
 
 # CORS for React
 app.add_middleware(
@@ -47,9 +171,79 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Scrape-time views of the components' own counters
+metrics.stats_collector("kumbh_model_pending", "Inference jobs queued or running", "gauge", model_service.stats, "pending")
+metrics.stats_collector("kumbh_model_rejected_total", "Inference jobs rejected (backlog full)", "counter", model_service.stats, "rejected")
+if embed_batcher is not None:
+    metrics.stats_collector("kumbh_embed_batch_queued", "Face crops waiting for a batch", "gauge", embed_batcher.stats, "queued")
+if admission is not None:
+    metrics.stats_collector("kumbh_admission_queued", "Frames waiting for an inference slot", "gauge", admission.stats, "queued")
+    metrics.stats_collector("kumbh_admission_inflight", "Frames between decode and embed", "gauge", admission.stats, "inflight")
+if face_index is not None:
+    metrics.stats_collector("kumbh_face_index_vectors", "Vectors in the in-process index", "gauge", face_index.stats, "vectors")
+metrics.collector("kumbh_sightings_indexed", "Sightings counted by the stats aggregator", "gauge", lambda: sighting_stats.total)
+metrics.stats_collector("kumbh_archive_tracks", "Deduplicated tracks in the cold archive", "gauge", sighting_archive.stats, "tracks")
+if retention is not None:
+    metrics.stats_collector("kumbh_archived_sightings_total", "Sightings moved to the cold archive", "counter", retention.stats, "rows_archived")
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus scrape endpoint."""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/debug/profile")
+async def profile(seconds: float = 10.0):
+    """
+    Sample every thread's stack for `seconds` and return collapsed stacks
+    (flamegraph.pl / speedscope). Off unless PROFILER_ENDPOINT=on.
+    """
+    if os.getenv("PROFILER_ENDPOINT", "off") != "on":
+        raise HTTPException(status_code=404, detail="Profiler endpoint disabled (PROFILER_ENDPOINT=on)")
+    if not metrics.profiler.start():
+        raise HTTPException(status_code=409, detail="Profiler already running")
+    try:
+        await asyncio.sleep(min(max(seconds, 0.1), 120.0))
+    finally:
+        stacks = metrics.profiler.stop()
+    return PlainTextResponse(stacks)
+
+def service_states():
+    return {
+        "database": supabase.state,
+        "model": model_service.state,
+        "face_index": face_index.state if face_index is not None else "off",
+        "stats": "ready" if sighting_stats.ready else "loading",
+    }
+
 @app.api_route("/", methods=["GET", "HEAD"])
 async def health_check():
-    return {"status": "online", "model": "ArcFace (Lazy Loaded)", "time": datetime.now().isoformat()}
+    """Liveness: answers as soon as the process is up; each service reports its own state."""
+    return {
+        "status": "online",
+        "services": service_states(),
+        "database": supabase.stats(),
+        "face_index": face_index.stats() if face_index is not None else None,
+        "model": model_service.stats(),
+        "batching": embed_batcher.stats() if embed_batcher else None,
+        "admission": admission.stats() if admission else None,
+        "watchlist": watchlist.stats(),
+        "search_cache": search_cache.stats() if search_cache else None,
+        "archive": sighting_archive.stats(),
+        "retention": retention.stats() if retention else None,
+        "time": datetime.now().isoformat()
+    }
+
+@app.get("/ready")
+async def readiness():
+    """
+    Readiness: 200 once the DB client is up and the model has not failed (or, with
+    MODEL_PRELOAD=1, is loaded). A cold model or an index still loading is fine:
+    the model loads on first use and searches fall back to the RPC meanwhile.
+    """
+    states = service_states()
+    ready = states["database"] == "ready" and states["model"] != "failed" and \
+        (states["model"] == "ready" or os.getenv("MODEL_PRELOAD", "0") != "1")
+    return JSONResponse(status_code=200 if ready else 503, content={"ready": ready, "services": states})
 
 # Load Cameras
 CAMERA_CONFIG = {}
@@ -71,6 +265,56 @@ try:
 except Exception as e:
     print(f"⚠️ Warning: Failed to load cameras.json. {e}")
 
+# Node metadata + liveness in memory; heartbeats coalesced into periodic bulk upserts
+camera_registry = CameraRegistry(
+    supabase,
+    static_config=CAMERA_CONFIG,
+    ttl=float(os.getenv("CAMERA_REGISTRY_TTL", "30")),
+    flush_interval=float(os.getenv("HEARTBEAT_FLUSH_SECONDS", "5")),
+)
+
+@app.on_event("startup")
+async def start_camera_registry():
+    camera_registry.start()
+
+# Push-based sighting feed: ingestion publishes once, dashboards hold an SSE stream
+live_feed = LiveFeedBus(
+    locate=camera_registry.locate,
+    buffer=int(os.getenv("LIVE_FEED_BUFFER", "2000")),
+    max_queue=int(os.getenv("LIVE_FEED_MAX_QUEUE", "256")),
+    sync_overlap=float(os.getenv("SYNC_OVERLAP_SECONDS", "30")),
+)
+
+@app.on_event("startup")
+async def start_live_feed():
+    live_feed.start_sync(supabase, interval=float(os.getenv("LIVE_FEED_SYNC_SECONDS", "2")))
+
+# Watchlist: every ingested face is scored against the registered probes; hits become alerts
+watchlist = Watchlist(
+    supabase,
+    threshold=float(os.getenv("WATCHLIST_THRESHOLD", "0.5")),
+    cooldown=float(os.getenv("WATCHLIST_COOLDOWN_SECONDS", "60")),
+)
+# Alerts ride the same push machinery as sightings (also tails watch_alerts for indexer.py hits)
+alert_feed = LiveFeedBus(
+    locate=camera_registry.locate,
+    buffer=int(os.getenv("LIVE_FEED_BUFFER", "2000")),
+    max_queue=int(os.getenv("LIVE_FEED_MAX_QUEUE", "256")),
+    table="watch_alerts", columns=ALERT_COLUMNS, kind="alert",
+    extra=("watch_id", "label", "similarity"),
+    sync_overlap=float(os.getenv("SYNC_OVERLAP_SECONDS", "30")),
+)
+metrics.stats_collector("kumbh_watchlist_probes", "Active watchlist probes", "gauge", watchlist.stats, "probes")
+
+@app.on_event("startup")
+async def start_watchlist():
+    watchlist.start_sync(interval=float(os.getenv("WATCHLIST_SYNC_SECONDS", "10")))
+    alert_feed.start_sync(supabase, interval=float(os.getenv("LIVE_FEED_SYNC_SECONDS", "2")))
+
+def detector_for(cam_id):
+    """Per-camera detector backend ("detector" in cameras.json), else the service default."""
+    return (CAMERA_CONFIG.get(cam_id) or {}).get("detector")
+
 class CameraNode(BaseModel):
     id: str
     name: str
@@ -84,73 +328,56 @@ def health_check():
 
 @app.get("/config/cameras")
 def get_cameras():
-    """Return camera configuration from DB with Real-time Status"""
-    try:
-        # Fetch from DB
-        response = supabase.table("camera_nodes").select("*").execute()
-        nodes = response.data
-        
-        config = {}
-        for node in nodes:
-            # Check Status (Online if heartbeat within last 30s)
-            last_beat = datetime.fromisoformat(node['last_heartbeat'])
-            seconds_diff = (datetime.utcnow() - last_beat).total_seconds()
-            status = "online" if seconds_diff < 30 else "offline"
-            
-            config[node['id']] = {
-                "name": node['name'],
-                "lat": node['lat'],
-                "lon": node['lon'],
-                "status": status,
-                "last_active": node['last_heartbeat']
-            }
-        return config
-    except Exception as e:
-        print(f"DB Config Error: {e}")
-        # Fallback
-        return CAMERA_CONFIG
+    """Return camera configuration with Real-time Status (served from the registry cache)"""
+    return camera_registry.config()
 
 @app.post("/config/register_node")
 def register_node(node: CameraNode):
     """Register a new camera node location"""
     try:
-        data = {
+        camera_registry.register({
             "id": node.id,
             "name": node.name,
             "lat": node.lat,
             "lon": node.lon,
-            "status": node.status,
-            "last_heartbeat": datetime.utcnow().isoformat()
-        }
-        supabase.table("camera_nodes").upsert(data).execute()
+            "status": node.status
+        })
         return {"status": "success", "message": f"Node {node.id} Registered"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/stats/heatmap")
-def get_heatmap():
-    """Aggregate sightings to build heat map data"""
+def get_heatmap(since: str = None, until: str = None, bucket: int = None):
+    """
+    Heat map from pre-aggregated per-camera buckets.
+    since/until: ISO timestamps (UTC) or epoch seconds. Without `bucket` returns
+    [[lat, lon, intensity], ...]; with `bucket` (seconds) returns one such list per time bucket.
+    """
+    if bucket is not None and bucket <= 0:
+        raise HTTPException(status_code=400, detail="bucket must be a positive number of seconds")
     try:
-        # Get all sightings (In prod, limit relative to time window, e.g. last 24h)
-        # For demo, taking all, aggregating in python (ideal in SQL)
-        sightings_res = supabase.table("sightings").select("cam_id").execute()
-        counts = {}
-        for s in sightings_res.data:
-            cid = s['cam_id']
-            counts[cid] = counts.get(cid, 0) + 1
-            
-        # Get Node Locations
-        nodes_res = supabase.table("camera_nodes").select("*").execute()
-        heatmap_data = [] # [lat, lon, intensity]
-        
-        for node in nodes_res.data:
-            cid = node['id']
-            if cid in counts:
-                # Intensity scaling: 1 detection = 0.5 intensity, max 1.0 needed?
-                # Leaflet heat likes raw numbers, but let's send count.
-                heatmap_data.append([node['lat'], node['lon'], counts[cid] * 10]) # Multiply for visibility
-                
-        return heatmap_data
+        window = SearchFilter(since, until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    since, until = window.since, window.until
+    try:
+        cameras = camera_registry.config()
+
+        def points(counts):
+            heatmap_data = [] # [lat, lon, intensity]
+            for cid, n in counts.items():
+                node = cameras.get(cid)
+                if node:
+                    # Leaflet heat likes raw numbers, but let's send count.
+                    heatmap_data.append([node['lat'], node['lon'], n * 10]) # Multiply for visibility
+            return heatmap_data
+
+        if bucket:
+            return [
+                {"bucket_start": format_timestamp(start), "points": points(counts)}
+                for start, counts in sighting_stats.series(since, until, bucket).items()
+            ]
+        return points(sighting_stats.camera_counts(since, until))
     except Exception as e:
         print(f"Heatmap Error: {e}")
         return []
@@ -159,9 +386,11 @@ def get_heatmap():
 def get_stats():
     """Real-time system stats"""
     try:
-        # Note: 'exact' count can be slow on free tier, using estimated if needed
-        # but for now exact is fine
-        count = supabase.table("sightings").select("id", count="exact").execute().count
+        # Incremental counter once backfilled; exact count only until then
+        if sighting_stats.ready:
+            count = sighting_stats.total
+        else:
+            count = supabase.table("sightings").select("id", count="exact").execute().count
         return {
             "indexed_faces": count,
             "active_nodes": len(CAMERA_CONFIG),
@@ -171,129 +400,505 @@ def get_stats():
         return {"error": str(e)}
 
 @app.get("/feed/live")
-def get_live_feed(limit: int = 50):
-    """Get recent sightings"""
+def get_live_feed(limit: int = 50, before: str = None):
+    """
+    Recent sightings, newest first, slim (no face_vector) and enriched from the registry.
+    Page back with `before=<cursor>` (the `cursor` of the last item); /feed/stream pushes new ones.
+    """
     try:
-        res = supabase.table("sightings").select("*").order("seen_at", desc=True).limit(limit).execute()
-        
-        # Enrich with camera names
-        data = res.data
-        for item in data:
-            cam_id = item.get("cam_id")
-            if cam_id in CAMERA_CONFIG:
-                item["cam_name"] = CAMERA_CONFIG[cam_id]["name"]
-                item["location"] = {"lat": CAMERA_CONFIG[cam_id]["lat"], "lon": CAMERA_CONFIG[cam_id]["lon"]}
-            else:
-                item["cam_name"] = cam_id
-                
-        return data
+        query = supabase.table("sightings").select(SLIM_COLUMNS)
+        if before:
+            query = query.or_(keyset_filter(before, "lt"))
+        res = query.order("seen_at", desc=True).order("id", desc=True).limit(limit).execute()
+        return [live_feed.event(row) for row in res.data]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/search/biometric")
-async def search_face(file: UploadFile = File(...)):
-    """The Core AI Search Function"""
+async def feed_rows_after(cursor, limit):
+    """Keyset catch-up from the DB, oldest first (for streams that fell behind the ring buffer)."""
+    def query():
+        return supabase.table("sightings").select(SLIM_COLUMNS) \
+            .or_(keyset_filter(cursor, "gt")) \
+            .order("seen_at").order("id").limit(limit).execute().data
+    return await run_in_threadpool(query)
+
+@app.get("/feed/stream")
+async def stream_live_feed(request: Request, after: str = None):
+    """
+    Server-Sent Events: `sighting` events as they are ingested. Resumes after
+    `after=<cursor>` or the browser's Last-Event-ID, replaying what was missed first.
+    """
+    after = after or request.headers.get("last-event-id")
+    if after:
+        try:
+            parse_cursor(after)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    sub = live_feed.subscribe()
+    return StreamingResponse(
+        live_feed.stream(sub, after=after, history=feed_rows_after),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def raise_alerts(alerts):
+    """Persist watchlist hits to watch_alerts and push them on /watchlist/alerts/stream.
+    Returns them enriched with the camera name (and node GPS when the sighting has none)."""
+    if not alerts:
+        return []
+    rows = [Watchlist.alert_row(a) for a in alerts]
+    try:
+        res = await run_in_threadpool(lambda: supabase.table("watch_alerts").insert(rows).execute())
+        for alert, row, inserted in zip(alerts, rows, res.data):
+            alert["id"] = inserted["id"]
+            alert_feed.publish({**row, "id": inserted["id"]})
+    except Exception as e:
+        # Still reported to the caller; only the push/history is lost
+        print(f"⚠️ Alert insert failed: {e}")
+        DB_ERRORS.inc(op="alert_insert")
+    enriched = []
+    for alert in alerts:
+        name, lat, lon = camera_registry.locate(alert["cam_id"], alert["lat"], alert["lon"])
+        print(f"🚨 WATCHLIST HIT | {alert['label']} | {name} | GPS: {lat},{lon} | {alert['similarity']:.2f}")
+        enriched.append({**alert, "cam_name": name, "lat": lat, "lon": lon})
+    return enriched
+
+@app.post("/watchlist")
+async def add_to_watchlist(
+    files: List[UploadFile] = File(...),
+    label: str = Form(...),
+    threshold: float = Form(None),
+    notes: str = Form(None)
+):
+    """
+    Register a person: one probe per photo (the largest face in it). From now on every
+    ingested face is checked against them and hits are pushed as alerts.
+    """
+    if threshold is not None and not 0.0 < threshold < 1.0:
+        raise HTTPException(status_code=400, detail="threshold must be in (0, 1)")
+    if len(files) > MAX_PROBES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_PROBES} images per person")
+    try:
+        crops = []
+        for f in files:
+            try:
+                image = await run_in_threadpool(decode_image, await f.read(), DECODE_MAX_SIDE)
+                faces, _ = await model_service.run(model_service.detect_faces, image, enforce_detection=True,
+                                                   min_face=0, lane="search")
+            except (ImageDecodeError, ValueError) as e:
+                raise HTTPException(status_code=422, detail=f"{f.filename}: {e}")
+            largest = max(faces, key=lambda face: face["facial_area"]["w"] * face["facial_area"]["h"])
+            crops.append(largest["face"])
+        # One batch of its own in the search lane; the frame batcher's queue would put it behind ingest
+        embeddings, _ = await model_service.run(model_service.embed_batch, crops, lane="search")
+        entries = await run_in_threadpool(watchlist.add, label, embeddings, threshold, notes)
+        return {"status": "success", "entries": entries}
+    except HTTPException:
+        raise
+    except ModelBusy as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Watchlist update failed: {str(e)}")
+
+@app.post("/watchlist/vectors")
+async def add_vectors_to_watchlist(request: Request):
+    """
+    Register precomputed probes in the packed embedding format (embedding_codec).
+    Metadata per vector: {"label", "threshold" (optional), "notes" (optional)}.
+    """
+    try:
+        vectors, meta = unpack(await request.body())
+    except CodecError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if meta is None or any(not m.get("label") for m in meta):
+        raise HTTPException(status_code=400, detail="Every probe needs a label in its metadata")
     try:
-        # Save temp file
-        file_location = f"temp_{file.filename}"
-        with open(file_location, "wb+") as file_object:
-            file_object.write(file.file.read())
+        entries = []
+        for v, m in zip(vectors, meta):
+            entries += await run_in_threadpool(watchlist.add, m["label"], [v], m.get("threshold"), m.get("notes"))
+        return {"status": "success", "entries": entries}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Watchlist update failed: {str(e)}")
+
+@app.get("/watchlist")
+def get_watchlist():
+    return {"entries": watchlist.entries(), "stats": watchlist.stats()}
+
+@app.delete("/watchlist/{entry_id}")
+def remove_from_watchlist(entry_id: int):
+    try:
+        removed = watchlist.remove(entry_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Watchlist update failed: {str(e)}")
+    if not removed:
+        raise HTTPException(status_code=404, detail=f"No active watchlist entry {entry_id}")
+    return {"status": "success", "removed": entry_id}
 
-        # 1. Detect & Embed
+@app.get("/watchlist/alerts")
+def get_alerts(limit: int = 50, before: str = None):
+    """Alert history, newest first; page back with `before=<cursor>` like /feed/live."""
+    try:
+        query = supabase.table("watch_alerts").select(ALERT_COLUMNS)
+        if before:
+            query = query.or_(keyset_filter(before, "lt"))
+        res = query.order("seen_at", desc=True).order("id", desc=True).limit(limit).execute()
+        return [alert_feed.event(row) for row in res.data]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def alert_rows_after(cursor, limit):
+    def query():
+        return supabase.table("watch_alerts").select(ALERT_COLUMNS) \
+            .or_(keyset_filter(cursor, "gt")) \
+            .order("seen_at").order("id").limit(limit).execute().data
+    return await run_in_threadpool(query)
+
+@app.get("/watchlist/alerts/stream")
+async def stream_alerts(request: Request, after: str = None):
+    """Server-Sent Events: `alert` events from this API and from edge indexers; resumable like /feed/stream."""
+    after = after or request.headers.get("last-event-id")
+    if after:
         try:
-             print("🧠 Waking up AI Brain...")
-             from deepface import DeepFace # LAZY IMPORT
-             
-             embedding_objs = DeepFace.represent(
-                img_path=file_location,
-                model_name="ArcFace",
-                detector_backend="opencv",
-                enforce_detection=True,
-                normalization="base"
-            )
-             # Free up memory immediately after inference
-             gc.collect()
-        except ValueError:
-             # Try without strict detection if failed
-             from deepface import DeepFace
-             embedding_objs = DeepFace.represent(
-                img_path=file_location,
-                model_name="ArcFace",
-                enforce_detection=False,
-                normalization="base"
-            )
-             gc.collect()
+            parse_cursor(after)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    sub = alert_feed.subscribe()
+    return StreamingResponse(
+        alert_feed.stream(sub, after=after, history=alert_rows_after),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+MAX_TOP_K = int(os.getenv("SEARCH_MAX_TOP_K", "500"))
+
+# Repeat searches: upload hash -> embedding, query -> top-k + gallery watermark (SEARCH_CACHE=off disables)
+search_cache = SearchCache(
+    max_embeddings=int(os.getenv("SEARCH_CACHE_EMBEDDINGS", "512")),
+    max_results=int(os.getenv("SEARCH_CACHE_RESULTS", "256")),
+) if os.getenv("SEARCH_CACHE", "on") != "off" else None
+
+if search_cache is not None:
+    metrics.collector("kumbh_search_cache_hits_total", "Search cache hits", "counter", lambda: [
+        ({"cache": c}, search_cache.counters[f"{c}_hits"]) for c in ("embedding", "result")])
+    metrics.collector("kumbh_search_cache_misses_total", "Search cache misses", "counter", lambda: [
+        ({"cache": c}, search_cache.counters[f"{c}_misses"]) for c in ("embedding", "result")])
+    metrics.collector("kumbh_search_cache_saved_seconds_total", "Latency saved by search cache hits", "counter",
+                      lambda: search_cache.counters["saved_s"])
+
+@app.get("/search/cache")
+def get_search_cache():
+    return search_cache.stats() if search_cache else {"enabled": False}
+
+def forget_archived(ids):
+    """Sightings moved to the archive leave the index; cached top-k lists may still hold them."""
+    if face_index is not None:
+        print(f"🗄️ Face Index evicted {face_index.evict(ids)} archived sightings")
+    if search_cache is not None:
+        search_cache.forget(ids)
+
+if retention is not None:
+    retention.listeners.append(forget_archived)
+
+def search_params(threshold, top_k, since=None, until=None, cams=None, bbox=None):
+    """Validate search knobs from a request -> SearchFilter (400 on bad input)."""
+    if not 0.0 <= threshold < 1.0:
+        raise HTTPException(status_code=400, detail="threshold must be in [0, 1)")
+    if not 1 <= top_k <= MAX_TOP_K:
+        raise HTTPException(status_code=400, detail=f"top_k must be in [1, {MAX_TOP_K}]")
+    try:
+        return SearchFilter.parse(since, until, cams, bbox)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def find_matches(embedding, match_threshold=0.45, match_count=50, where=None, after=None):
+    """
+    Vector Search over hot sightings (hot_matches), plus the archived tracks when
+    the search window reaches back into the cold archive. `where` (SearchFilter)
+    limits the search to a time window / cameras / GPS box. `after` (RPC only)
+    restricts the scan to sightings with a larger id (archive not rescanned).
+    """
+    matches = hot_matches(embedding, match_threshold, match_count, where, after)
+    if not after and sighting_archive.reaches(where):
+        with VECTOR_SEARCH_SECONDS.time(backend="archive"):
+            archived = sighting_archive.search(embedding, match_threshold, match_count, where)
+        matches = merge_matches(matches, archived, match_count)
+    return matches
 
-        # Ensure embedding is a standard list of floats (Crucial for JSON serialization)
-        embedding = [float(x) for x in embedding_objs[0]["embedding"]]
+def hot_matches(embedding, match_threshold=0.45, match_count=50, where=None, after=None):
+    """In-process ANN index once synced, else the match_faces RPC."""
+    # ArcFace Cosine Similarity Threshold: > 0.40 is VERY strict.
+    if face_index is not None and face_index.ready:
+        with VECTOR_SEARCH_SECONDS.time(backend="index"):
+            return face_index.search(embedding, match_threshold=match_threshold, match_count=match_count,
+                                     where=where)
 
-        # 2. Vector Search (RPC) -- With Retry Logic for Stability
-        # ArcFace Cosine Similarity Threshold: > 0.40 is VERY strict.
-        response = None
+    # RPC path -- With Retry Logic for Stability
+    response = None
+    rpc, params = "match_faces", {}
+    if where or after is not None:
+        rpc, params = "match_faces_filtered", (where or SearchFilter()).rpc_params()
+        if after is not None:
+            params["after_id"] = after
+    with VECTOR_SEARCH_SECONDS.time(backend="rpc"):
         for attempt in range(3):
             try:
-                response = supabase.rpc("match_faces", {
-                    "query_embedding": embedding,
-                    "match_threshold": 0.45, # Lowered for better recall
-                    "match_count": 50
+                response = supabase.rpc(rpc, {
+                    "query_embedding": format_vector(embedding), # compact pgvector text, not a float list
+                    "match_threshold": match_threshold, # Lowered for better recall
+                    "match_count": match_count,
+                    **params
                 }).execute()
                 break # Success
             except Exception as rpc_error:
                 print(f"⚠️ RPC Attempt {attempt+1} failed: {rpc_error}")
+                DB_ERRORS.inc(op="match_faces")
                 if attempt == 2:
                     raise rpc_error
+                DB_RETRIES.inc(op="match_faces")
                 time.sleep(0.5)
-        
-        matches = response.data
-        
-        # 3. Enrich Data for Frontend (Using DB for Real Locations)
-        # Fetch all active nodes to get their latest Lat/Lon
-        try:
-            node_res = supabase.table("camera_nodes").select("*").execute()
-            node_map = {n['id']: n for n in node_res.data}
-        except:
-            node_map = {}
+    return response.data
+
+def cached_matches(embedding, match_threshold=0.45, match_count=50, where=None):
+    """find_matches through the result cache: a repeat query reuses its top-k and only
+    scans sightings added since (index rows past the cached count / ids past the watermark)."""
+    if search_cache is None:
+        return find_matches(embedding, match_threshold, match_count, where)
+    key = SearchCache.result_key(embedding, match_threshold, match_count, where)
+    # Index row numbers shift when archived rows are evicted: entries are per index generation
+    backend = f"index:{face_index.generation}" if face_index is not None and face_index.ready else "rpc"
+    entry = search_cache.get_results(key, backend)
+    t0 = time.perf_counter()
+    if entry is not None and backend != "rpc":
+        found = face_index.search_since(embedding, entry["watermark"], match_threshold, match_count, where)
+        if found is not None:
+            fresh, watermark = found
+            return search_cache.refresh(key, entry, fresh, watermark, match_count, time.perf_counter() - t0,
+                                        scanned=watermark - entry["watermark"])
+        search_cache.stale(key)
+    elif entry is not None:
+        # Watermark = the stats tail's stable id (every row at or below it has committed), read
+        # before the scan; it never moves past rows that commit out of id order. Rows seen twice merge
+        watermark = sighting_stats.last_synced_id
+        fresh = find_matches(embedding, match_threshold, match_count, where, after=entry["watermark"])
+        return search_cache.refresh(key, entry, fresh, watermark, match_count, time.perf_counter() - t0)
+
+    # Miss: full search; the watermark is read first so nothing added meanwhile is skipped later
+    watermark = len(face_index) if backend != "rpc" else sighting_stats.last_synced_id
+    matches = find_matches(embedding, match_threshold, match_count, where, after=None if backend != "rpc" else 0)
+    search_cache.put_results(key, matches, watermark, backend, time.perf_counter() - t0)
+    return matches
 
-        enriched_matches = []
+MAX_PROBES = int(os.getenv("SEARCH_MAX_PROBES", "16"))
+
+def batch_matches(embeddings, match_threshold=0.45, match_count=50, where=None, fuse=None):
+    """
+    Several probes of one person -> (per-probe matches, fused matches or None).
+    Index: one rows x probes matmul (+ the archive's, when the window reaches it).
+    RPC fallback: one call per probe, fused here.
+    """
+    if face_index is not None and face_index.ready:
+        with VECTOR_SEARCH_SECONDS.time(backend="index_batch"):
+            per_probe, fused = face_index.search_batch(embeddings, match_threshold, match_count,
+                                                       where=where, fuse=fuse)
+        if sighting_archive.reaches(where):
+            with VECTOR_SEARCH_SECONDS.time(backend="archive"):
+                cold, cold_fused = sighting_archive.search_batch(embeddings, match_threshold, match_count,
+                                                                 where, fuse)
+            per_probe = [merge_matches(hot, c, match_count) for hot, c in zip(per_probe, cold)]
+            if fused is not None:
+                fused = merge_matches(fused, cold_fused, match_count)
+        return per_probe, fused
+
+    per_probe = [find_matches(e, match_threshold, match_count, where) for e in embeddings]
+    if not fuse:
+        return per_probe, None
+    # The RPC returns no scores for sightings below threshold: those count as 0 for "mean"
+    merged = {}
+    for matches in per_probe:
         for m in matches:
-            cam_id = m['cam_id']
-            
-            # Use Sighting Location (Primary) -> DB Node (Secondary) -> Config (Tertiary)
-            db_node = node_map.get(cam_id, {})
-            static_node = CAMERA_CONFIG.get(cam_id, {})
-            
-            final_name = db_node.get("name") or static_node.get("name") or cam_id
-            
-            # Prioritize the location WHERE IT WAS SEEN specific to that moment
-            sighting_lat = m.get('lat', 0.0)
-            sighting_lon = m.get('lon', 0.0)
-            
-            # If sighting has valid GPS (not 0), use it. Else fallback to node location.
-            if sighting_lat != 0.0 and sighting_lon != 0.0:
-                final_lat = sighting_lat
-                final_lon = sighting_lon
-            else:
-                final_lat = db_node.get("lat") or static_node.get("lat") or 0.0
-                final_lon = db_node.get("lon") or static_node.get("lon") or 0.0
-            
-            enriched_matches.append({
-                **m,
-                "cam_name": final_name,
-                "lat": final_lat,
-                "lon": final_lon,
-                "similarity_score": round(m['similarity'] * 100, 1)
-            })
-
-        # Cleanup
-        os.remove(file_location)
+            key = m.get("id") or (m["cam_id"], m["seen_at"], m.get("lat"), m.get("lon"))
+            merged.setdefault(key, (m, []))[1].append(m["similarity"])
+    fused = []
+    for m, sims in merged.values():
+        score = max(sims) if fuse == "max" else sum(sims) / len(embeddings)
+        if score > match_threshold:
+            fused.append({**m, "similarity": score, "probe_hits": len(sims)})
+    fused.sort(key=lambda m: -m["similarity"])
+    return per_probe, fused[:match_count]
+
+def enrich_matches(matches):
+    """Registry cache: sighting GPS first, else node location."""
+    enriched_matches = []
+    for m in matches:
+        final_name, final_lat, final_lon = camera_registry.locate(
+            m['cam_id'], m.get('lat', 0.0), m.get('lon', 0.0)
+        )
         
-        return {"count": len(enriched_matches), "matches": enriched_matches}
+        enriched_matches.append({
+            **m,
+            "cam_name": final_name,
+            "lat": final_lat,
+            "lon": final_lon,
+            "similarity_score": round(m['similarity'] * 100, 1)
+        })
+    return enriched_matches
+
+@app.post("/search/biometric")
+async def search_face(
+    file: UploadFile = File(...),
+    threshold: float = Form(0.45),
+    top_k: int = Form(50),
+    since: str = Form(None),
+    until: str = Form(None),
+    cams: str = Form(None),
+    bbox: str = Form(None)
+):
+    """
+    The Core AI Search Function.
+    Optional narrowing: since/until (ISO or epoch), cams ("Gate_1,Ghat_3") and/or
+    bbox ("min_lat,min_lon,max_lat,max_lon"); threshold and top_k tune the cut-off.
+    """
+    where = search_params(threshold, top_k, since, until, cams, bbox)
+    try:
+        # Decode upload in memory (no temp file)
+        with STAGE_SECONDS.time(route="search_face", stage="upload"):
+            contents = await file.read()
+
+        # Same photo uploaded again: reuse its embedding (no decode, detection or ArcFace)
+        image_key = SearchCache.image_key(contents, max_side=DECODE_MAX_SIDE, detector=model_service.detector_backend)
+        cached = search_cache.get_embedding(image_key) if search_cache else None
+        if cached is not None:
+            embedding, timing = cached["embedding"], {"embedding_cache": "hit"}
+        else:
+            t0 = time.perf_counter()
+            with STAGE_SECONDS.time(route="search_face", stage="decode"):
+                image = await run_in_threadpool(decode_image, contents, DECODE_MAX_SIDE)
+
+            # 1. Detect & Embed (resident model, off the event loop). One detector pass:
+            # no face -> the whole photo is the probe; any face size counts in a search photo
+            with STAGE_SECONDS.time(route="search_face", stage="detect_embed"):
+                embedding_objs, timing = await model_service.represent_async(
+                    image,
+                    enforce_detection=False,
+                    min_face=0,
+                    lane="search"
+                )
+            print(f"🧠 Search embed | queue: {timing['queue_ms']}ms | inference: {timing['inference_ms']}ms")
+
+            embedding = np.asarray(embedding_objs[0]["embedding"], dtype=np.float32)
+            if search_cache is not None:
+                search_cache.put_embedding(image_key, embedding, embedding_objs[0]["facial_area"],
+                                           time.perf_counter() - t0)
+
+        # 2. Vector Search (cached top-k + only what arrived since) + 3. Enrich Data for Frontend
+        with STAGE_SECONDS.time(route="search_face", stage="search"):
+            matches = await run_in_threadpool(cached_matches, embedding, threshold, top_k, where)
+        with STAGE_SECONDS.time(route="search_face", stage="enrich"):
+            enriched_matches = enrich_matches(matches)
+
+        return {"count": len(enriched_matches), "matches": enriched_matches, "timing": timing}
 
+    except ImageDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ModelBusy as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
-        if os.path.exists(f"temp_{file.filename}"):
-            os.remove(f"temp_{file.filename}")
         raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
 
+@app.post("/search/batch")
+async def search_face_batch(
+    files: List[UploadFile] = File(...),
+    threshold: float = Form(0.45),
+    top_k: int = Form(50),
+    fuse: str = Form("max"),
+    since: str = Form(None),
+    until: str = Form(None),
+    cams: str = Form(None),
+    bbox: str = Form(None)
+):
+    """
+    Multi-probe search: several photos of one person (or a group photo). Every detected
+    face is a probe; all probes are embedded in one batch and scored against the gallery
+    in one pass. Returns per-probe matches and, with fuse=max|mean (none to skip), one
+    list ranked by the best / average similarity over all probes.
+    """
+    where = search_params(threshold, top_k, since, until, cams, bbox)
+    if fuse not in ("none", "max", "mean"):
+        raise HTTPException(status_code=400, detail="fuse must be none, max or mean")
+    if len(files) > MAX_PROBES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_PROBES} images per batch")
+    timing = {}
+    try:
+        t0 = time.perf_counter()
+        images = []
+        for f in files:
+            contents = await f.read()
+            try:
+                images.append(await run_in_threadpool(decode_image, contents, DECODE_MAX_SIDE))
+            except ImageDecodeError as e:
+                raise HTTPException(status_code=400, detail=f"{f.filename}: {e}")
+        timing["decode_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+
+        # Detect per image (no face -> whole image, like /search/biometric), embed all crops together
+        t0 = time.perf_counter()
+        probes, crops = [], []
+        for i, image in enumerate(images):
+            faces, _ = await model_service.run(model_service.detect_faces, image, enforce_detection=False,
+                                               min_face=0, lane="search")
+            for face in faces:
+                probes.append({"image": i, "facial_area": face["facial_area"]})
+                crops.append(face["face"])
+        probes, crops = probes[:MAX_PROBES], crops[:MAX_PROBES]
+        if not crops:
+            raise HTTPException(status_code=422, detail="No faces found in the uploaded images")
+        # One batch of its own in the search lane; the frame batcher's queue would put it behind ingest
+        embeddings, _ = await model_service.run(model_service.embed_batch, crops, lane="search")
+        timing["embed_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+
+        t0 = time.perf_counter()
+        per_probe, fused = await run_in_threadpool(
+            batch_matches, embeddings, threshold, top_k, where, None if fuse == "none" else fuse
+        )
+        timing["search_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        for probe, matches in zip(probes, per_probe):
+            probe["matches"] = enrich_matches(matches)
+            probe["count"] = len(matches)
+        return {
+            "probes": probes,
+            "fused": enrich_matches(fused) if fused is not None else None,
+            "timing": timing
+        }
+    except HTTPException:
+        raise
+    except ModelBusy as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Batch search failed: {str(e)}")
+
+def index_sighting(inserted_rows, data):
+    """Add a freshly inserted sighting to the stats + ANN index (the periodic syncs catch anything missed).
+    Call off the event loop: the index add can wait on the sync thread's lock."""
+    if not inserted_rows:
+        return
+    try:
+        sighting_stats.record(inserted_rows[0]["id"], data["cam_id"], data["seen_at"])
+        live_feed.publish({**data, "id": inserted_rows[0]["id"]})
+    except Exception as e:
+        print(f"⚠️ Stats / live feed update failed: {e}")
+    if face_index is None or not face_index.ready:
+        return  # still loading: its backfill picks the row up
+    try:
+        face_index.add(
+            inserted_rows[0]["id"], data["face_vector"], data["cam_id"],
+            seen_at=data["seen_at"], lat=data.get("lat", 0.0), lon=data.get("lon", 0.0)
+        )
+    except Exception as e:
+        print(f"⚠️ Face Index update failed: {e}")
+
 @app.post("/analyze_frame")
 async def analyze_frame(
     file: UploadFile = File(...), 
@@ -306,51 +911,74 @@ async def analyze_frame(
     and logs sightings if a known face is found.
     Acts as a server-side version of indexer.py.
     """
-    temp_filename = f"frame_{int(time.time())}_{cam_id}.jpg"
     matches_found = []
     try:
-        # 1. Save Frame
-        with open(temp_filename, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        file_size = os.path.getsize(temp_filename)
-        print(f"📥 Received Frame: {cam_id} | Size: {file_size} bytes")
+        # 0. Admission: refused before decode; a slot is held through decode -> detect -> embed
+        async with admission.slot(cam_id) if admission else contextlib.nullcontext():
+            # 1. Decode Frame (in memory, no temp file)
+            with STAGE_SECONDS.time(route="analyze_frame", stage="upload"):
+                contents = await file.read()
+            print(f"📥 Received Frame: {cam_id} | Size: {len(contents)} bytes")
+            try:
+                with STAGE_SECONDS.time(route="analyze_frame", stage="decode"):
+                    frame = await run_in_threadpool(decode_image, contents, DECODE_MAX_SIDE)
+            except ImageDecodeError as de:
+                print(f"❌ Bad Frame from {cam_id}: {de}")
+                FRAMES_DROPPED.inc(reason="bad_image")
+                return {"status": "error", "message": str(de)}
 
-        # 2. Register/Update Node Status (Heartbeat)
-        try:
-             supabase.table("camera_nodes").upsert({
-                 "id": cam_id,
-                 "name": f"Mobile Node: {cam_id}",
-                 "lat": lat,
-                 "lon": lon,
-                 "status": "online",
-                 "last_heartbeat": datetime.utcnow().isoformat()
-             }).execute()
-        except Exception as db_err:
-             print(f"Node Update Error: {db_err}")
-
-        # 3. Detect & Embed (ArcFace)
-        try:
-            print(f"📷 Indexing Frame from {cam_id}...")
-            from deepface import DeepFace # LAZY IMPORT
-            embedding_objs = DeepFace.represent(
-                img_path=temp_filename,
-                model_name="ArcFace",
-                detector_backend="opencv", # Try 'ssd' or 'mtcnn' if this fails
-                enforce_detection=True
-            )
-            gc.collect()
-        except ValueError as ve:
-            print(f"❌ DeepFace: No Face detected in frame. ({ve})")
-            if os.path.exists(temp_filename): os.remove(temp_filename)
-            return {"status": "no_face", "faces_detected": 0}
-        except Exception as e:
-            print(f"❌ Detector Error: {e}")
-            # Fallback for lazy import failure or other issues
-            if os.path.exists(temp_filename): os.remove(temp_filename)
-            return {"status": "error", "faces_detected": 0}
+            # 2. Register/Update Node Status (Heartbeat, coalesced by the registry)
+            with STAGE_SECONDS.time(route="analyze_frame", stage="heartbeat"):
+                camera_registry.heartbeat(cam_id, lat, lon)
 
-        # 4. STORE EVERY FACE (The "Indexing" Step)
+            # 3. Detect & Embed (ArcFace, resident model, off the event loop)
+            try:
+                print(f"📷 Indexing Frame from {cam_id}...")
+                if embed_batcher is not None:
+                    # Detect per request, embed crops in one batch shared with concurrent requests
+                    with STAGE_SECONDS.time(route="analyze_frame", stage="detect"):
+                        faces, detect_timing = await model_service.run(
+                            model_service.detect_faces, frame,
+                            detector_backend=detector_for(cam_id),
+                            enforce_detection=True
+                        )
+                    with STAGE_SECONDS.time(route="analyze_frame", stage="embed"):
+                        embeddings, embed_timing = await embed_batcher.embed([f["face"] for f in faces])
+                    embedding_objs = represented(faces, embeddings)
+                    timing = {"detect": detect_timing, "embed": embed_timing}
+                else:
+                    with STAGE_SECONDS.time(route="analyze_frame", stage="detect_embed"):
+                        embedding_objs, timing = await model_service.represent_async(
+                            frame,
+                            detector_backend=detector_for(cam_id),
+                            enforce_detection=True
+                        )
+            except ValueError as ve:
+                print(f"❌ DeepFace: No Face detected in frame. ({ve})")
+                FRAMES_DROPPED.inc(reason="no_face")
+                return {"status": "no_face", "faces_detected": 0}
+            except ModelBusy as busy:
+                print(f"⏳ {busy}")
+                FRAMES_DROPPED.inc(reason="busy")
+                return {"status": "busy", "faces_detected": 0}
+            except Exception as e:
+                print(f"❌ Detector Error: {e}")
+                FRAMES_DROPPED.inc(reason="detector_error")
+                # Fallback for model load failure or other issues
+                return {"status": "error", "faces_detected": 0}
+
+        FACES_DETECTED.inc(len(embedding_objs))
+        seen_at = datetime.utcnow().isoformat()
+
+        # 4. WATCHLIST: all faces of the frame scored against every probe in one product
+        if watchlist.size:
+            with STAGE_SECONDS.time(route="analyze_frame", stage="watchlist"):
+                alerts = watchlist.check([obj["embedding"] for obj in embedding_objs],
+                                         {"cam_id": cam_id, "seen_at": seen_at, "lat": lat, "lon": lon})
+            for alert in await raise_alerts(alerts):
+                matches_found.append({**alert, "facial_area": embedding_objs[alert["face"]]["facial_area"]})
+
+        # 5. STORE EVERY FACE (The "Indexing" Step)
         saved_count = 0
         for obj in embedding_objs:
             embedding = obj["embedding"]
@@ -359,46 +987,137 @@ async def analyze_frame(
             # This turns the camera into a "Data Collector"
             data = {
                 "cam_id": cam_id,
-                "face_vector": embedding, 
+                "face_vector": format_vector(embedding), # compact pgvector text (~4x smaller than a float list)
                 # cam_name removed (stored in camera_nodes)
-                "seen_at": datetime.utcnow().isoformat(),
+                "seen_at": seen_at,
                 "lat": lat,
                 "lon": lon
             }
+            # Only a failed insert falls back: once a row is stored it is never inserted again
+            res = None
             try:
                 # Primary Attempt: With Geotags
-                supabase.table("sightings").insert(data).execute()
-                saved_count += 1
+                with STAGE_SECONDS.time(route="analyze_frame", stage="db_insert"):
+                    res = await run_in_threadpool(lambda: supabase.table("sightings").insert(data).execute())
                 print(f"✅ STORED FACE | Cam: {cam_id} | GPS: {lat},{lon}")
             except Exception as e_primary:
                 print(f"⚠️ Primary Insert Failed (Geotag Issue?): {e_primary}")
+                DB_ERRORS.inc(op="insert")
+                DB_RETRIES.inc(op="insert")
                 try:
                     # Fallback Attempt: Legacy (No Geotags)
                     del data["lat"]
                     del data["lon"]
-                    supabase.table("sightings").insert(data).execute()
-                    saved_count += 1
+                    res = await run_in_threadpool(lambda: supabase.table("sightings").insert(data).execute())
                     print("✅ Recovered: Inserted without Geotags.")
                 except Exception as e_secondary:
                      print(f"❌ Indexing COMPLETELY Failed: {e_secondary}")
+                     DB_ERRORS.inc(op="insert")
+            if res is not None:
+                saved_count += 1
+                # Logs its own failures; the periodic syncs pick up anything it missed
+                with STAGE_SECONDS.time(route="analyze_frame", stage="index"):
+                    await run_in_threadpool(index_sighting, res.data, data)
 
         print(f"✅ Indexed {saved_count} faces from {cam_id}")
 
-        # Cleanup
-        os.remove(temp_filename)
-        
         return {
             "status": "processed", 
             "faces_detected": len(embedding_objs),
-            "matches": matches_found
+            "matches": matches_found,
+            "timing": timing,
+            "frame_interval_ms": round(admission.frame_interval() * 1000) if admission else None
         }
 
+    except Shed as shed:
+        # 429 with when to retry and the pace this camera should settle at under current load
+        FRAMES_DROPPED.inc(reason=shed.reason)
+        return JSONResponse(
+            status_code=429,
+            headers={"Retry-After": str(math.ceil(shed.retry_after))},
+            content={"status": shed.reason, "faces_detected": 0,
+                     "retry_after_ms": round(shed.retry_after * 1000),
+                     "frame_interval_ms": round(shed.frame_interval * 1000)}
+        )
     except Exception as e:
-        if os.path.exists(temp_filename):
-            os.remove(temp_filename)
         # Don't error out the client loop, just report failure
         print(f"Analyze Error: {e}")
         return {"status": "error", "message": str(e)}
 
+@app.post("/search/vector")
+async def search_vector(request: Request, threshold: float = 0.45, top_k: int = 50, since: str = None,
+                        until: str = None, cams: str = None, bbox: str = None, fuse: str = "max"):
+    """
+    Search with precomputed embeddings (no upload decode, no ArcFace pass).
+    Body: vectors in the packed embedding format (embedding_codec, any codec).
+    Same filters as /search/biometric, as query parameters. One vector -> {count, matches};
+    several -> one batched pass like /search/batch: {probes, fused} (fuse=max|mean|none).
+    """
+    where = search_params(threshold, top_k, since, until, cams, bbox)
+    if fuse not in ("none", "max", "mean"):
+        raise HTTPException(status_code=400, detail="fuse must be none, max or mean")
+    try:
+        vectors, _ = unpack(await request.body())
+    except CodecError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not 1 <= len(vectors) <= MAX_PROBES:
+        raise HTTPException(status_code=400, detail=f"Expected 1-{MAX_PROBES} query vectors, got {len(vectors)}")
+    try:
+        if len(vectors) > 1:
+            per_probe, fused = await run_in_threadpool(
+                batch_matches, vectors, threshold, top_k, where, None if fuse == "none" else fuse
+            )
+            return {
+                "probes": [{"count": len(m), "matches": enrich_matches(m)} for m in per_probe],
+                "fused": enrich_matches(fused) if fused is not None else None,
+            }
+        matches = enrich_matches(await run_in_threadpool(cached_matches, vectors[0], threshold, top_k, where))
+        return {"count": len(matches), "matches": matches}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
+
+@app.post("/sightings/bulk")
+async def bulk_insert_sightings(request: Request):
+    """
+    Bulk sighting ingest in the packed embedding format (embedding_codec).
+    Metadata per vector: {"cam_id", "seen_at" (optional, default now), "lat", "lon"}.
+    One DB insert for the whole batch; rows are indexed straight from the decoded vectors.
+    """
+    try:
+        vectors, meta = unpack(await request.body())
+    except CodecError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if meta is None:
+        raise HTTPException(status_code=400, detail="Packed sightings need per-row metadata")
+
+    now = datetime.utcnow().isoformat()
+    rows = [{
+        "cam_id": m.get("cam_id") or "UNKNOWN",
+        "seen_at": m.get("seen_at") or now,
+        "lat": m.get("lat", 0.0),
+        "lon": m.get("lon", 0.0),
+        "face_vector": format_vector(v),
+    } for v, m in zip(vectors, meta)]
+    try:
+        with STAGE_SECONDS.time(route="bulk_insert", stage="db_insert"):
+            res = await run_in_threadpool(lambda: supabase.table("sightings").insert(rows).execute())
+    except Exception as e:
+        DB_ERRORS.inc(op="bulk_insert")
+        raise HTTPException(status_code=502, detail=f"Insert failed: {str(e)}")
+
+    # Stats + ANN index (the periodic syncs catch anything missed)
+    indexed = [{**row, "id": r["id"], "face_vector": v} for r, row, v in zip(res.data, rows, vectors)]
+    for row in indexed:
+        sighting_stats.record(row["id"], row["cam_id"], row["seen_at"])
+        live_feed.publish(row)
+    if face_index is not None and face_index.ready:
+        try:
+            await run_in_threadpool(face_index.add_batch, indexed)
+        except Exception as e:
+            print(f"⚠️ Face Index update failed: {e}")
+    alerts = await raise_alerts(watchlist.check(vectors, rows)) if watchlist.size else []
+    return {"status": "success", "inserted": len(res.data), "alerts": alerts}
+
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,318 @@
+"""
+Resident ArcFace model service.
+
+DeepFace (and TensorFlow with it) is imported and warmed once per process
+instead of lazily inside every handler. Inference runs on a small, bounded
+thread pool so async FastAPI handlers never block the event loop; each call
+reports how long it waited for a worker and how long the model took.
+
+Faces go through one explicit pipeline (`detect_faces` / `represent`):
+
+* detect - the detector runs once per image, on a copy whose long edge is
+           at most `detect_side` (cost scales with pixels). Boxes and eye
+           landmarks are mapped back to the full-resolution image.
+* filter - faces smaller than `min_face` pixels are dropped here, before
+           any crop is made or embedded.
+* align  - survivors are cropped from the full-resolution image and rotated
+           so the eyes are level.
+* embed  - only the surviving crops, in one batch (`embed_batch`).
+
+With enforce_detection=False an image without a face is embedded whole (as
+DeepFace does), so callers never need a second strict/lenient pass.
+
+Every call names a lane. Workers always take the oldest "search" job before
+any "frame" job, so an investigator's search waits for at most the batches
+already running, not for the whole ingest backlog. Each lane has its own
+`max_pending` bound.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+from concurrent.futures import Future
+
+import cv2
+import numpy as np
+
+import metrics
+
+MODEL_SECONDS = metrics.histogram("kumbh_model_seconds", "Model pool time per call: queue wait and inference")
+FACES_DROPPED = metrics.counter("kumbh_faces_dropped_total", "Detections not embedded, by reason")
+
+
+# Lower runs first
+LANES = {"search": 0, "frame": 1}
+
+
+class ModelBusy(Exception):
+    """Raised when the inference backlog is full; handlers map it to 503."""
+
+
+class LaneExecutor:
+    """Fixed worker threads that take the highest-priority lane first (FIFO within a lane)."""
+
+    def __init__(self, workers, name="arcface"):
+        self._heap = []
+        self._seq = itertools.count()
+        self._cv = threading.Condition()
+        for i in range(workers):
+            threading.Thread(target=self._work, name=f"{name}_{i}", daemon=True).start()
+
+    def submit(self, fn, lane="frame"):
+        future = Future()
+        with self._cv:
+            heapq.heappush(self._heap, (LANES[lane], next(self._seq), fn, future))
+            self._cv.notify()
+        return future
+
+    def _work(self):
+        while True:
+            with self._cv:
+                while not self._heap:
+                    self._cv.wait()
+                _, _, fn, future = heapq.heappop(self._heap)
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn())
+            except BaseException as e:
+                future.set_exception(e)
+
+
+class ModelService:
+    def __init__(self, model_name="ArcFace", detector_backend="opencv", workers=1, max_pending=16,
+                 detect_side=640, min_face=40):
+        """detect_side: long edge the detector sees (0 = full resolution);
+        min_face: smallest face side in pixels worth embedding (0 = keep all)."""
+        self.model_name = model_name
+        self.detector_backend = detector_backend
+        self.detect_side = detect_side
+        self.min_face = min_face
+        self.workers = workers
+        self.max_pending = max_pending
+
+        self.state = "cold"  # cold -> loading -> ready | failed
+        self.error = None
+        self.cold_start_s = None
+        self._deepface = None
+        self._keras = None
+        self.input_size = None  # (height, width) expected by the embedding model
+        self._load_lock = threading.Lock()
+        self._executor = LaneExecutor(workers)
+        self._pending = dict.fromkeys(LANES, 0)
+        self._pending_lock = threading.Lock()
+
+        self.totals = {"calls": 0, "rejected": 0, "queue_s": 0.0, "inference_s": 0.0,
+                       "detections": 0, "too_small": 0}
+
+    # --- lifecycle ---
+
+    def load(self):
+        """Import DeepFace, build ArcFace and run one warm-up pass through the detector. Idempotent."""
+        with self._load_lock:
+            if self.state == "ready":
+                return
+            self.state = "loading"
+            t0 = time.perf_counter()
+            try:
+                print(f"🧠 Loading {self.model_name} + {self.detector_backend} detector...")
+                from deepface import DeepFace
+                built = DeepFace.build_model(self.model_name)
+                # Newer DeepFace wraps the Keras model in a client object; older returns it directly
+                self._keras = getattr(built, "model", built)
+                self.input_size = tuple(self._keras.input_shape[1:3])
+                # Warm-up: first call builds the detector and traces the TF graph
+                DeepFace.represent(
+                    img_path=np.zeros((224, 224, 3), dtype=np.uint8),
+                    model_name=self.model_name,
+                    detector_backend=self.detector_backend,
+                    enforce_detection=False
+                )
+                self._deepface = DeepFace
+                self.cold_start_s = time.perf_counter() - t0
+                self.state = "ready"
+                print(f"✅ {self.model_name} ready in {self.cold_start_s:.1f}s")
+            except Exception as e:
+                self.state = "failed"
+                self.error = str(e)
+                print(f"❌ Model load failed: {e}")
+                raise
+
+    def preload(self):
+        """Warm the model in the background (used at startup when MODEL_PRELOAD is on)."""
+        self._executor.submit(self._preload)
+
+    def _preload(self):
+        try:
+            self.load()
+        except Exception:
+            pass  # state/error already recorded; the next request retries the load
+
+    # --- inference ---
+
+    def represent(self, img, enforce_detection=True, detector_backend=None, min_face=None):
+        """detect -> filter -> align -> embed (call from a worker thread). Same result shape
+        as DeepFace.represent(): [{"embedding", "facial_area", "face_confidence"}, ...]."""
+        faces = self.detect_faces(img, enforce_detection, detector_backend, min_face)
+        return represented(faces, self.embed_batch([f["face"] for f in faces]))
+
+    def locate_faces(self, img, detector_backend=None):
+        """Detect stage: one detector pass at `detect_side`; boxes in `img` coordinates."""
+        self.load()
+        h, w = img.shape[:2]
+        scale = min(self.detect_side / max(h, w), 1.0) if self.detect_side else 1.0
+        small = img if scale == 1.0 else \
+            cv2.resize(img, (max(int(w * scale), 1), max(int(h * scale), 1)), interpolation=cv2.INTER_AREA)
+        found = self._deepface.extract_faces(
+            img_path=small,
+            detector_backend=detector_backend or self.detector_backend,
+            enforce_detection=False,  # "nothing found" is decided below, not by an exception
+            align=False               # aligned later on the full-resolution crop
+        )
+        boxes = []
+        for f in found:
+            area = f["facial_area"]
+            if not f.get("confidence") and area["w"] >= small.shape[1] and area["h"] >= small.shape[0]:
+                continue  # DeepFace's placeholder for "no face": the whole image
+            boxes.append({"facial_area": scale_area(area, 1.0 / scale), "confidence": f.get("confidence")})
+        return boxes
+
+    def detect_faces(self, img, enforce_detection=True, detector_backend=None, min_face=None):
+        """Detection, size filter and alignment in one pass. Returns [{"face" (RGB, 0..1),
+        "facial_area", "confidence"}, ...]; raises ValueError (enforce_detection) if none survive."""
+        boxes = self.locate_faces(img, detector_backend)
+        min_face = self.min_face if min_face is None else min_face
+        kept = [b for b in boxes if min(b["facial_area"]["w"], b["facial_area"]["h"]) >= min_face]
+        self.totals["detections"] += len(boxes)
+        if len(kept) < len(boxes):
+            self.totals["too_small"] += len(boxes) - len(kept)
+            FACES_DROPPED.inc(len(boxes) - len(kept), reason="too_small")
+        if not kept:
+            if enforce_detection:
+                raise ValueError("Face could not be detected" +
+                                 (f" ({len(boxes)} below {min_face}px)" if boxes else ""))
+            h, w = img.shape[:2]
+            return [{"face": to_rgb(img), "facial_area": {"x": 0, "y": 0, "w": w, "h": h}, "confidence": 0.0}]
+        return [{**b, "face": align_face(img, b["facial_area"])} for b in kept]
+
+    def embed_batch(self, faces):
+        """One forward pass for N aligned face crops (RGB, 0..1) -> list of N embeddings."""
+        self.load()
+        batch = np.stack([fit_to_input(face, self.input_size) for face in faces])
+        return [row.tolist() for row in self._keras.predict(batch, verbose=0)]
+
+    async def run(self, fn, *args, lane="frame", **kwargs):
+        """Run fn(*args, **kwargs) on the model pool in `lane` ("search" jumps the
+        "frame" backlog). Returns (result, timing_ms)."""
+        with self._pending_lock:
+            if self._pending[lane] >= self.max_pending:
+                self.totals["rejected"] += 1
+                raise ModelBusy(f"Inference backlog full ({self._pending[lane]} {lane} jobs pending)")
+            self._pending[lane] += 1
+
+        submitted = time.perf_counter()
+        timing = {}
+
+        def job():
+            started = time.perf_counter()
+            timing["queue_ms"] = (started - submitted) * 1000
+            was_cold = self.state != "ready"
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                timing["inference_ms"] = (time.perf_counter() - started) * 1000
+                if was_cold and self.cold_start_s is not None:
+                    timing["cold_start_ms"] = self.cold_start_s * 1000
+
+        try:
+            result = await asyncio.wrap_future(self._executor.submit(job, lane))
+        finally:
+            with self._pending_lock:
+                self._pending[lane] -= 1
+            self.totals["calls"] += 1
+            self.totals["queue_s"] += timing.get("queue_ms", 0.0) / 1000
+            self.totals["inference_s"] += timing.get("inference_ms", 0.0) / 1000
+            call = getattr(fn, "__name__", "call")
+            for phase in ("queue", "inference"):
+                if f"{phase}_ms" in timing:
+                    MODEL_SECONDS.observe(timing[f"{phase}_ms"] / 1000, call=call, phase=phase, lane=lane)
+        return result, {k: round(v, 1) for k, v in timing.items()}
+
+    async def represent_async(self, img, **kwargs):
+        return await self.run(self.represent, img, **kwargs)
+
+    def stats(self):
+        calls = self.totals["calls"] or 1
+        return {
+            "state": self.state,
+            "model": self.model_name,
+            "detector": self.detector_backend,
+            "detect_side": self.detect_side,
+            "min_face": self.min_face,
+            "detections": self.totals["detections"],
+            "too_small": self.totals["too_small"],
+            "cold_start_s": round(self.cold_start_s, 2) if self.cold_start_s else None,
+            "pending": sum(self._pending.values()),
+            "pending_by_lane": dict(self._pending),
+            "calls": self.totals["calls"],
+            "rejected": self.totals["rejected"],
+            "avg_queue_ms": round(self.totals["queue_s"] / calls * 1000, 1),
+            "avg_inference_ms": round(self.totals["inference_s"] / calls * 1000, 1),
+            "error": self.error,
+        }
+
+
+def represented(faces, embeddings):
+    """detect_faces() output + their embeddings -> DeepFace.represent()'s result shape."""
+    return [{"embedding": e, "facial_area": f["facial_area"], "face_confidence": f["confidence"]}
+            for f, e in zip(faces, embeddings)]
+
+
+def fit_to_input(face, target_size):
+    """RGB crop -> model input: flipped back to BGR, aspect-preserving resize and zero pad,
+    the steps DeepFace.represent() applies to an extract_faces() crop (the gallery was
+    embedded that way; checked by benchmarks/check_embed_parity.py)."""
+    target_h, target_w = target_size
+    face = np.asarray(face, dtype=np.float32)[:, :, ::-1]
+    if face.max() > 1.0:
+        face = face / 255.0
+    h, w = face.shape[:2]
+    scale = min(target_h / h, target_w / w)
+    new_h, new_w = max(int(h * scale), 1), max(int(w * scale), 1)
+    face = cv2.resize(face, (new_w, new_h))
+    pad_h, pad_w = target_h - new_h, target_w - new_w
+    return np.pad(face, ((pad_h // 2, pad_h - pad_h // 2), (pad_w // 2, pad_w - pad_w // 2), (0, 0)))
+
+
+def to_rgb(img):
+    """BGR uint8 (OpenCV) -> RGB float in 0..1, the layout extract_faces() returns."""
+    return np.ascontiguousarray(img[:, :, ::-1], dtype=np.float32) / 255.0
+
+
+def scale_area(area, factor):
+    """Map a facial_area (x, y, w, h + optional eye points) between image resolutions."""
+    out = {k: int(round(area[k] * factor)) for k in ("x", "y", "w", "h")}
+    for eye in ("left_eye", "right_eye"):
+        if area.get(eye) is not None:
+            out[eye] = tuple(int(round(c * factor)) for c in area[eye])
+    return out
+
+
+def align_face(img, area):
+    """Crop a detection from the full-resolution image, rotated so the eyes are level."""
+    x, y, w, h = max(area["x"], 0), max(area["y"], 0), area["w"], area["h"]
+    eyes = [area.get("left_eye"), area.get("right_eye")]
+    if None in eyes:
+        return to_rgb(img[y:y + h, x:x + w])
+    (ax, ay), (bx, by) = sorted(eyes)
+    angle = math.degrees(math.atan2(by - ay, bx - ax))
+    # Rotate only a padded window around the face, not the whole frame
+    pad = max(w, h) // 2
+    x0, y0 = max(x - pad, 0), max(y - pad, 0)
+    window = img[y0:y + h + pad, x0:x + w + pad]
+    centre = (x - x0 + w / 2, y - y0 + h / 2)
+    rotated = cv2.warpAffine(window, cv2.getRotationMatrix2D(centre, angle, 1.0),
+                             (window.shape[1], window.shape[0]), flags=cv2.INTER_LINEAR)
+    return to_rgb(rotated[y - y0:y - y0 + h, x - x0:x - x0 + w])
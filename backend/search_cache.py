@@ -0,0 +1,193 @@
+"""
+Cache for repeated biometric searches.
+
+During an active case the same probe photo is uploaded again every few
+minutes. Each upload used to repeat decode, detection, ArcFace and a full
+gallery scan. Two LRU maps now short-cut that:
+
+* embeddings - sha256 of the uploaded bytes -> probe embedding (and
+               facial_area). A re-upload skips decode, detection and ArcFace.
+* results    - (embedding, threshold, top_k, filter) -> raw top-k matches +
+               the watermark of the gallery they were computed against: the
+               index row count, or on the RPC path the sighting id below which
+               every row has committed (the stats tail's stable id). A repeat
+               query only scans sightings past the watermark and merges them
+               into the cached top-k. Rows only get appended, so the merge is
+               the same top-k a full scan would return; lists holding rows
+               that retention archived are dropped (forget()).
+
+Matches are cached before enrichment (camera names / node GPS), so registry
+changes show up immediately. `stats()` reports hit rates and the latency
+saved: the original cost of every reused entry minus what the refresh cost.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class _LRU:
+    def __init__(self, size):
+        self.size = size
+        self._items = OrderedDict()
+
+    def get(self, key):
+        value = self._items.get(key)
+        if value is not None:
+            self._items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        evicted = 0
+        while len(self._items) > self.size:
+            self._items.popitem(last=False)
+            evicted += 1
+        return evicted
+
+    def discard(self, key):
+        self._items.pop(key, None)
+
+    def items(self):
+        return list(self._items.items())
+
+    def clear(self):
+        self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+def match_key(match):
+    """Identity of a sighting in a match list (RPC match_faces rows carry no id)."""
+    if match.get("id") is not None:
+        return int(match["id"])
+    return (match.get("cam_id"), match.get("seen_at"), match.get("lat"), match.get("lon"))
+
+
+def merge_matches(cached, fresh, match_count):
+    """Union of two match lists (best similarity per sighting), ranked, cut to match_count."""
+    best = {}
+    for m in list(cached) + list(fresh):
+        key = match_key(m)
+        if key not in best or m["similarity"] > best[key]["similarity"]:
+            best[key] = m
+    return sorted(best.values(), key=lambda m: -m["similarity"])[:match_count]
+
+
+class SearchCache:
+    def __init__(self, max_embeddings=512, max_results=256):
+        self._embeddings = _LRU(max_embeddings)
+        self._results = _LRU(max_results)
+        self._lock = threading.Lock()
+        self.counters = {
+            "embedding_hits": 0, "embedding_misses": 0,
+            "result_hits": 0, "result_misses": 0, "result_stale": 0,
+            "evictions": 0, "refreshed_rows": 0, "saved_s": 0.0,
+        }
+
+    # --- keys ---
+
+    @staticmethod
+    def image_key(contents, **params):
+        """Content hash of an upload (+ anything else that changes the embedding)."""
+        digest = hashlib.sha256(contents)
+        for k in sorted(params):
+            digest.update(f"|{k}={params[k]}".encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def result_key(embedding, match_threshold, match_count, where=None):
+        vec = np.asarray(embedding, dtype=np.float32)
+        digest = hashlib.sha256(np.round(vec, 5).tobytes())
+        filt = (where.since, where.until, tuple(sorted(where.cam_ids or ())), where.bbox) if where else None
+        digest.update(repr((round(float(match_threshold), 4), int(match_count), filt)).encode())
+        return digest.hexdigest()
+
+    # --- embeddings ---
+
+    def get_embedding(self, key):
+        with self._lock:
+            entry = self._embeddings.get(key)
+            if entry is None:
+                self.counters["embedding_misses"] += 1
+                return None
+            self.counters["embedding_hits"] += 1
+            self.counters["saved_s"] += entry["cost_s"]
+            return entry
+
+    def put_embedding(self, key, embedding, facial_area=None, cost_s=0.0):
+        with self._lock:
+            self.counters["evictions"] += self._embeddings.put(key, {
+                "embedding": np.asarray(embedding, dtype=np.float32),
+                "facial_area": facial_area, "cost_s": cost_s,
+            })
+
+    # --- results ---
+
+    def get_results(self, key, backend):
+        """Cached entry for this query on this search backend, or None."""
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is None or entry["backend"] != backend:
+                self.counters["result_misses"] += 1
+                return None
+            return entry
+
+    def put_results(self, key, matches, watermark, backend, cost_s):
+        with self._lock:
+            self.counters["evictions"] += self._results.put(key, {
+                "matches": list(matches), "watermark": watermark,
+                "backend": backend, "cost_s": cost_s,
+            })
+
+    def refresh(self, key, entry, fresh, watermark, match_count, refresh_s, scanned=0):
+        """Merge the matches found past the entry's watermark and advance it."""
+        merged = merge_matches(entry["matches"], fresh, match_count)
+        with self._lock:
+            self.counters["result_hits"] += 1
+            self.counters["refreshed_rows"] += scanned
+            self.counters["saved_s"] += max(entry["cost_s"] - refresh_s, 0.0)
+            self._results.put(key, {**entry, "matches": merged, "watermark": watermark})
+        return merged
+
+    def stale(self, key):
+        """The gallery no longer extends the cached watermark (index rebuilt): drop the entry."""
+        with self._lock:
+            self.counters["result_stale"] += 1
+            self._results.discard(key)
+
+    def forget(self, ids):
+        """Sightings left the gallery (archived): drop the cached top-k lists that hold
+        any of them, so the next query re-ranks against what replaced them. Lists of
+        rows without ids (plain match_faces RPC) cannot be checked and are dropped too.
+        Probe embeddings stay. Returns how many entries were dropped."""
+        gone = {int(i) for i in ids}
+        with self._lock:
+            keys = [key for key, entry in self._results.items()
+                    if any(m.get("id") is None or int(m["id"]) in gone for m in entry["matches"])]
+            for key in keys:
+                self._results.discard(key)
+            self.counters["result_stale"] += len(keys)
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._embeddings.clear()
+            self._results.clear()
+
+    def stats(self):
+        c = self.counters
+
+        def rate(hits, misses):
+            return round(hits / (hits + misses), 3) if hits + misses else None
+
+        return {
+            "embeddings": len(self._embeddings), "results": len(self._results),
+            "embedding_hit_rate": rate(c["embedding_hits"], c["embedding_misses"]),
+            "result_hit_rate": rate(c["result_hits"], c["result_misses"] + c["result_stale"]),
+            **{k: v for k, v in c.items() if k != "saved_s"},
+            "saved_ms": round(c["saved_s"] * 1000, 1),
+        }
@@ -0,0 +1,522 @@
+"""
+Retention: time segments of `sightings` compacted into a memory-mapped cold archive.
+
+Every ingest path appends a raw 512-d row to `sightings`, so search, heat map
+and count costs kept growing all festival. Now only the last `hot_seconds`
+stay in the table (and the in-process index). Older rows are compacted one
+time segment (`segment_seconds`, aligned to the epoch) at a time:
+
+* tracks  - consecutive sightings of one face at one camera (cosine >=
+            `track_similarity`, at most `track_gap` seconds apart) collapse
+            into one track: first sighting id, first/last seen, row count,
+            position of the first sighting, and the normalised mean embedding.
+            Each row links to its most similar earlier row of the camera in
+            reach; a track is a chain of links (build_tracks, all numpy).
+* codes   - the track embeddings quantized: int8 + one scale per track
+            (`i8`, 4x smaller than float32) or product-quantized (`pq`,
+            64 bytes per track, codebook trained on the part itself).
+* rollups - exact per-camera counts per `rollup_bucket` over the raw rows,
+            so /stats and /stats/heatmap keep counting archived sightings.
+
+A compacted segment is one directory ("part") of columnar .npy files opened
+with mmap_mode="r"; only the pages a search touches are read. Segments are
+read and compacted `chunk_rows` rows at a time, one part per chunk, so memory
+stays bounded however busy the segment was (a track does not span chunks).
+Rows that arrive late for an archived segment become another part of it.
+
+Retention writes the part first, then deletes the rows from `sightings` by
+id and marks the part purged. A restart between the two finishes the purge
+(`resume()`) before the stats backfill runs. Listeners get the purged ids so
+the index can evict them and the search cache can drop stale results.
+
+Retention runs in one API process. The others, sharing ARCHIVE_DIR, follow
+it (`start_follow()`): they load the parts it adds and pass the ids of newly
+purged parts to the same listeners, so their index and cache drop them too.
+
+Searches whose time window reaches back past the hot horizon also scan the
+parts it overlaps. Archive results are tracks, in the `match_faces` shape
+plus {"archived": True, "track_size", "last_seen"}; similarities come from
+the quantized codes (int8 error ~0.005).
+"""
+import json
+import os
+import shutil
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from embedding_codec import ProductQuantizer, quantize_int8
+from face_index import EMBEDDING_DIM, normalize, parse_vector, top_k
+from timeutils import format_timestamp, parse_timestamp
+
+PART_FILE = "part.json"
+COLUMNS = ("track_id", "first_seen", "last_seen", "size", "cam", "lat", "lon")
+ROLLUP_DTYPE = np.dtype([("cam", "<i4"), ("bucket", "<i8"), ("count", "<i8")])
+
+
+def build_tracks(vectors, cams, seen_ats, gap=120.0, similarity=0.5, block=512):
+    """
+    Per-camera track association over rows sorted by (camera, time): each row links to
+    its most similar earlier row of the same camera at most `gap` seconds before, if
+    cosine >= `similarity`; tracks are the chains of links. Scored `block` rows at a
+    time against the window they can reach (one matmul per block).
+    Returns (track index per row, normalised mean vector per track).
+    """
+    n = len(vectors)
+    if not n:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, vectors.shape[1]), dtype=np.float32)
+    order = np.lexsort((seen_ats, cams))
+    vecs = vectors[order]
+    cam = np.asarray(cams)[order]
+    ts = np.asarray(seen_ats, dtype=np.float64)[order]
+
+    # Earliest row each row can link to: same camera, within `gap` (non-decreasing)
+    starts = np.r_[0, np.nonzero(cam[1:] != cam[:-1])[0] + 1, n]
+    reach = np.empty(n, dtype=np.int64)
+    for s, e in zip(starts[:-1], starts[1:]):
+        reach[s:e] = s + np.searchsorted(ts[s:e], ts[s:e] - gap, side="left")
+
+    parent = np.arange(n)
+    for b in range(0, n, block):
+        e = min(b + block, n)
+        w = reach[b]
+        rows, cols = np.arange(b, e)[:, None], np.arange(w, e)[None, :]
+        sims = vecs[b:e] @ vecs[w:e].T
+        sims[(cols >= rows) | (cols < reach[b:e, None])] = -np.inf
+        best = np.argmax(sims, axis=1)
+        linked = sims[np.arange(e - b), best] >= similarity
+        parent[b:e][linked] = w + best[linked]
+
+    # Links point to earlier rows: follow them to each chain's first row
+    while True:
+        root = parent[parent]
+        if np.array_equal(root, parent):
+            break
+        parent = root
+    roots, track_sorted = np.unique(parent, return_inverse=True)
+    track_of = np.empty(n, dtype=np.int64)
+    track_of[order] = track_sorted
+
+    by_track = np.argsort(track_sorted, kind="stable")
+    first = np.r_[0, np.nonzero(np.diff(track_sorted[by_track]))[0] + 1]
+    means = normalize(np.add.reduceat(vecs[by_track], first, axis=0))
+    return track_of, means
+
+
+class ArchivePart:
+    """One compacted (segment, batch) directory, memory-mapped read-only."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, PART_FILE), "r") as f:
+            self.header = json.load(f)
+        self.start, self.end = self.header["start"], self.header["end"]
+        self.cams = self.header["cams"]
+        self._cam_lookup = {c: i for i, c in enumerate(self.cams)}
+        self.codec = self.header["codec"]
+        load = lambda name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")  # noqa: E731
+        for column in COLUMNS:
+            setattr(self, column, load(column))
+        self.codes = load("codes")
+        self.scales = load("scales") if self.codec == "i8" else None
+        self.pq = None
+        if self.codec == "pq":
+            books = load("codebooks")
+            self.pq = ProductQuantizer(dim=self.header["dim"], m=books.shape[0], ks=books.shape[1])
+            self.pq.codebooks = np.asarray(books)
+
+    @property
+    def name(self):
+        return os.path.basename(self.path)
+
+    @property
+    def purged(self):
+        return self.header.get("purged", False)
+
+    def mark_purged(self):
+        self.header["purged"] = True
+        _write_json(os.path.join(self.path, PART_FILE), self.header)
+
+    def ids(self):
+        """Raw sighting ids compacted into this part."""
+        return np.load(os.path.join(self.path, "ids.npy"), mmap_mode="r")
+
+    def rollup(self):
+        return np.load(os.path.join(self.path, "rollup.npy"))
+
+    def overlaps(self, flt):
+        if flt is None:
+            return True
+        return (flt.since is None or flt.since < self.end) and (flt.until is None or flt.until > self.start)
+
+    def rows(self, flt):
+        """Tracks that can match `flt`: interval overlaps [since, until), camera, box."""
+        keep = np.ones(len(self.track_id), dtype=bool)
+        if flt is None:
+            return np.nonzero(keep)[0]
+        if flt.since is not None:
+            keep &= self.last_seen >= flt.since
+        if flt.until is not None:
+            keep &= self.first_seen < flt.until
+        if flt.cam_ids is not None:
+            keep &= np.isin(self.cam, [self._cam_lookup[c] for c in flt.cam_ids if c in self._cam_lookup])
+        if flt.bbox is not None:
+            keep &= (self.lat >= flt.bbox[0]) & (self.lat <= flt.bbox[2]) \
+                & (self.lon >= flt.bbox[1]) & (self.lon <= flt.bbox[3])
+        return np.nonzero(keep)[0]
+
+    def scores(self, rows, queries, chunk=4096):
+        """rows x probes similarities from the quantized track vectors."""
+        out = np.empty((len(rows), len(queries)), dtype=np.float32)
+        for s in range(0, len(rows), chunk):
+            r = rows[s:s + chunk]
+            if self.pq is not None:
+                codes = np.asarray(self.codes[r])
+                out[s:s + chunk] = np.stack([self.pq.scores(q, codes) for q in queries], axis=1)
+            else:
+                out[s:s + chunk] = (np.asarray(self.codes[r], dtype=np.float32) @ queries.T) \
+                    * np.asarray(self.scales[r])[:, None]
+        return out
+
+    def match(self, row, similarity, **extra):
+        i = int(row)
+        return {
+            "id": int(self.track_id[i]),
+            "cam_id": self.cams[int(self.cam[i])],
+            "seen_at": format_timestamp(self.first_seen[i]),
+            "lat": float(self.lat[i]),
+            "lon": float(self.lon[i]),
+            "similarity": float(similarity),
+            "archived": True,
+            "track_size": int(self.size[i]),
+            "last_seen": format_timestamp(self.last_seen[i]),
+            **extra,
+        }
+
+
+def _write_json(path, data):
+    with open(path + ".tmp", "w") as f:
+        json.dump(data, f)
+    os.replace(path + ".tmp", path)
+
+
+class SightingArchive:
+    def __init__(self, path, dim=EMBEDDING_DIM, segment_seconds=21600, codec="i8", rollup_bucket=300,
+                 track_gap=120.0, track_similarity=0.5, pq_m=64):
+        if codec not in ("i8", "pq"):
+            raise ValueError(f"Unknown archive codec: {codec}")
+        self.path = path
+        self.dim = dim
+        self.segment_seconds = segment_seconds
+        self.codec = codec
+        self.rollup_bucket = rollup_bucket
+        self.track_gap = track_gap
+        self.track_similarity = track_similarity
+        self.pq_m = pq_m
+        self.parts = []  # sorted by (start, name)
+        self._lock = threading.Lock()
+        self._thread = None
+        os.makedirs(path, exist_ok=True)
+        for name in sorted(os.listdir(path)):
+            full = os.path.join(path, name)
+            if name.startswith(".tmp-"):
+                shutil.rmtree(full, ignore_errors=True)  # interrupted compaction
+            elif os.path.exists(os.path.join(full, PART_FILE)):
+                self.parts.append(ArchivePart(full))
+        self.parts.sort(key=lambda p: (p.start, p.name))
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            path=os.getenv("ARCHIVE_DIR", "sighting_archive"),
+            segment_seconds=int(os.getenv("ARCHIVE_SEGMENT_SECONDS", "21600")),
+            codec=os.getenv("ARCHIVE_CODEC", "i8"),
+            rollup_bucket=int(os.getenv("STATS_BUCKET_SECONDS", "300")),
+            track_gap=float(os.getenv("ARCHIVE_TRACK_GAP_SECONDS", "120")),
+            track_similarity=float(os.getenv("ARCHIVE_TRACK_SIMILARITY", "0.5")),
+        )
+
+    def segment_of(self, epoch):
+        return int(epoch // self.segment_seconds) * self.segment_seconds
+
+    # --- compaction ---
+
+    def compact(self, segment_start, ids, vectors, cam_ids, seen_ats, lats, lons):
+        """Write one part for raw rows of the segment starting at `segment_start`. Returns it."""
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = normalize(vectors)
+        seen_ats = np.asarray(seen_ats, dtype=np.float64)
+        cams = sorted(set(cam_ids))
+        lookup = {c: i for i, c in enumerate(cams)}
+        cam = np.array([lookup[c] for c in cam_ids], dtype=np.int32)
+        lats, lons = np.asarray(lats, dtype=np.float32), np.asarray(lons, dtype=np.float32)
+
+        track_of, means = build_tracks(vectors, cam, seen_ats, self.track_gap, self.track_similarity)
+        t = len(means)
+        # First row of each track (ids ascend within a segment read) carries its id and position
+        first = np.full(t, len(ids), dtype=np.int64)
+        np.minimum.at(first, track_of, np.arange(len(ids)))
+        first_seen = np.full(t, np.inf)
+        np.minimum.at(first_seen, track_of, seen_ats)
+        last_seen = np.full(t, -np.inf)
+        np.maximum.at(last_seen, track_of, seen_ats)
+        columns = {
+            "track_id": ids[first], "first_seen": first_seen, "last_seen": last_seen,
+            "size": np.bincount(track_of, minlength=t).astype(np.int32),
+            "cam": cam[first], "lat": lats[first], "lon": lons[first],
+        }
+
+        codec, extra = self.codec, {}
+        if codec == "pq" and t >= 256:
+            pq = ProductQuantizer(dim=self.dim, m=self.pq_m).train(means)
+            extra = {"codes": pq.encode(means), "codebooks": pq.codebooks}
+        else:
+            codec = "i8"  # too few tracks to train a codebook
+            codes, scales = quantize_int8(means)
+            extra = {"codes": codes, "scales": scales}
+
+        buckets = (seen_ats // self.rollup_bucket).astype(np.int64)
+        keys, counts = np.unique(np.stack([cam.astype(np.int64), buckets]), axis=1, return_counts=True)
+        rollup = np.empty(keys.shape[1], dtype=ROLLUP_DTYPE)
+        rollup["cam"], rollup["bucket"], rollup["count"] = keys[0], keys[1], counts
+
+        name = f"{segment_start}-{int(ids.min())}"
+        tmp = os.path.join(self.path, f".tmp-{name}")
+        os.makedirs(tmp, exist_ok=True)
+        for column, values in {**columns, **extra, "ids": ids, "rollup": rollup}.items():
+            np.save(os.path.join(tmp, f"{column}.npy"), values)
+        _write_json(os.path.join(tmp, PART_FILE), {
+            "start": segment_start, "end": segment_start + self.segment_seconds,
+            "rows": len(ids), "tracks": t, "cams": cams, "codec": codec, "dim": self.dim,
+            "rollup_bucket": self.rollup_bucket, "purged": False, "created": time.time(),
+        })
+        final = os.path.join(self.path, name)
+        os.rename(tmp, final)
+        part = ArchivePart(final)
+        with self._lock:
+            self.parts = sorted(self.parts + [part], key=lambda p: (p.start, p.name))
+        return part
+
+    # --- queries ---
+
+    def reaches(self, flt=None):
+        """Does a search over `flt` need the archive (its window overlaps an archived segment)?"""
+        return any(p.overlaps(flt) for p in self.parts)
+
+    def search(self, query_embedding, match_threshold=0.45, match_count=50, where=None):
+        return self.search_batch([query_embedding], match_threshold, match_count, where)[0][0]
+
+    def search_batch(self, query_embeddings, match_threshold=0.45, match_count=50, where=None, fuse=None):
+        """Per-probe top tracks (and fused "max" / "mean" ranking) over the overlapping parts."""
+        queries = normalize(np.stack([parse_vector(q, self.dim) for q in query_embeddings]))
+        per_probe = [[] for _ in queries]
+        fused = [] if fuse else None
+        for part in [p for p in self.parts if p.overlaps(where)]:
+            rows = part.rows(where)
+            if not len(rows):
+                continue
+            sims = part.scores(rows, queries)
+            for j in range(len(queries)):
+                keep = np.nonzero(sims[:, j] > match_threshold)[0]
+                per_probe[j] += [part.match(rows[i], sims[i, j]) for i in keep[top_k(sims[keep, j], match_count)]]
+            if fuse:
+                score = sims.max(axis=1) if fuse == "max" else sims.mean(axis=1)
+                keep = np.nonzero(score > match_threshold)[0]
+                fused += [part.match(rows[i], score[i], probe_hits=int((sims[i] > match_threshold).sum()))
+                          for i in keep[top_k(score[keep], match_count)]]
+        rank = lambda ms: sorted(ms, key=lambda m: -m["similarity"])[:match_count]  # noqa: E731
+        return [rank(m) for m in per_probe], rank(fused) if fuse else None
+
+    def refresh(self):
+        """Re-read the directory (written by the retention process): load purged parts
+        not seen yet, update the purge flag of known ones. Returns the parts loaded."""
+        with self._lock:
+            known = {p.name: p for p in self.parts}
+        new = []
+        for name in sorted(os.listdir(self.path)):
+            full = os.path.join(self.path, name)
+            if name.startswith(".tmp-") or not os.path.exists(os.path.join(full, PART_FILE)):
+                continue
+            if name in known:
+                if not known[name].purged:
+                    with open(os.path.join(full, PART_FILE), "r") as f:
+                        known[name].header = json.load(f)
+                continue
+            part = ArchivePart(full)
+            if part.purged:  # still in the table otherwise; a later pass loads it
+                new.append(part)
+        if new:
+            with self._lock:
+                self.parts = sorted(self.parts + new, key=lambda p: (p.start, p.name))
+        return new
+
+    def start_follow(self, listener, interval=60.0):
+        """For processes not running retention: every `interval`, refresh() and hand the
+        ids of parts purged since the last pass to `listener` (the first pass hands all of
+        them, catching up an index that was offline)."""
+        def loop():
+            notified = set()
+            while True:
+                try:
+                    self.refresh()
+                    purged = [p for p in self.parts if p.purged and p.name not in notified]
+                    if purged:
+                        listener(np.concatenate([np.asarray(p.ids()) for p in purged]))
+                        notified.update(p.name for p in purged)
+                except Exception as e:
+                    print(f"⚠️ Archive follow failed: {e}")
+                time.sleep(interval)
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=loop, name="archive-follow", daemon=True)
+            self._thread.start()
+
+    def rollups(self, base_bucket):
+        """(cam_id, bucket index at `base_bucket`, count) over every purged part."""
+        out = defaultdict(int)
+        for part in self.parts:
+            if not part.purged:
+                continue
+            size = part.header.get("rollup_bucket", self.rollup_bucket)
+            for cam, bucket, count in part.rollup().tolist():
+                out[(part.cams[cam], int(bucket * size // base_bucket))] += count
+        return [(cam, bucket, n) for (cam, bucket), n in out.items()]
+
+    def stats(self):
+        parts = self.parts
+        rows = sum(p.header["rows"] for p in parts)
+        tracks = sum(p.header["tracks"] for p in parts)
+        return {
+            "parts": len(parts),
+            "segments": len({p.start for p in parts}),
+            "rows": rows,
+            "tracks": tracks,
+            "dedup_ratio": round(rows / tracks, 2) if tracks else None,
+            "oldest": format_timestamp(parts[0].start) if parts else None,
+            "newest": format_timestamp(parts[-1].end) if parts else None,
+            "bytes": sum(os.path.getsize(os.path.join(p.path, f)) for p in parts for f in os.listdir(p.path)),
+            "codec": self.codec,
+        }
+
+
+class Retention:
+    """Moves aged segments from `sightings` into a SightingArchive."""
+
+    def __init__(self, client, archive, hot_seconds=172800, page_size=1000, max_segments=4, chunk_rows=50000):
+        self.client = client
+        self.archive = archive
+        self.hot_seconds = hot_seconds
+        self.page_size = page_size
+        self.chunk_rows = chunk_rows
+        self.max_segments = max_segments
+        self.listeners = []  # fn(purged ids ndarray): index eviction, cache invalidation
+        self._thread = None
+        self.counters = {"runs": 0, "segments": 0, "rows_archived": 0, "tracks": 0,
+                         "last_run_s": None, "db_errors": 0}
+
+    def horizon(self, now=None):
+        """Segments ending at or before this epoch are compacted."""
+        return self.archive.segment_of((now or time.time()) - self.hot_seconds)
+
+    def _oldest(self, horizon):
+        res = self.client.table("sightings").select("id, seen_at") \
+            .lt("seen_at", format_timestamp(horizon)) \
+            .order("seen_at").limit(1).execute()
+        return parse_timestamp(res.data[0]["seen_at"]) if res.data else None
+
+    def _read_chunks(self, start):
+        """Rows of the segment starting at `start` in id order, at most `chunk_rows` at a
+        time: (ids, vectors, cam_ids, seen_ats, lats, lons) per chunk."""
+        last, done = 0, False
+        while not done:
+            ids, vectors, cams, seen, lats, lons = [], [], [], [], [], []
+            while len(ids) < self.chunk_rows:
+                limit = min(self.page_size, self.chunk_rows - len(ids))
+                res = self.client.table("sightings") \
+                    .select("id, cam_id, seen_at, lat, lon, face_vector") \
+                    .gte("seen_at", format_timestamp(start)) \
+                    .lt("seen_at", format_timestamp(start + self.archive.segment_seconds)) \
+                    .gt("id", last).order("id").limit(limit).execute()
+                for r in res.data:
+                    ids.append(int(r["id"]))
+                    # Vector-less rows still count in the rollups; a zero vector never matches
+                    vec = r.get("face_vector")
+                    vectors.append(parse_vector(vec, self.archive.dim) if vec is not None
+                                   else np.zeros(self.archive.dim, dtype=np.float32))
+                    cams.append(r.get("cam_id") or "UNKNOWN")
+                    seen.append(parse_timestamp(r.get("seen_at")))
+                    lats.append(r.get("lat") or 0.0)
+                    lons.append(r.get("lon") or 0.0)
+                if res.data:
+                    last = max(int(r["id"]) for r in res.data)
+                if len(res.data) < limit:
+                    done = True
+                    break
+            if ids:
+                yield ids, np.stack(vectors), cams, seen, lats, lons
+
+    def _purge(self, part):
+        ids = np.asarray(part.ids())
+        for s in range(0, len(ids), 500):
+            self.client.table("sightings").delete().in_("id", ids[s:s + 500].tolist()).execute()
+        part.mark_purged()
+        return ids
+
+    def _notify(self, purged):
+        # Once per run: evicting from the index rewrites it
+        if purged:
+            ids = np.concatenate(purged)
+            for listener in self.listeners:
+                listener(ids)
+
+    def resume(self):
+        """Finish purges interrupted by a restart (part written, rows not yet deleted)."""
+        self._notify([self._purge(p) for p in self.archive.parts if not p.purged])
+
+    def run_once(self, now=None):
+        """Compact up to `max_segments` aged segments. Returns rows archived."""
+        t0 = time.perf_counter()
+        horizon = self.horizon(now)
+        archived, purged = 0, []
+        for _ in range(self.max_segments):
+            oldest = self._oldest(horizon)
+            if oldest is None:
+                break
+            start = self.archive.segment_of(oldest)
+            rows = 0
+            for ids, vectors, cams, seen, lats, lons in self._read_chunks(start):
+                part = self.archive.compact(start, ids, vectors, cams, seen, lats, lons)
+                purged.append(self._purge(part))
+                rows += len(ids)
+                self.counters["tracks"] += part.header["tracks"]
+                print(f"🗄️ Archived {len(ids)} sightings from {format_timestamp(start)} "
+                      f"as {part.header['tracks']} tracks ({part.name})")
+            if not rows:
+                break  # purged concurrently
+            archived += rows
+            self.counters["segments"] += 1
+        self._notify(purged)
+        self.counters["runs"] += 1
+        self.counters["rows_archived"] += archived
+        self.counters["last_run_s"] = round(time.perf_counter() - t0, 3)
+        return archived
+
+    def start(self, interval=600.0):
+        def loop():
+            while True:
+                try:
+                    self.run_once()
+                except Exception as e:
+                    self.counters["db_errors"] += 1
+                    print(f"⚠️ Retention run failed: {e}")
+                time.sleep(interval)
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=loop, name="retention", daemon=True)
+            self._thread.start()
+
+    def stats(self):
+        return {**self.counters, "hot_seconds": self.hot_seconds,
+                "horizon": format_timestamp(self.horizon())}
@@ -0,0 +1,164 @@
+"""
+Incrementally maintained per-camera, per-time-bucket sighting counters.
+
+/stats and /stats/heatmap used to recount the whole `sightings` table on every
+dashboard poll. Here every sighting is counted once, into a fixed
+`base_bucket` (default 5 min) per camera, so queries cost O(cameras x buckets)
+no matter how many sightings exist.
+
+Rows reach the counters two ways, and each is counted exactly once:
+* record()  - live path, straight from /analyze_frame after its insert.
+* sync()    - tails `sightings` by id (backfill at startup + rows written by
+              indexer.py), re-reading a trailing window of ids each pass so rows
+              that commit out of id order are not missed (tail_cursor.py).
+Ids counted either way are remembered until they fall below the cursor's
+stable id; everything at or below it has been read by sync.
+
+Sightings moved to the cold archive (sighting_archive.py) are gone from the
+table; their per-camera rollups are seeded with add_rollups() at startup.
+
+Windows are aligned to base buckets: `since` rounds down, `until` rounds up.
+"""
+import math
+import threading
+import time
+from collections import defaultdict
+
+from tail_cursor import TailCursor
+from timeutils import parse_timestamp
+
+
+class SightingStats:
+    def __init__(self, base_bucket=300, sync_overlap=30.0):
+        self.base_bucket = base_bucket
+        self.total = 0
+        self.archived = 0  # of total, seeded from archive rollups
+        self.cursor = TailCursor(sync_overlap)
+        self.ready = False
+        self._counts = defaultdict(lambda: defaultdict(int))  # cam_id -> bucket index -> count
+        self._counted = set()  # ids counted above the cursor's stable id
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def last_synced_id(self):
+        """Every sighting at or below this id has been counted (or was never committed)."""
+        return self.cursor.stable_id
+
+    # --- ingest ---
+
+    def _add(self, cam_id, seen_at):
+        self._counts[cam_id or "UNKNOWN"][int(parse_timestamp(seen_at) // self.base_bucket)] += 1
+        self.total += 1
+
+    def record(self, sighting_id, cam_id, seen_at):
+        with self._lock:
+            if sighting_id <= self.cursor.stable_id or sighting_id in self._counted:
+                return
+            self._counted.add(sighting_id)
+            self._add(cam_id, seen_at)
+
+    def add_rows(self, rows):
+        """Count rows pulled from `sightings` that are not counted yet (live or an earlier pass)."""
+        with self._lock:
+            for row in rows:
+                sid = int(row["id"])
+                if sid <= self.cursor.stable_id or sid in self._counted:
+                    continue
+                self._counted.add(sid)
+                self._add(row.get("cam_id"), row.get("seen_at"))
+            self.cursor.read(int(row["id"]) for row in rows)
+
+    def add_rollups(self, rollups):
+        """Seed counts of sightings no longer in the table (archive rollups:
+        (cam_id, base bucket index, count)). Call before the first sync."""
+        with self._lock:
+            for cam_id, bucket, count in rollups:
+                self._counts[cam_id or "UNKNOWN"][int(bucket)] += count
+                self.total += count
+                self.archived += count
+
+    def sync(self, client, page_size=1000):
+        added = 0
+        with self._lock:
+            after = self.cursor.floor()
+            self._counted = {i for i in self._counted if i > after}
+        while True:
+            res = client.table("sightings") \
+                .select("id, cam_id, seen_at") \
+                .gt("id", after) \
+                .order("id") \
+                .limit(page_size) \
+                .execute()
+            before = self.total
+            self.add_rows(res.data)
+            added += self.total - before
+            if res.data:
+                after = max(int(r["id"]) for r in res.data)
+            if len(res.data) < page_size:
+                break
+        self.cursor.mark()
+        self.ready = True
+        return added
+
+    def start_sync(self, client, interval=15.0):
+        def loop():
+            while True:
+                try:
+                    self.sync(client)
+                except Exception as e:
+                    print(f"⚠️ Stats sync failed: {e}")
+                time.sleep(interval)
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=loop, name="sighting-stats", daemon=True)
+            self._thread.start()
+
+    # --- queries ---
+
+    def _bucket_range(self, since, until):
+        lo = -math.inf if since is None else math.floor(parse_timestamp(since) / self.base_bucket)
+        hi = math.inf if until is None else math.ceil(parse_timestamp(until) / self.base_bucket)
+        return lo, hi
+
+    def camera_counts(self, since=None, until=None):
+        """{cam_id: count} for sightings in [since, until)."""
+        lo, hi = self._bucket_range(since, until)
+        with self._lock:
+            return {
+                cam: total for cam, total in (
+                    (cam, sum(n for b, n in buckets.items() if lo <= b < hi))
+                    for cam, buckets in self._counts.items()
+                ) if total
+            }
+
+    def series(self, since=None, until=None, bucket_size=None):
+        """{bucket_start_epoch: {cam_id: count}}, re-bucketed to `bucket_size` seconds."""
+        size = max(int(bucket_size or self.base_bucket) // self.base_bucket, 1)
+        lo, hi = self._bucket_range(since, until)
+        out = defaultdict(lambda: defaultdict(int))
+        with self._lock:
+            for cam, buckets in self._counts.items():
+                for b, n in buckets.items():
+                    if lo <= b < hi:
+                        out[(b // size) * size * self.base_bucket][cam] += n
+        return {start: dict(cams) for start, cams in sorted(out.items())}
+
+    def stats(self):
+        return {
+            "total": self.total,
+            "archived": self.archived,
+            "cameras": len(self._counts),
+            "buckets": sum(len(b) for b in self._counts.values()),
+            "base_bucket_s": self.base_bucket,
+            "synced_to_id": self.last_synced_id,
+            "ready": self.ready,
+        }
+
+
+def recount(rows, base_bucket=300):
+    """Reference full recount over raw `sightings` rows, for checking the incremental counters."""
+    counts = defaultdict(lambda: defaultdict(int))
+    for row in rows:
+        counts[row.get("cam_id") or "UNKNOWN"][int(parse_timestamp(row.get("seen_at")) // base_bucket)] += 1
+    return {cam: dict(b) for cam, b in counts.items()}
@@ -0,0 +1,49 @@
+"""
+Id cursor for tailing `sightings` while writers commit out of id order.
+
+Bigserial ids are handed out before commit. With several writers (API workers,
+every indexer's SightingWriter) a row with a lower id can become visible after
+a higher one, so tailing with `id > highest id read` skips it for good.
+
+A TailCursor re-reads a trailing window instead: each pass fetches the ids
+above the highest id that had been read `overlap` seconds earlier
+(`stable_id`), so a row that commits up to `overlap` seconds late is still
+picked up. Rows in the window are read again on every pass; consumers
+de-duplicate them by id.
+
+    after = cursor.floor()
+    while page := fetch(id > after):      # pages in id order
+        consume(page); cursor.read(ids); after = max(ids)
+    cursor.mark()                          # pass complete
+"""
+import time
+from collections import deque
+
+
+class TailCursor:
+    def __init__(self, overlap=30.0, stable_id=0):
+        self.overlap = overlap
+        self.stable_id = stable_id  # every row at or below this id has been read
+        self.last_id = stable_id    # highest id read
+        self._marks = deque()       # (monotonic time, last_id) at the end of each pass
+
+    def resume(self, stable_id, last_id=None):
+        """Continue from persisted state (e.g. an index reopened from disk)."""
+        self.stable_id = stable_id
+        self.last_id = max(stable_id, last_id or 0)
+        self._marks.clear()
+
+    def floor(self):
+        """Id to read after on this pass: the highest id read `overlap` seconds ago."""
+        cutoff = time.monotonic() - self.overlap
+        while self._marks and self._marks[0][0] <= cutoff:
+            self.stable_id = max(self.stable_id, self._marks.popleft()[1])
+        return self.stable_id
+
+    def read(self, ids):
+        for i in ids:
+            self.last_id = max(self.last_id, int(i))
+
+    def mark(self):
+        """End of a complete pass: what it read becomes stable `overlap` seconds from now."""
+        self._marks.append((time.monotonic(), self.last_id))
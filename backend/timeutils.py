@@ -0,0 +1,36 @@
+"""
+Timestamp helpers shared by the in-memory subsystems.
+
+The DB stores naive UTC timestamps (written with datetime.utcnow().isoformat());
+in memory we keep epoch seconds.
+"""
+import time
+from datetime import datetime, timezone
+
+
+def parse_timestamp(value):
+    """ISO string (naive = UTC, as written by datetime.utcnow()) -> epoch seconds."""
+    if value is None:
+        return time.time()
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        text = str(value).replace("Z", "+00:00").replace(" ", "T")
+        try:
+            dt = datetime.fromisoformat(text)
+        except ValueError:
+            # Postgres may emit 1-5 fractional digits, which Python < 3.11 rejects
+            head, _, frac = text.partition(".")
+            digits = "".join(ch for ch in frac if ch.isdigit())
+            tz = frac[len(digits):]
+            dt = datetime.fromisoformat(f"{head}.{digits[:6].ljust(6, '0')}{tz}")
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def format_timestamp(epoch):
+    """Epoch seconds -> naive UTC ISO string (the format the DB returns)."""
+    return datetime.fromtimestamp(float(epoch), timezone.utc).replace(tzinfo=None).isoformat()
@@ -0,0 +1,245 @@
+"""
+Ingest-time watchlist matching.
+
+Finding a missing person used to mean re-running /search/biometric over the
+whole history, again and again. Operators now register probe embeddings
+once, and every face ingested (/analyze_frame, /sightings/bulk, indexer.py)
+is scored against them as it arrives:
+
+* matrix   - all active probes as one contiguous, L2-normalised float32
+             (probes, dim) matrix. A frame's faces are scored with a single
+             (faces x dim) @ (dim x probes) product, well under a millisecond
+             per face for thousands of probes
+             (benchmarks/bench_watchlist.py). add/remove build a new
+             snapshot and swap it in, so scoring never takes a lock.
+* entries  - one `watchlist` row per probe. Several probes (photos) can
+             share a label; a face alerts once per label, with the best probe.
+             Each probe may carry its own threshold.
+* alerts   - {watch_id, label, similarity, cam_id, seen_at, lat, lon}, at
+             most one per (label, camera) every `cooldown` seconds so a
+             person standing in front of a camera is not re-announced on
+             every frame. Callers persist them to `watch_alerts`; the API
+             pushes them on /watchlist/alerts/stream and tails the table for
+             alerts raised by indexer.py.
+* sync     - every process keeps its own copy; `sync()` compares the active
+             ids with the table and only fetches vectors for new probes.
+"""
+import threading
+import time
+
+import numpy as np
+
+import metrics
+from embedding_codec import format_vector
+from face_index import EMBEDDING_DIM, normalize, parse_vector
+from timeutils import format_timestamp, parse_timestamp
+
+ENTRY_COLUMNS = "id, label, notes, threshold, created_at"
+ALERT_COLUMNS = "id, watch_id, label, similarity, cam_id, seen_at, lat, lon"
+
+MATCH_SECONDS = metrics.histogram(
+    "kumbh_watchlist_match_seconds", "Scoring one batch of faces against the watchlist",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1),
+)
+ALERTS = metrics.counter("kumbh_watchlist_alerts_total", "Watchlist hits raised as alerts")
+
+
+class _Snapshot:
+    """Immutable view of the active probes: scored without holding the lock."""
+
+    def __init__(self, dim, entries=()):
+        entries = list(entries)
+        self.ids = np.array([e["id"] for e in entries], dtype=np.int64)
+        self.labels = [e["label"] for e in entries]
+        self.thresholds = np.array([e["threshold"] for e in entries], dtype=np.float32)
+        self.matrix = np.ascontiguousarray(
+            np.stack([e["vector"] for e in entries]) if entries else np.zeros((0, dim), dtype=np.float32)
+        )
+
+
+class Watchlist:
+    def __init__(self, client=None, dim=EMBEDDING_DIM, threshold=0.5, cooldown=60.0):
+        """client: Supabase client (None = memory only, e.g. benchmarks)."""
+        self.client = client
+        self.dim = dim
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.ready = client is None
+
+        self._entries = {}      # id -> {id, label, notes, threshold, created_at, vector}
+        self._snapshot = _Snapshot(dim)
+        self._last_alert = {}   # (label, cam_id) -> epoch of the last alert
+        self._next_local_id = 1
+        self._lock = threading.Lock()
+        self._thread = None
+        self.counters = {"faces_scored": 0, "hits": 0, "alerts": 0, "suppressed": 0,
+                         "syncs": 0, "db_errors": 0}
+
+    @property
+    def size(self):
+        return len(self._snapshot.ids)
+
+    # --- entries ---
+
+    def _entry(self, row, vector):
+        threshold = row.get("threshold")
+        return {
+            "id": int(row["id"]),
+            "label": row.get("label") or str(row["id"]),
+            "notes": row.get("notes"),
+            "threshold": float(threshold) if threshold is not None else self.threshold,
+            "created_at": row.get("created_at"),
+            "vector": normalize(parse_vector(vector, self.dim)),
+        }
+
+    def _rebuild(self):
+        # Callers hold self._lock; the swap itself is a single assignment
+        self._snapshot = _Snapshot(self.dim, self._entries.values())
+
+    def add(self, label, vectors, threshold=None, notes=None):
+        """Register one probe per vector under `label`. Returns the new entries (without vectors)."""
+        rows = [{"label": label, "notes": notes, "threshold": threshold, "active": True,
+                 "probe_vector": format_vector(v)} for v in vectors]
+        if self.client is not None:
+            inserted = self.client.table("watchlist").insert(rows).execute().data
+            rows = [{**row, **{k: v for k, v in ins.items() if k != "probe_vector"}}
+                    for row, ins in zip(rows, inserted)]
+        else:
+            for row in rows:
+                row["id"] = self._next_local_id
+                self._next_local_id += 1
+        entries = [self._entry(row, v) for row, v in zip(rows, vectors)]
+        with self._lock:
+            for entry in entries:
+                self._entries[entry["id"]] = entry
+            self._rebuild()
+        return [self.describe(e) for e in entries]
+
+    def remove(self, entry_id):
+        """Deactivate a probe (kept in the table for the alert history). False if unknown."""
+        entry_id = int(entry_id)
+        if entry_id not in self._entries:
+            return False
+        if self.client is not None:
+            self.client.table("watchlist").update({"active": False}).eq("id", entry_id).execute()
+        with self._lock:
+            self._entries.pop(entry_id, None)
+            self._rebuild()
+        return True
+
+    @staticmethod
+    def describe(entry):
+        return {k: v for k, v in entry.items() if k != "vector"}
+
+    def entries(self):
+        return [self.describe(e) for e in list(self._entries.values())]
+
+    # --- matching ---
+
+    def match(self, embeddings):
+        """
+        Score faces against every probe in one product.
+        Returns, per face, [(watch_id, label, similarity), ...] best first:
+        one per label, only above the probe's threshold.
+        """
+        snap = self._snapshot
+        faces = len(embeddings)
+        if not faces or not len(snap.ids):
+            return [[] for _ in range(faces)]
+        with MATCH_SECONDS.time():
+            queries = normalize(np.stack([parse_vector(e, self.dim) for e in embeddings]))
+            # (probes x dim) @ (dim x faces): the BLAS-friendly orientation for a handful of faces
+            sims = (snap.matrix @ queries.T).T
+            face_idx, probe_idx = np.nonzero(sims >= snap.thresholds)
+        best = [{} for _ in range(faces)]
+        for f, p in zip(face_idx.tolist(), probe_idx.tolist()):
+            label, sim = snap.labels[p], float(sims[f, p])
+            if label not in best[f] or sim > best[f][label][2]:
+                best[f][label] = (int(snap.ids[p]), label, sim)
+        self.counters["faces_scored"] += faces
+        self.counters["hits"] += len(face_idx)
+        return [sorted(hits.values(), key=lambda h: -h[2]) for hits in best]
+
+    def check(self, embeddings, sightings):
+        """
+        match() + cooldown -> alerts to raise. `sightings` describes where the
+        faces were seen: one dict {cam_id, seen_at, lat, lon} shared by all
+        faces, or one per face. Each alert carries `face`, the index of the face.
+        """
+        if not self.size:
+            return []
+        alerts = []
+        now = time.time()
+        for face, hits in enumerate(self.match(embeddings)):
+            if not hits:
+                continue
+            where = sightings[face] if isinstance(sightings, (list, tuple)) else sightings
+            cam_id = where.get("cam_id") or "UNKNOWN"
+            for watch_id, label, sim in hits:
+                key = (label, cam_id)
+                if now - self._last_alert.get(key, 0.0) < self.cooldown:
+                    self.counters["suppressed"] += 1
+                    continue
+                self._last_alert[key] = now
+                alerts.append({
+                    "watch_id": watch_id, "label": label, "similarity": round(sim, 4),
+                    "cam_id": cam_id,
+                    "seen_at": format_timestamp(parse_timestamp(where.get("seen_at"))),
+                    "lat": where.get("lat") or 0.0, "lon": where.get("lon") or 0.0,
+                    "face": face,
+                })
+                ALERTS.inc(cam_id=cam_id)
+        self.counters["alerts"] += len(alerts)
+        if len(self._last_alert) > 10000:
+            self._last_alert = {k: t for k, t in self._last_alert.items() if now - t < self.cooldown}
+        return alerts
+
+    @staticmethod
+    def alert_row(alert):
+        """The `watch_alerts` columns of an alert."""
+        return {k: v for k, v in alert.items() if k != "face"}
+
+    # --- sync ---
+
+    def sync(self):
+        """Converge on the active rows of `watchlist`: fetch new probes, drop deactivated ones."""
+        rows = self.client.table("watchlist").select(ENTRY_COLUMNS).eq("active", True).execute().data
+        active = {int(r["id"]): r for r in rows}
+        new = [i for i in active if i not in self._entries]
+        gone = [i for i in self._entries if i not in active]
+        fetched = []
+        for start in range(0, len(new), 500):
+            chunk = new[start:start + 500]
+            res = self.client.table("watchlist").select("id, probe_vector") \
+                .in_("id", chunk).execute()
+            fetched += [self._entry(active[int(r["id"])], r["probe_vector"]) for r in res.data]
+        if fetched or gone:
+            with self._lock:
+                for i in gone:
+                    self._entries.pop(i, None)
+                for entry in fetched:
+                    self._entries[entry["id"]] = entry
+                self._rebuild()
+        self.counters["syncs"] += 1
+        if not self.ready:
+            print(f"✅ Watchlist loaded: {self.size} probes")
+        self.ready = True
+        return len(fetched), len(gone)
+
+    def start_sync(self, interval=10.0):
+        def loop():
+            while True:
+                try:
+                    self.sync()
+                except Exception as e:
+                    self.counters["db_errors"] += 1
+                    print(f"⚠️ Watchlist sync failed: {e}")
+                time.sleep(interval)
+
+        if self._thread is None and self.client is not None:
+            self._thread = threading.Thread(target=loop, name="watchlist-sync", daemon=True)
+            self._thread.start()
+
+    def stats(self):
+        return {**self.counters, "probes": self.size, "labels": len(set(self._snapshot.labels)),
+                "threshold": self.threshold, "cooldown_s": self.cooldown, "ready": self.ready}
@@ -0,0 +1,139 @@
+"""
+Camera surge vs. investigator search, with and without admission control
+(backend/admission.py) and the model pool's priority lanes.
+
+`--cams` cameras post frames open-loop at `--fps` each (a surge: they do not
+wait for answers or honour hints), well past what the stub model can embed,
+while an investigator runs /search/biometric every `--search_every` seconds.
+In-process API on benchmarks/fake_supabase.py with the stub model from
+bench_api.py.
+
+Reports search p50/p95, frame outcomes (processed, busy, 429 by reason),
+latency of the frames that were processed, and the model backlog seen at the
+end. --lanes off gives both lanes the same priority (plain FIFO pool).
+
+    python benchmarks/bench_admission.py --admission off --lanes off
+    python benchmarks/bench_admission.py --admission on
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import bench_api  # noqa: E402  (puts backend/ on the path)
+import fake_supabase  # noqa: E402
+
+
+def pct(values, q):
+    return float(np.percentile(values, q)) if values else float("nan")
+
+
+async def run(args, api, ids):
+    import httpx
+
+    for handler in api.app.router.on_startup:
+        await handler()
+    while api.face_index is not None and not api.face_index.ready:
+        await asyncio.sleep(0.1)
+
+    frames = [bench_api.jpeg(ids.frame(ids.rng.integers(0, len(ids.patterns), args.faces_per_frame)))
+              for _ in range(32)]
+    probe = bench_api.jpeg(ids.frame([0]))
+    outcomes, frame_ms, search_ms = Counter(), [], []
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as http:
+        async def post_frame(cam, i):
+            t = time.perf_counter()
+            r = await http.post("/analyze_frame", files={"file": ("f.jpg", frames[i % len(frames)], "image/jpeg")},
+                                data={"cam_id": f"CAM_{cam}", "lat": "25.43", "lon": "81.84"})
+            status = r.json().get("status")
+            outcomes[f"429 {status}" if r.status_code == 429 else status] += 1
+            if status == "processed":
+                frame_ms.append((time.perf_counter() - t) * 1000)
+
+        async def camera(cam, deadline, tasks):
+            await asyncio.sleep(ids.rng.random() / args.fps)  # cameras out of phase
+            i = 0
+            while time.perf_counter() < deadline:
+                tasks.append(asyncio.create_task(post_frame(cam, i)))
+                i += 1
+                await asyncio.sleep(1.0 / args.fps)
+
+        async def investigator(deadline):
+            while time.perf_counter() < deadline:
+                t = time.perf_counter()
+                r = await http.post("/search/biometric", files={"file": ("p.jpg", probe, "image/jpeg")})
+                if r.status_code == 200:
+                    search_ms.append((time.perf_counter() - t) * 1000)
+                else:
+                    outcomes[f"search {r.status_code}"] += 1
+                await asyncio.sleep(args.search_every)
+
+        tasks = []
+        deadline = time.perf_counter() + args.seconds
+        await asyncio.gather(investigator(deadline), *(camera(c, deadline, tasks) for c in range(args.cams)))
+        backlog = api.model_service.stats()["pending"]
+        await asyncio.gather(*tasks)
+
+    sent = sum(v for k, v in outcomes.items() if not k.startswith("search"))
+    print(f"📊 admission {args.admission}, lanes {args.lanes}: {args.cams} cams x {args.fps:g} fps "
+          f"for {args.seconds:g} s ({sent} frames, {args.faces_per_frame} faces each; stub model "
+          f"{args.stub_call_ms} ms/call + {args.stub_face_ms} ms/face)")
+    print(f"   search    p50 {pct(search_ms, 50):>8.1f} ms  p95 {pct(search_ms, 95):>8.1f} ms  (n={len(search_ms)})")
+    print(f"   frames    p50 {pct(frame_ms, 50):>8.1f} ms  p95 {pct(frame_ms, 95):>8.1f} ms  "
+          f"processed {len(frame_ms)} = {len(frame_ms) / args.seconds:.1f}/s")
+    print(f"   outcomes  {dict(sorted(outcomes.items()))}")
+    print(f"   model backlog at end of surge: {backlog} jobs")
+    if api.admission is not None:
+        print(f"   admission {api.admission.stats()}")
+    if api.embed_batcher is not None:
+        await api.embed_batcher.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--admission", choices=("on", "off"), default="on")
+    parser.add_argument("--lanes", choices=("on", "off"), default="on")
+    parser.add_argument("--cams", type=int, default=32)
+    parser.add_argument("--fps", type=float, default=4.0, help="Frames per second per camera (open loop)")
+    parser.add_argument("--faces_per_frame", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--search_every", type=float, default=0.5)
+    parser.add_argument("--n", type=int, default=20000, help="Gallery size")
+    parser.add_argument("--stub_call_ms", type=float, default=5.0)
+    parser.add_argument("--stub_face_ms", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=23)
+    args = parser.parse_args()
+
+    client = fake_supabase.install()
+    os.environ.setdefault("SUPABASE_URL", "http://fake-supabase")
+    os.environ.setdefault("SUPABASE_KEY", "fake")
+    os.environ["FACE_INDEX_DIR"] = tempfile.mkdtemp(prefix="admission_bench_")
+    os.environ["ADMISSION"] = args.admission
+    os.environ["SEARCH_CACHE"] = "off"  # every search pays the model, as a new probe photo would
+
+    ids = bench_api.Identities(max(args.n // 20, 1), seed=args.seed)
+    service = bench_api.StubModelService(call_ms=args.stub_call_ms, face_ms=args.stub_face_ms)
+    base = np.stack([service.embed_crop(ids.tile(w, noise=0)) for w in range(len(ids.patterns))])
+    who = ids.rng.integers(0, len(ids.patterns), args.n)
+    client.seed_sightings(base[who], [f"CAM_{i % 8}" for i in range(args.n)],
+                          time.time() - ids.rng.random(args.n) * 86400)
+
+    import main as api  # noqa: E402  (after the fake supabase module is installed)
+    import model_service  # noqa: E402
+    if args.lanes == "off":
+        model_service.LANES["search"] = model_service.LANES["frame"]
+    api.model_service = service
+    if api.embed_batcher is not None:
+        api.embed_batcher.model_service = service
+    asyncio.run(run(args, api, ids))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,400 @@
+"""
+Offline load benchmark for the API and the edge indexer loop.
+
+Runs the real backend (backend/main.py, in process via ASGI) and the real edge
+pipeline against benchmarks/fake_supabase.py, so no Supabase project, network
+or GPU is needed:
+
+* ingest        - concurrent POST /analyze_frame with synthetic multi-face frames
+* search_index  - POST /search/biometric answered by the in-process face index
+* search_rpc    - the same probes through the numpy `match_faces` RPC fallback
+* indexer       - CapturePipeline + FaceTracker + SightingWriter on a synthetic video
+
+Faces are synthetic "identity" tiles. The default stub embedder turns each
+crop into a stable 512-d vector (and can simulate model cost with
+--stub_call_ms/--stub_face_ms); --embedder arcface uses the real model.
+
+Each scenario reports p50/p99 latency, throughput and peak RSS. Results are
+saved as JSON and can be diffed against an earlier run:
+
+    python benchmarks/bench_api.py --n 100000 --label baseline
+    python benchmarks/bench_api.py --n 100000 --compare benchmarks/results/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+sys.path.insert(0, ROOT)
+import fake_supabase  # noqa: E402
+from model_service import ModelService  # noqa: E402
+
+TILE = 96           # synthetic face size (px)
+FRAME = (360, 640)  # synthetic camera frame (h, w)
+
+
+# --- synthetic faces ---
+
+class Identities:
+    """Random 12x12 patterns upscaled to TILE px; each shot adds pixel noise."""
+
+    def __init__(self, count, seed=0):
+        self.rng = np.random.default_rng(seed)
+        self.patterns = self.rng.integers(40, 215, (count, 12, 12), dtype=np.uint8)
+
+    def tile(self, who, noise=12.0):
+        img = cv2.resize(self.patterns[who], (TILE, TILE), interpolation=cv2.INTER_NEAREST).astype(np.float32)
+        img += self.rng.normal(0, noise, img.shape)
+        return cv2.cvtColor(np.clip(img, 0, 255).astype(np.uint8), cv2.COLOR_GRAY2BGR)
+
+    def frame(self, people):
+        frame = np.full(FRAME + (3,), 20, dtype=np.uint8)
+        for slot, who in enumerate(people):
+            x, y = slot_origin(slot)
+            frame[y:y + TILE, x:x + TILE] = self.tile(who)
+        return frame
+
+
+def slot_origin(slot):
+    per_row = FRAME[1] // (TILE + 20)
+    return 10 + (slot % per_row) * (TILE + 20), 10 + (slot // per_row) * (TILE + 20)
+
+
+def jpeg(img):
+    return cv2.imencode(".jpg", img, [int(cv2.IMWRITE_JPEG_QUALITY), 90])[1].tobytes()
+
+
+class StubModelService(ModelService):
+    """ModelService with a fixed-layout detector and a projection embedder in place of DeepFace."""
+
+    def __init__(self, call_ms=5.0, face_ms=10.0, **kwargs):
+        super().__init__(**kwargs)
+        self._w = np.random.default_rng(42).standard_normal((16 * 16, 512)).astype(np.float32)
+        self._call_s, self._face_s = call_ms / 1000.0, face_ms / 1000.0
+        self.state = "ready"
+        self.cold_start_s = 0.0
+
+    def load(self):
+        pass
+
+    def embed_crop(self, crop):
+        small = cv2.resize(cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY), (16, 16), interpolation=cv2.INTER_AREA)
+        x = small.astype(np.float32).reshape(-1)
+        return ((x - x.mean()) / (x.std() or 1.0)) @ self._w
+
+    def detect_faces(self, img, enforce_detection=True, detector_backend=None, min_face=None):
+        # Scale slot positions to the decoded size (uploads may be decoded reduced)
+        sy, sx = img.shape[0] / FRAME[0], img.shape[1] / FRAME[1]
+        min_face = self.min_face if min_face is None else min_face
+        faces, slot = [], 0
+        while True:
+            x, y = slot_origin(slot)
+            if y + TILE > FRAME[0]:
+                break
+            x0, y0, w, h = int(x * sx), int(y * sy), int(TILE * sx), int(TILE * sy)
+            crop = img[y0:y0 + h, x0:x0 + w]
+            if crop.size and crop.std() > 20 and min(w, h) >= min_face:
+                faces.append({"face": crop, "facial_area": {"x": x0, "y": y0, "w": w, "h": h},
+                              "confidence": 1.0})
+            slot += 1
+        if not faces:
+            if enforce_detection:
+                raise ValueError("Face could not be detected")
+            # Whole image as the probe, like ModelService
+            faces = [{"face": img, "facial_area": {"x": 0, "y": 0, "w": img.shape[1], "h": img.shape[0]},
+                      "confidence": 0.0}]
+        return faces
+
+    def embed_batch(self, faces):
+        time.sleep(self._call_s + self._face_s * len(faces))
+        return [self.embed_crop(f).tolist() for f in faces]
+
+
+# --- measurement ---
+
+def current_rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RSSSampler:
+    """Peak RSS while a scenario runs (sampled every 20 ms)."""
+
+    def __enter__(self):
+        self.peak = current_rss()
+        self._stop = threading.Event()
+
+        def loop():
+            while not self._stop.wait(0.02):
+                self.peak = max(self.peak, current_rss())
+
+        self._thread = threading.Thread(target=loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+
+def summarize(latencies, elapsed, items, peak_rss, **extra):
+    lat = np.asarray(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "p50_ms": round(float(np.percentile(lat, 50)), 2),
+        "p99_ms": round(float(np.percentile(lat, 99)), 2),
+        "throughput_per_s": round(items / elapsed, 2) if elapsed else 0.0,
+        "count": items,
+        "peak_rss_mb": round(peak_rss / 2**20, 1),
+        **extra,
+    }
+
+
+# --- scenarios ---
+
+async def post_many(client, make_request, total, concurrency):
+    latencies, statuses = [], {}
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            t = time.perf_counter()
+            resp = await make_request(client, i)
+            latencies.append(time.perf_counter() - t)
+            statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return latencies, time.perf_counter() - t0, statuses
+
+
+async def run_api(args, main, ids, identity_of, results):
+    import httpx
+
+    for handler in main.app.router.on_startup:
+        await handler()
+    # Wait for the initial face index backfill from the fake DB
+    t0 = time.perf_counter()
+    while main.face_index is not None and not main.face_index.ready:
+        await asyncio.sleep(0.1)
+    results["setup"]["index_sync_s"] = round(time.perf_counter() - t0, 2)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        who = ids.rng.integers(0, len(ids.patterns), args.searches)
+        probes = [jpeg(ids.frame([w])) for w in who]
+
+        def search(c, i):
+            return c.post("/search/biometric", files={"file": ("p.jpg", probes[i], "image/jpeg")})
+
+        for name, use_index in (("search_index", True), ("search_rpc", False)):
+            if name not in args.scenarios or (use_index and main.face_index is None):
+                continue
+            if main.search_cache is not None:
+                main.search_cache.clear()  # each scenario pays for its own probe embeddings
+            ready = main.face_index.ready if main.face_index else None
+            if main.face_index is not None:
+                main.face_index.ready = use_index
+            hits = []
+
+            async def checked(c, i):
+                resp = await search(c, i)
+                matches = resp.json().get("matches") if resp.status_code == 200 else None
+                if matches and "id" in matches[0]:
+                    hits.append(identity_of.get(matches[0]["id"]) == who[i])
+                return resp
+
+            with RSSSampler() as rss:
+                lat, elapsed, statuses = await post_many(client, checked, args.searches, args.concurrency)
+            extra = {"statuses": statuses}
+            if hits:
+                extra["top1_identity_hit"] = round(sum(hits) / len(hits), 3)
+            results[name] = summarize(lat, elapsed, args.searches, rss.peak, **extra)
+            if main.face_index is not None:
+                main.face_index.ready = ready
+
+        # Ingest last: the sightings it adds have no known identity for the hit check
+        if "ingest" in args.scenarios:
+            frames = [jpeg(ids.frame(ids.rng.integers(0, len(ids.patterns), args.faces_per_frame)))
+                      for _ in range(32)]
+
+            def analyze(c, i):
+                return c.post("/analyze_frame", files={"file": ("f.jpg", frames[i % len(frames)], "image/jpeg")},
+                               data={"cam_id": f"CAM_{i % 8}", "lat": "25.43", "lon": "81.84"})
+
+            with RSSSampler() as rss:
+                lat, elapsed, statuses = await post_many(client, analyze, args.frames, args.concurrency)
+            results["ingest"] = summarize(lat, elapsed, args.frames, rss.peak, statuses=statuses,
+                                          faces_per_s=round(args.frames * args.faces_per_frame / elapsed, 1))
+    if main.embed_batcher is not None:
+        await main.embed_batcher.close()
+
+
+def run_indexer(args, ids, service, client, results):
+    from edge.capture_pipeline import CapturePipeline
+    from edge.face_tracker import FaceTracker
+    from edge.sighting_writer import SightingWriter
+    from embedding_codec import format_vector
+
+    # Synthetic clip: a few people drift across the frame, some frames empty
+    path = os.path.join(tempfile.mkdtemp(prefix="bench_indexer_"), "clip.avi")
+    writer_v = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 30, (FRAME[1], FRAME[0]))
+    people = ids.rng.integers(0, len(ids.patterns), args.faces_per_frame)
+    for i in range(300):
+        writer_v.write(ids.frame(people if (i // 60) % 5 else []))
+    writer_v.release()
+
+    sink = SightingWriter(client, spill_dir=tempfile.mkdtemp(prefix="bench_spill_"))
+    tracker = FaceTracker()
+    lags = []
+
+    def embed_fn(frame):
+        faces = service.detect_faces(frame, enforce_detection=False)
+        embeddings = service.embed_batch([f["face"] for f in faces]) if faces else []
+        return [{"embedding": e, "facial_area": f["facial_area"]} for f, e in zip(faces, embeddings)]
+
+    def on_faces(faces, captured_at):
+        lags.append(time.monotonic() - captured_at)
+        for obj, seen_ts in tracker.update(faces, captured_at):
+            sink.submit({"cam_id": "BENCH", "seen_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(seen_ts)),
+                         "face_vector": format_vector(obj["embedding"])})
+
+    sink.start()
+    pipeline = CapturePipeline("BENCH", path, embed_fn=embed_fn, on_frame=lambda f: None, on_faces=on_faces,
+                               workers=args.indexer_workers, frame_skip=1, resize_width=FRAME[1])
+    with RSSSampler() as rss:
+        pipeline.start()
+        time.sleep(args.indexer_seconds)
+        pipeline.stop()
+        for obj, seen_ts in tracker.flush():
+            sink.submit({"cam_id": "BENCH", "seen_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(seen_ts)),
+                         "face_vector": format_vector(obj["embedding"])})
+        sink.close()
+    stats = pipeline.stats()
+    results["indexer"] = summarize(lags, args.indexer_seconds, len(lags), rss.peak,
+                                   capture_fps=stats["capture"]["fps"],
+                                   inference_fps=stats["inference"]["fps"],
+                                   rows_written=sink.stats()["inserted"],
+                                   dedup_ratio=tracker.stats()["dedup_ratio"])
+
+
+# --- results ---
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def compare(current, path):
+    with open(path) as f:
+        previous = json.load(f)
+    print(f"\n📊 vs {path} ({previous['meta'].get('label')} @ {previous['meta'].get('commit')})")
+    for scenario, metrics in current["results"].items():
+        before = previous["results"].get(scenario)
+        if not before:
+            continue
+        for key, value in metrics.items():
+            old = before.get(key)
+            if key != "count" and isinstance(value, (int, float)) and isinstance(old, (int, float)) and old:
+                print(f"   {scenario:<13} {key:<18} {old:>10} -> {value:>10}  ({(value - old) / old * 100:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=20000, help="Seeded gallery size (sightings)")
+    parser.add_argument("--frames", type=int, default=200, help="/analyze_frame requests")
+    parser.add_argument("--searches", type=int, default=100, help="/search/biometric requests")
+    parser.add_argument("--faces_per_frame", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--scenarios", type=str, default="ingest,search_index,search_rpc,indexer")
+    parser.add_argument("--embedder", choices=["stub", "arcface"], default="stub")
+    parser.add_argument("--stub_call_ms", type=float, default=5.0, help="Simulated per-forward-pass cost")
+    parser.add_argument("--stub_face_ms", type=float, default=10.0, help="Simulated per-face cost")
+    parser.add_argument("--db_latency_ms", type=float, default=0.0, help="Simulated DB round trip")
+    parser.add_argument("--indexer_seconds", type=float, default=5.0)
+    parser.add_argument("--indexer_workers", type=int, default=1)
+    parser.add_argument("--label", type=str, default=None)
+    parser.add_argument("--out", type=str, default=None, help="Results file (default benchmarks/results/<label>.json)")
+    parser.add_argument("--compare", type=str, default=None, help="Earlier results file to diff against")
+    parser.add_argument("--seed", type=int, default=5)
+    args = parser.parse_args()
+    args.scenarios = set(args.scenarios.split(","))
+
+    # Environment for backend/main.py: fake DB, throwaway index directory
+    client = fake_supabase.install(latency_ms=args.db_latency_ms)
+    os.environ.setdefault("SUPABASE_URL", "http://fake-supabase")
+    os.environ.setdefault("SUPABASE_KEY", "fake")
+    os.environ["FACE_INDEX_DIR"] = tempfile.mkdtemp(prefix="bench_face_index_")
+    # Ingest measures raw pipeline capacity; bench_admission.py covers the per-camera gate
+    os.environ.setdefault("ADMISSION", "off")
+
+    ids = Identities(max(args.n // 20, 1), seed=args.seed)
+    service = StubModelService(call_ms=args.stub_call_ms, face_ms=args.stub_face_ms) \
+        if args.embedder == "stub" else ModelService()
+
+    # Seed the gallery: every identity seen ~20 times, embedding-space noise per sighting
+    t0 = time.perf_counter()
+    base = np.stack([service.embed_crop(ids.tile(w, noise=0)) if args.embedder == "stub"
+                     else np.asarray(service.represent(ids.frame([w]), enforce_detection=False)[0]["embedding"])
+                     for w in range(len(ids.patterns))]).astype(np.float32)
+    who = ids.rng.integers(0, len(ids.patterns), args.n)
+    scale = np.linalg.norm(base, axis=1).mean() / np.sqrt(base.shape[1])
+    vecs = base[who] + 0.3 * scale * ids.rng.standard_normal((args.n, base.shape[1])).astype(np.float32)
+    now = time.time()
+    client.seed_sightings(vecs, [f"CAM_{i % 8}" for i in range(args.n)], now - ids.rng.random(args.n) * 86400)
+    identity_of = {i + 1: int(w) for i, w in enumerate(who)}
+    results = {"setup": {"seed_s": round(time.perf_counter() - t0, 2)}}
+
+    import main as api  # noqa: E402  (after the fake supabase module is installed)
+    api.model_service = service
+    if api.embed_batcher is not None:
+        api.embed_batcher.model_service = service
+
+    if args.scenarios - {"indexer"}:
+        asyncio.run(run_api(args, api, ids, identity_of, results))
+    if "indexer" in args.scenarios:
+        run_indexer(args, ids, service, client, results)
+
+    report = {
+        "meta": {
+            "label": args.label, "commit": git_commit(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+            "cpus": os.cpu_count(), "args": {k: sorted(v) if isinstance(v, set) else v for k, v in vars(args).items()},
+        },
+        "results": results,
+    }
+    print(f"\n{'scenario':<14} {'p50 ms':>8} {'p99 ms':>8} {'per s':>9} {'peak RSS MB':>12}")
+    for name, r in results.items():
+        if "p50_ms" in r:
+            print(f"{name:<14} {r['p50_ms']:>8} {r['p99_ms']:>8} {r['throughput_per_s']:>9} {r['peak_rss_mb']:>12}")
+
+    out = args.out or os.path.join(ROOT, "benchmarks", "results",
+                                   f"{args.label or time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Saved {out}")
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
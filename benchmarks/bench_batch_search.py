@@ -0,0 +1,137 @@
+"""
+Cost of N probes as one batch vs N sequential searches.
+
+1. Index only: N x FaceIndex.search() vs one FaceIndex.search_batch() (one
+   rows x probes matmul over the union of probed cells), flat and IVF.
+2. End to end (in-process API on benchmarks/fake_supabase.py, stub model as in
+   bench_api.py): N x POST /search/biometric vs one POST /search/batch with the
+   same N photos. Each sequential call pays its own upload, model pass and search.
+
+    python benchmarks/bench_batch_search.py --n 200000 --probes 1,2,4,8,16
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import bench_api  # noqa: E402  (puts backend/ on the path)
+import fake_supabase  # noqa: E402
+from face_index import FaceIndex, normalize  # noqa: E402
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    return float(np.median(times) * 1000)
+
+
+def index_costs(args, rng):
+    identities = max(args.n // 20, 1)
+    centres = normalize(rng.standard_normal((identities, args.dim)).astype(np.float32))
+    who = rng.integers(0, identities, args.n)
+    vecs = centres[who] + args.noise * rng.standard_normal((args.n, args.dim)).astype(np.float32) / np.sqrt(args.dim)
+    zeros = np.zeros(args.n)
+    print(f"📊 Index: {args.n} vectors")
+    print(f"   {'mode':<5} {'probes':>6} {'sequential':>12} {'batch':>10} {'speed-up':>9}")
+    for mode, train_min in (("flat", args.n + 1), ("ivf", 1)):
+        index = FaceIndex(tempfile.mkdtemp(prefix="batch_bench_"), dim=args.dim, train_min=train_min)
+        index.add_vectors(np.arange(1, args.n + 1), vecs, ["CAM"] * args.n, zeros, zeros, zeros)
+        index.join_training()
+        person = rng.integers(0, identities)
+        for m in args.probes:
+            # Several photos of the same person
+            probes = centres[person] + args.noise * rng.standard_normal((m, args.dim)).astype(np.float32) / np.sqrt(args.dim)
+            seq = best_of(lambda: [index.search(p, args.threshold, args.k) for p in probes], args.repeat)
+            batch = best_of(lambda: index.search_batch(probes, args.threshold, args.k, fuse="max"), args.repeat)
+            print(f"   {mode:<5} {m:>6} {seq:>9.2f} ms {batch:>7.2f} ms {seq / batch:>8.1f}x")
+
+
+async def api_costs(args, api, ids):
+    import httpx
+
+    for handler in api.app.router.on_startup:
+        await handler()
+    while not api.face_index.ready:
+        await asyncio.sleep(0.1)
+    transport = httpx.ASGITransport(app=api.app)
+    print(f"\n📊 API (stub model: {args.stub_call_ms} ms/call + {args.stub_face_ms} ms/face, "
+          f"DB {args.db_latency_ms} ms/round trip)")
+    print(f"   {'probes':>6} {'N x /search/biometric':>22} {'1 x /search/batch':>18} {'speed-up':>9}")
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        for m in args.probes:
+            photos = [bench_api.jpeg(ids.frame([0])) for _ in range(m)]
+
+            async def sequential():
+                for p in photos:
+                    r = await client.post("/search/biometric", files={"file": ("p.jpg", p, "image/jpeg")})
+                    r.raise_for_status()
+
+            async def batch():
+                r = await client.post("/search/batch", files=[("files", (f"{i}.jpg", p, "image/jpeg"))
+                                                              for i, p in enumerate(photos)])
+                r.raise_for_status()
+
+            seq, bat = [], []
+            for _ in range(args.repeat):
+                t = time.perf_counter()
+                await sequential()
+                seq.append(time.perf_counter() - t)
+                t = time.perf_counter()
+                await batch()
+                bat.append(time.perf_counter() - t)
+            seq, bat = np.median(seq) * 1000, np.median(bat) * 1000
+            print(f"   {m:>6} {seq:>19.1f} ms {bat:>15.1f} ms {seq / bat:>8.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--probes", type=str, default="1,2,4,8,16")
+    parser.add_argument("--k", type=int, default=50)
+    parser.add_argument("--threshold", type=float, default=0.45)
+    parser.add_argument("--noise", type=float, default=0.8)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--api_n", type=int, default=20000, help="Gallery size for the API part (0 = skip)")
+    parser.add_argument("--stub_call_ms", type=float, default=5.0)
+    parser.add_argument("--stub_face_ms", type=float, default=10.0)
+    parser.add_argument("--db_latency_ms", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=23)
+    args = parser.parse_args()
+    args.probes = [int(p) for p in args.probes.split(",")]
+
+    rng = np.random.default_rng(args.seed)
+    index_costs(args, rng)
+    if not args.api_n:
+        return
+
+    client = fake_supabase.install(latency_ms=args.db_latency_ms)
+    os.environ.setdefault("SUPABASE_URL", "http://fake-supabase")
+    os.environ.setdefault("SUPABASE_KEY", "fake")
+    os.environ["FACE_INDEX_DIR"] = tempfile.mkdtemp(prefix="batch_bench_api_")
+    os.environ["SEARCH_MAX_PROBES"] = str(max(args.probes))
+    ids = bench_api.Identities(max(args.api_n // 20, 1), seed=args.seed)
+    service = bench_api.StubModelService(call_ms=args.stub_call_ms, face_ms=args.stub_face_ms)
+    base = np.stack([service.embed_crop(ids.tile(w, noise=0)) for w in range(len(ids.patterns))])
+    who = ids.rng.integers(0, len(ids.patterns), args.api_n)
+    scale = np.linalg.norm(base, axis=1).mean() / np.sqrt(base.shape[1])
+    vecs = base[who] + 0.3 * scale * ids.rng.standard_normal((args.api_n, base.shape[1])).astype(np.float32)
+    client.seed_sightings(vecs, [f"CAM_{i % 8}" for i in range(args.api_n)], time.time() - ids.rng.random(args.api_n) * 86400)
+
+    import main as api  # noqa: E402  (after the fake supabase module is installed)
+    api.model_service = service
+    if api.embed_batcher is not None:
+        api.embed_batcher.model_service = service
+    asyncio.run(api_costs(args, api, ids))
+
+
+if __name__ == "__main__":
+    main()
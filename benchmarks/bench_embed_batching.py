@@ -0,0 +1,89 @@
+"""
+Throughput of cross-request micro-batching (backend/embed_batcher.py) vs batch size 1.
+
+Each simulated camera is an async client that repeatedly submits one face crop
+and waits for its embedding, like concurrent /analyze_frame requests. The
+default stub model is a two-layer dense network whose per-call cost (weights
+streamed from memory + fixed dispatch overhead) behaves like a CNN forward
+pass on CPU; --arcface runs the real resident ArcFace model instead.
+
+    python benchmarks/bench_embed_batching.py --concurrency 1,4,16,64
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from embed_batcher import EmbedBatcher  # noqa: E402
+from model_service import ModelService  # noqa: E402
+
+
+class StubModelService(ModelService):
+    """ModelService with a synthetic embedder in place of DeepFace."""
+
+    def __init__(self, overhead_ms=2.0, **kwargs):
+        super().__init__(**kwargs)
+        rng = np.random.default_rng(0)
+        self.input_size = (56, 56)
+        self._w1 = rng.standard_normal((56 * 56 * 3, 2048)).astype(np.float32) / 100
+        self._w2 = rng.standard_normal((2048, 512)).astype(np.float32) / 100
+        self._overhead = overhead_ms / 1000.0
+        self.state = "ready"
+
+    def load(self):
+        pass
+
+    def embed_batch(self, faces):
+        time.sleep(self._overhead)  # framework dispatch / session overhead per forward pass
+        x = np.stack([np.asarray(f, dtype=np.float32)[:56, :56].reshape(-1) for f in faces])
+        return [row.tolist() for row in np.maximum(x @ self._w1, 0) @ self._w2]
+
+
+async def run_level(service, concurrency, requests_per_client, max_batch, max_wait_ms):
+    batcher = EmbedBatcher(service, max_batch=max_batch, max_wait_ms=max_wait_ms)
+    crop = np.random.default_rng(1).random((112, 112, 3)).astype(np.float32)
+    latencies = []
+
+    async def client():
+        for _ in range(requests_per_client):
+            t = time.perf_counter()
+            await batcher.embed([crop])
+            latencies.append(time.perf_counter() - t)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - t0
+    await batcher.close()
+    return len(latencies) / elapsed, np.percentile(latencies, 50) * 1000, batcher.stats()["avg_batch"]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=str, default="1,4,16,64")
+    parser.add_argument("--requests", type=int, default=20, help="Requests per client")
+    parser.add_argument("--max_batch", type=int, default=16)
+    parser.add_argument("--max_wait_ms", type=float, default=5.0)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--overhead_ms", type=float, default=2.0, help="Stub per-call overhead")
+    parser.add_argument("--arcface", action="store_true", help="Use the real ArcFace model")
+    args = parser.parse_args()
+
+    if args.arcface:
+        service = ModelService(workers=args.workers, max_pending=10 ** 6)
+        service.load()
+    else:
+        service = StubModelService(overhead_ms=args.overhead_ms, workers=args.workers, max_pending=10 ** 6)
+
+    print(f"{'clients':>8} {'mode':>8} {'faces/s':>9} {'p50 ms':>8} {'avg batch':>10}")
+    for c in [int(x) for x in args.concurrency.split(",")]:
+        for label, max_batch in (("single", 1), ("batched", args.max_batch)):
+            fps, p50, avg_batch = await run_level(service, c, args.requests, max_batch, args.max_wait_ms)
+            print(f"{c:>8} {label:>8} {fps:>9.1f} {p50:>8.2f} {avg_batch:>10.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,167 @@
+"""
+Bytes-per-sighting, insert-throughput and recall benchmark for the embedding
+codecs (backend/embedding_codec.py) and the quantized face index.
+
+1. Wire size of one sighting: JSON float list (old), compact pgvector text,
+   packed f32/f16/i8, and PQ codes.
+2. Bulk insert hop (edge -> API -> PostgREST body) in batches: JSON float lists
+   end to end vs packed body decoded to compact pgvector text.
+3. Top-k recall of quantized index scans (+ exact rescoring) against f32,
+   checked against the stated tolerance (f16 >= 0.999, i8 >= 0.99 at rescore 4).
+
+    python benchmarks/bench_embedding_codec.py --n 200000 --queries 100
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from embedding_codec import ProductQuantizer, format_vector, pack, unpack  # noqa: E402
+from face_index import FaceIndex, normalize, top_k  # noqa: E402
+
+TOLERANCE = {"f16": 0.999, "i8": 0.99}
+
+
+def gallery(n, dim, noise, rng):
+    identities = max(n // 20, 1)
+    centres = normalize(rng.standard_normal((identities, dim)).astype(np.float32))
+    who = rng.integers(0, identities, n)
+    vecs = centres[who] + noise * rng.standard_normal((n, dim)).astype(np.float32) / np.sqrt(dim)
+    return centres, vecs
+
+
+def wire_sizes(vectors, rng):
+    raw = [v.astype(np.float64) * 3 for v in vectors]  # un-normalised ArcFace-scale floats, as DeepFace returns
+    meta = [{"cam_id": "Gate_1_Entry", "seen_at": "2026-01-14T05:31:07.412345", "lat": 25.4358, "lon": 81.8463}
+            for _ in vectors]
+    n = len(vectors)
+    sizes = {
+        "json float list": sum(len(json.dumps(v.tolist())) for v in raw) / n,
+        "pgvector text (6 sig.)": sum(len(format_vector(v)) for v in raw) / n,
+    }
+    for codec in ("f32", "f16", "i8"):
+        sizes[f"packed {codec} (+meta)"] = len(pack(np.stack(raw), codec, meta)) / n
+    sizes["PQ m=64 (codes only)"] = 64
+    return sizes, raw, meta
+
+
+def insert_throughput(raw, meta, batch):
+    rows_json = [{**m, "face_vector": v.tolist()} for v, m in zip(raw, meta)]
+    matrix = np.stack(raw)
+
+    def legacy(lo, hi):
+        body = json.dumps(rows_json[lo:hi])                       # edge
+        rows = json.loads(body)                                   # API
+        vecs = [np.asarray(r["face_vector"], dtype=np.float32) for r in rows]  # index
+        return json.dumps(rows), vecs                             # PostgREST body
+
+    def packed(lo, hi, codec):
+        body = pack(matrix[lo:hi], codec, meta[lo:hi])            # edge
+        vecs, m = unpack(body)                                    # API
+        rows = [{**mm, "face_vector": format_vector(v)} for v, mm in zip(vecs, m)]
+        return json.dumps(rows), vecs                             # PostgREST body
+
+    results = {}
+    for name, fn in (("json float lists", legacy),
+                     ("packed f16", lambda lo, hi: packed(lo, hi, "f16")),
+                     ("packed i8", lambda lo, hi: packed(lo, hi, "i8"))):
+        t = time.perf_counter()
+        db_bytes = 0
+        for lo in range(0, len(raw), batch):
+            body, _ = fn(lo, min(lo + batch, len(raw)))
+            db_bytes += len(body)
+        elapsed = time.perf_counter() - t
+        results[name] = (len(raw) / elapsed, db_bytes / len(raw))
+    return results
+
+
+def recall(index, probes, truth, k, threshold):
+    hits, total, lat = 0, 0, []
+    for q, t in zip(probes, truth):
+        s = time.perf_counter()
+        got = {m["id"] for m in index.search(q, threshold, k)}
+        lat.append(time.perf_counter() - s)
+        hits += len(got & t)
+        total += len(t)
+    return hits / total if total else 1.0, float(np.percentile(lat, 50) * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=50)
+    parser.add_argument("--threshold", type=float, default=0.45)
+    parser.add_argument("--noise", type=float, default=0.8)
+    parser.add_argument("--batch", type=int, default=50, help="Rows per bulk insert")
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    centres, vecs = gallery(args.n, args.dim, args.noise, rng)
+
+    print("📦 Bytes per sighting")
+    sizes, raw, meta = wire_sizes(vecs[:2000], rng)
+    base = sizes["json float list"]
+    for name, size in sizes.items():
+        print(f"   {name:<24} {size:>9.0f} B  ({base / size:4.1f}x smaller)")
+
+    print(f"\n🚚 Bulk insert hop, batches of {args.batch} (serialise -> parse -> PostgREST body)")
+    for name, (rate, db_bytes) in insert_throughput(raw, meta, args.batch).items():
+        print(f"   {name:<18} {rate:>9.0f} rows/s | DB body {db_bytes:>6.0f} B/row")
+
+    print(f"\n🎯 Index recall@{args.k} vs f32 ({args.n} vectors, flat scan)")
+    who = rng.integers(0, len(centres), args.queries)
+    probes = centres[who] + args.noise * rng.standard_normal((args.queries, args.dim)).astype(np.float32) / np.sqrt(args.dim)
+    ids = np.arange(1, args.n + 1)
+    cams = ["CAM"] * args.n
+    zeros = np.zeros(args.n)
+
+    indexes = {}
+    for codec in ("f32", "f16", "i8"):
+        index = FaceIndex(tempfile.mkdtemp(prefix=f"codec_bench_{codec}_"), dim=args.dim,
+                          train_min=args.n + 1, codec=codec)
+        index.add_vectors(ids, vecs, cams, zeros, zeros, zeros)
+        index.join_training()
+        indexes[codec] = index
+    truth = [{m["id"] for m in indexes["f32"].search(q, args.threshold, args.k)} for q in probes]
+    _, exact_ms = recall(indexes["f32"], probes, truth, args.k, args.threshold)
+    print(f"   {'f32':<14} recall 1.0000 | p50 {exact_ms:6.2f} ms | scan bytes/vector {4 * args.dim}")
+
+    failed = False
+    for codec, per_dim in (("f16", 2), ("i8", 1)):
+        for rescore in (1, 4):
+            indexes[codec].rescore = rescore
+            r, ms = recall(indexes[codec], probes, truth, args.k, args.threshold)
+            print(f"   {codec:<5} rescore {rescore} recall {r:.4f} | p50 {ms:6.2f} ms | scan bytes/vector {per_dim * args.dim}")
+        if r < TOLERANCE[codec]:
+            failed = True
+            print(f"   ❌ {codec} recall {r:.4f} below tolerance {TOLERANCE[codec]}")
+
+    # PQ: ADC shortlist + exact rescore (archive/transport codec, not used by the live index)
+    normed = normalize(vecs)
+    pq = ProductQuantizer(args.dim, m=64).train(normed[rng.choice(args.n, min(args.n, 20000), replace=False)])
+    codes = pq.encode(normed)
+    hits = total = 0
+    for q, t in zip(normalize(probes), truth):
+        short = top_k(pq.scores(q, codes), args.k * 4)
+        sims = normed[short] @ q
+        keep = sims > args.threshold
+        got = set((short[keep][top_k(sims[keep], args.k)] + 1).tolist())
+        hits += len(got & t)
+        total += len(t)
+    print(f"   {'PQ m=64':<14} rescore 4 recall {hits / max(total, 1):.4f} | scan bytes/vector 64")
+
+    if failed:
+        sys.exit(1)
+    print("\n✅ Quantized recall within tolerance")
+
+
+if __name__ == "__main__":
+    main()
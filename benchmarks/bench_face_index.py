@@ -0,0 +1,88 @@
+"""
+Recall-vs-latency benchmark for the in-process face index (backend/face_index.py).
+
+Builds a synthetic gallery of clustered 512-d "identities" (each pilgrim seen
+many times with embedding noise), then compares IVF search at several nprobe
+settings against an exact scan of the same store.
+
+    python benchmarks/bench_face_index.py --n 1000000 --queries 200
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from face_index import FaceIndex, normalize  # noqa: E402
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=1000000, help="Gallery size")
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=50, help="match_count")
+    parser.add_argument("--threshold", type=float, default=0.45, help="match_threshold")
+    parser.add_argument("--noise", type=float, default=0.8, help="Per-sighting embedding noise")
+    parser.add_argument("--nprobe", type=str, default="1,4,8,16,32,64")
+    parser.add_argument("--dir", type=str, default=None, help="Index directory (default: temp)")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    workdir = args.dir or tempfile.mkdtemp(prefix="face_index_bench_")
+    identities = max(args.n // 20, 1)
+    index = FaceIndex(workdir, dim=args.dim, train_min=args.n)
+
+    print(f"📦 Building {args.n} vectors ({identities} identities) in {workdir}")
+    t0 = time.perf_counter()
+    rng = np.random.default_rng(args.seed)
+    centres = normalize(np.random.default_rng(args.seed).standard_normal((identities, args.dim)).astype(np.float32))
+    for start in range(0, args.n, 100000):
+        size = min(100000, args.n - start)
+        who = rng.integers(0, identities, size)
+        vecs = centres[who] + args.noise * rng.standard_normal((size, args.dim)).astype(np.float32) / np.sqrt(args.dim)
+        index.add_vectors(
+            ids=np.arange(start + 1, start + size + 1),
+            vectors=vecs,
+            cam_ids=[f"CAM_{i % 16}" for i in range(size)],
+            seen_ats=np.full(size, time.time()),
+            lats=np.zeros(size),
+            lons=np.zeros(size),
+        )
+    index.join_training()
+    build_s = time.perf_counter() - t0
+    print(f"   build + train: {build_s:.1f}s | cells: {len(index.lists)}")
+
+    # Probes: a fresh noisy photo of a random identity
+    who = rng.integers(0, identities, args.queries)
+    probes = centres[who] + args.noise * rng.standard_normal((args.queries, args.dim)).astype(np.float32) / np.sqrt(args.dim)
+
+    def run(nprobe):
+        results, latencies = [], []
+        for q in probes:
+            t = time.perf_counter()
+            results.append(index.search(q, args.threshold, args.k, nprobe=nprobe))
+            latencies.append(time.perf_counter() - t)
+        return results, latencies
+
+    exact, exact_lat = run(len(index.lists))
+    truth = [{m["id"] for m in r} for r in exact]
+
+    print(f"\n{'nprobe':>8} {'recall@k':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    print(f"{'exact':>8} {1.0:>9.3f} {percentile_ms(exact_lat, 50):>8.2f} {percentile_ms(exact_lat, 99):>8.2f}")
+    for nprobe in [int(x) for x in args.nprobe.split(",")]:
+        approx, lat = run(nprobe)
+        hits = sum(len(t & {m["id"] for m in a}) for t, a in zip(truth, approx))
+        total = sum(len(t) for t in truth) or 1
+        print(f"{nprobe:>8} {hits / total:>9.3f} {percentile_ms(lat, 50):>8.2f} {percentile_ms(lat, 99):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Old vs new face pipeline (backend/model_service.py detect -> filter -> align -> embed).
+
+    old ingest   DeepFace.represent on the full frame: detector over every pixel,
+                 every face aligned and embedded one forward pass at a time, faces
+                 under 40 px thrown away afterwards (indexer.py).
+    new ingest   ModelService.detect_faces + embed_batch: detector on a copy
+                 downscaled to --detect_side, small faces dropped before any
+                 crop is made, survivors embedded in one batch.
+    old search   photo without a detectable face: strict represent raises, then
+                 a lenient represent runs the detector again (search_face).
+    new search   one lenient pass.
+
+The detector and ArcFace are scripted (no deepface needed): detection costs
+--detect_ms_per_mp per megapixel it sees and returns a fixed crowd layout,
+embedding costs --call_ms per forward pass + --face_ms per crop. Alignment is
+the real align_face(). Pass --deepface IMAGE to time the real model on a photo.
+
+    python benchmarks/bench_face_pipeline.py --frames 20
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from model_service import ModelService, align_face  # noqa: E402
+
+# Crowd at 1280x720: (x, y, side). Four usable faces, eight below 40 px
+CROWD = [(100, 120, 96), (400, 150, 72), (700, 100, 64), (1000, 200, 48),
+         (200, 420, 36), (320, 430, 30), (520, 400, 28), (640, 450, 32),
+         (800, 420, 24), (900, 460, 34), (1050, 440, 26), (1150, 480, 20)]
+BASE_WIDTH = 1280
+
+
+class ScriptedModel(ModelService):
+    def __init__(self, faces, detect_ms_per_mp, call_ms, face_ms, **kwargs):
+        super().__init__(**kwargs)
+        self.faces = faces
+        self.detect_s_per_px = detect_ms_per_mp / 1000 / 1e6
+        self.call_s, self.face_s = call_ms / 1000, face_ms / 1000
+        self.state = "ready"
+        self._deepface = self  # extract_faces() below stands in for DeepFace
+        self.counts = {"detector_passes": 0, "embedded": 0}
+
+    def load(self):
+        pass
+
+    def extract_faces(self, img_path, detector_backend=None, enforce_detection=True, align=True):
+        h, w = img_path.shape[:2]
+        time.sleep(self.detect_s_per_px * h * w)
+        self.counts["detector_passes"] += 1
+        if not self.faces:
+            if enforce_detection:
+                raise ValueError("Face could not be detected")
+            return [{"face": img_path, "facial_area": {"x": 0, "y": 0, "w": w, "h": h}, "confidence": 0}]
+        s = w / BASE_WIDTH
+        return [{"facial_area": {"x": int(x * s), "y": int(y * s), "w": int(d * s), "h": int(d * s),
+                                 "left_eye": (int((x + 0.7 * d) * s), int((y + 0.4 * d) * s)),
+                                 "right_eye": (int((x + 0.3 * d) * s), int((y + 0.42 * d) * s))},
+                 "confidence": 0.9} for x, y, d in self.faces]
+
+    def embed_batch(self, faces):
+        time.sleep(self.call_s + self.face_s * len(faces))
+        self.counts["embedded"] += len(faces)
+        return [np.zeros(512, dtype=np.float32) for _ in faces]
+
+    # --- the pre-pipeline behaviour ---
+
+    def old_represent(self, img, enforce_detection=True):
+        found = self.extract_faces(img, enforce_detection=enforce_detection)
+        out = []
+        for f in found:  # DeepFace.represent: align + one forward pass per face
+            crop = align_face(img, f["facial_area"])
+            out.append({"embedding": self.embed_batch([crop])[0], "facial_area": f["facial_area"]})
+        return out
+
+
+def frame(width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+
+
+def timed(fn, frames):
+    times = []
+    for _ in range(frames):
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    return float(np.median(times) * 1000)
+
+
+def scripted(args):
+    print(f"📊 Scripted model: detector {args.detect_ms_per_mp} ms/MP, ArcFace {args.call_ms} ms/call "
+          f"+ {args.face_ms} ms/crop, crowd of {len(CROWD)} faces ({sum(d >= 40 for *_, d in CROWD)} >= 40 px)")
+    print(f"   {'scenario':<28} {'old':>9} {'new':>9} | {'passes':>11} {'embedded':>11}")
+    costs = dict(detect_ms_per_mp=args.detect_ms_per_mp, call_ms=args.call_ms, face_ms=args.face_ms)
+    for label, (w, h) in (("ingest 1280x720 upload", (1280, 720)), ("ingest 640x360 edge", (640, 360))):
+        img = frame(w, h)
+        scale = w / BASE_WIDTH
+        min_face = int(args.min_face * scale)
+        old = ScriptedModel(CROWD, **costs)
+        new = ScriptedModel(CROWD, detect_side=args.detect_side, min_face=min_face, **costs)
+
+        def old_ingest():
+            faces = old.old_represent(img)
+            return [f for f in faces if f["facial_area"]["w"] >= min_face and f["facial_area"]["h"] >= min_face]
+
+        def new_ingest():
+            faces = new.detect_faces(img)
+            return new.embed_batch([f["face"] for f in faces])
+
+        t_old, t_new = timed(old_ingest, args.frames), timed(new_ingest, args.frames)
+        print(f"   {label:<28} {t_old:>6.1f} ms {t_new:>6.1f} ms | "
+              f"{old.counts['detector_passes'] // args.frames:>4} -> {new.counts['detector_passes'] // args.frames:<4} "
+              f"{old.counts['embedded'] // args.frames:>4} -> {new.counts['embedded'] // args.frames:<4}")
+
+    img = frame(1280, 720)
+    old = ScriptedModel([], **costs)
+    new = ScriptedModel([], detect_side=args.detect_side, **costs)
+
+    def old_search():
+        try:
+            return old.old_represent(img, enforce_detection=True)
+        except ValueError:
+            return old.old_represent(img, enforce_detection=False)
+
+    t_old = timed(old_search, args.frames)
+    t_new = timed(lambda: new.represent(img, enforce_detection=False, min_face=0), args.frames)
+    print(f"   {'search, no detectable face':<28} {t_old:>6.1f} ms {t_new:>6.1f} ms | "
+          f"{old.counts['detector_passes'] // args.frames:>4} -> {new.counts['detector_passes'] // args.frames:<4} "
+          f"{old.counts['embedded'] // args.frames:>4} -> {new.counts['embedded'] // args.frames:<4}")
+
+
+def real(args):
+    import cv2
+    from deepface import DeepFace
+
+    img = cv2.imread(args.deepface)
+    service = ModelService(detect_side=args.detect_side, min_face=args.min_face)
+    service.load()
+    old = timed(lambda: DeepFace.represent(img_path=img, model_name="ArcFace", detector_backend="opencv",
+                                           enforce_detection=False), args.frames)
+    new = timed(lambda: service.represent(img, enforce_detection=False), args.frames)
+    print(f"📊 DeepFace on {args.deepface} {img.shape[1]}x{img.shape[0]}: "
+          f"old {old:.1f} ms | new {new:.1f} ms ({service.stats()['too_small']} small faces dropped)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=20)
+    parser.add_argument("--detect_side", type=int, default=640)
+    parser.add_argument("--min_face", type=int, default=40, help="At 1280 px; scaled for smaller frames")
+    parser.add_argument("--detect_ms_per_mp", type=float, default=60.0)
+    parser.add_argument("--call_ms", type=float, default=5.0)
+    parser.add_argument("--face_ms", type=float, default=10.0)
+    parser.add_argument("--deepface", type=str, default=None, help="Photo to run the real model on")
+    args = parser.parse_args()
+    if args.deepface:
+        real(args)
+    else:
+        scripted(args)
+
+
+if __name__ == "__main__":
+    main()
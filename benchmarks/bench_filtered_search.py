@@ -0,0 +1,135 @@
+"""
+Latency of spatio-temporal filtered search (backend/face_index.py SearchFilter).
+
+Builds a synthetic gallery spread over `--days` of history and `--cams` cameras
+laid out on a grid around the Sangam, then runs the same probes with filters of
+decreasing width. Each filter is answered two ways:
+
+* partitioned  - FaceIndex.search(where=...): only (hour, camera) partitions
+                 that can match are gathered and scanned.
+* post-filter  - the old shape: global search for the top `--k * 20` rows,
+                 then drop rows outside the filter (and lose recall for
+                 narrow filters).
+
+Recall is measured against an exact scan of just the rows matching the filter.
+
+    python benchmarks/bench_filtered_search.py --n 500000 --queries 50
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from face_index import FaceIndex, SearchFilter, normalize, top_k  # noqa: E402
+
+CENTRE = (25.4358, 81.8463)
+
+
+def build(args, rng):
+    identities = max(args.n // 20, 1)
+    centres = normalize(rng.standard_normal((identities, args.dim)).astype(np.float32))
+    index = FaceIndex(tempfile.mkdtemp(prefix="filtered_search_bench_"), dim=args.dim, train_min=args.n)
+    side = int(np.ceil(np.sqrt(args.cams)))
+    cam_gps = {f"CAM_{c}": (CENTRE[0] + (c // side - side / 2) * 0.005, CENTRE[1] + (c % side - side / 2) * 0.005)
+               for c in range(args.cams)}
+    now = time.time()
+    for start in range(0, args.n, 100000):
+        size = min(100000, args.n - start)
+        who = rng.integers(0, identities, size)
+        vecs = centres[who] + args.noise * rng.standard_normal((size, args.dim)).astype(np.float32) / np.sqrt(args.dim)
+        cams = [f"CAM_{c}" for c in rng.integers(0, args.cams, size)]
+        index.add_vectors(
+            ids=np.arange(start + 1, start + size + 1), vectors=vecs, cam_ids=cams,
+            seen_ats=np.sort(now - rng.random(size) * args.days * 86400),
+            lats=[cam_gps[c][0] for c in cams], lons=[cam_gps[c][1] for c in cams],
+        )
+    index.join_training()
+    return index, centres, cam_gps, now
+
+
+def filters(args, cam_gps, now):
+    day, hour = 86400, 3600
+    some = [f"CAM_{c}" for c in range(0, args.cams, 4)]
+    lat, lon = cam_gps["CAM_0"]
+    return [
+        ("none", SearchFilter()),
+        (f"last {args.days // 2} days", SearchFilter(since=now - args.days // 2 * day)),
+        ("last day", SearchFilter(since=now - day)),
+        (f"last day, {len(some)} cams", SearchFilter(since=now - day, cam_ids=some)),
+        ("bbox ~1 km, last day", SearchFilter(since=now - day, bbox=(lat - 0.006, lon - 0.006, lat + 0.006, lon + 0.006))),
+        ("last hour", SearchFilter(since=now - hour)),
+        ("1 cam, last hour", SearchFilter(since=now - hour, cam_ids=["CAM_0"])),
+    ]
+
+
+def exact(index, query, where, args):
+    """Ground truth: brute force over every row, filter applied row by row on the metadata."""
+    n = index.store.count
+    meta = np.asarray(index.store.meta[:n])
+    keep = np.ones(n, dtype=bool)
+    if where.since is not None:
+        keep &= meta["seen_at"] >= where.since
+    if where.until is not None:
+        keep &= meta["seen_at"] < where.until
+    if where.cam_ids is not None:
+        keep &= np.isin(meta["cam"], [index.store.cams.index(c) for c in where.cam_ids if c in index.store.cams])
+    if where.bbox is not None:
+        keep &= (meta["lat"] >= where.bbox[0]) & (meta["lat"] <= where.bbox[2]) \
+            & (meta["lon"] >= where.bbox[1]) & (meta["lon"] <= where.bbox[3])
+    rows = np.nonzero(keep)[0]
+    sims = np.asarray(index.store.vectors[rows]) @ query
+    rows, sims = rows[sims > args.threshold], sims[sims > args.threshold]
+    return {int(meta["id"][rows[i]]) for i in top_k(sims, args.k)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=500000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--cams", type=int, default=40)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=50)
+    parser.add_argument("--threshold", type=float, default=0.45)
+    parser.add_argument("--noise", type=float, default=0.8)
+    parser.add_argument("--seed", type=int, default=17)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    t0 = time.perf_counter()
+    index, centres, cam_gps, now = build(args, rng)
+    print(f"📦 {args.n} vectors, {args.cams} cams, {args.days} days -> {len(index.partition_boxes)} partitions, "
+          f"{len(index.lists)} IVF cells ({time.perf_counter() - t0:.1f}s)")
+
+    probes = normalize(centres[rng.integers(0, len(centres), args.queries)]
+                       + args.noise * rng.standard_normal((args.queries, args.dim)).astype(np.float32) / np.sqrt(args.dim))
+
+    print(f"\n{'filter':<24} {'rows':>9} | {'partitioned p50':>15} {'recall':>7} | {'post-filter p50':>15} {'recall':>7}")
+    for name, where in filters(args, cam_gps, now):
+        rows = index.store.count if not where else len(index._filtered_rows(where))
+        part_lat, post_lat, part_hits, post_hits, total = [], [], 0, 0, 0
+        for q in probes:
+            truth = exact(index, q, where, args)
+            s = time.perf_counter()
+            got = {m["id"] for m in index.search(q, args.threshold, args.k, where=where)}
+            part_lat.append(time.perf_counter() - s)
+
+            s = time.perf_counter()
+            wide = index.search(q, args.threshold, args.k * 20)
+            post = {m["id"] for m in [m for m in wide if where.matches(m)][:args.k]}
+            post_lat.append(time.perf_counter() - s)
+
+            part_hits += len(got & truth)
+            post_hits += len(post & truth)
+            total += len(truth)
+        recall = (lambda h: h / total if total else 1.0)
+        print(f"{name:<24} {rows:>9} | {np.percentile(part_lat, 50) * 1000:>12.2f} ms {recall(part_hits):>7.3f} "
+              f"| {np.percentile(post_lat, 50) * 1000:>12.2f} ms {recall(post_hits):>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
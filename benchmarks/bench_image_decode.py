@@ -0,0 +1,86 @@
+"""
+Per-frame cost of the old temp-file upload path vs in-memory decode (backend/image_io.py).
+
+    disk    write upload to frame_<ts>.jpg -> cv2.imread -> os.remove   (what DeepFace did with a path)
+    memory  cv2.imdecode straight from the request bytes
+    reduced in-memory decode bounded to --max_side during JPEG decode
+
+Reports wall-clock p50/p99 and process CPU per frame for a few upload sizes.
+Pass --embed to include DeepFace ArcFace end to end (needs deepface installed).
+
+    python benchmarks/bench_image_decode.py --frames 200
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from image_io import decode_image  # noqa: E402
+
+SIZES = {"vga": (640, 480), "1080p": (1920, 1080), "phone": (4000, 3000)}
+
+
+def synthetic_jpeg(width, height, seed=0):
+    """Photo-like content (gradients + noise) so the JPEG is not trivially compressible."""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:height, 0:width]
+    base = np.stack([(xx * 255 // width), (yy * 255 // height), ((xx + yy) * 127 // (width + height))], axis=-1)
+    img = np.clip(base + rng.normal(0, 20, base.shape), 0, 255).astype(np.uint8)
+    ok, buf = cv2.imencode(".jpg", img, [int(cv2.IMWRITE_JPEG_QUALITY), 90])
+    return buf.tobytes()
+
+
+def disk_path(data, workdir, embed):
+    path = os.path.join(workdir, f"frame_{time.time_ns()}.jpg")
+    with open(path, "wb") as f:
+        f.write(data)
+    img = embed(path) if embed else cv2.imread(path)
+    os.remove(path)
+    return img
+
+
+def embed_arcface(img):
+    from deepface import DeepFace
+    return DeepFace.represent(img_path=img, model_name="ArcFace", detector_backend="opencv", enforce_detection=False)
+
+
+def measure(fn, frames):
+    walls = []
+    cpu0 = time.process_time()
+    for _ in range(frames):
+        t = time.perf_counter()
+        fn()
+        walls.append(time.perf_counter() - t)
+    cpu = (time.process_time() - cpu0) / frames
+    return np.percentile(walls, 50) * 1000, np.percentile(walls, 99) * 1000, cpu * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--max_side", type=int, default=1280)
+    parser.add_argument("--embed", action="store_true", help="Run ArcFace on each decoded frame")
+    args = parser.parse_args()
+
+    embed = embed_arcface if args.embed else None
+    workdir = tempfile.mkdtemp(prefix="decode_bench_")
+    print(f"{'size':>7} {'path':>8} {'p50 ms':>8} {'p99 ms':>8} {'cpu ms':>8}")
+    for name, (w, h) in SIZES.items():
+        data = synthetic_jpeg(w, h)
+        paths = {
+            "disk": lambda: disk_path(data, workdir, embed),
+            "memory": lambda: (embed or (lambda x: x))(decode_image(data)),
+            "reduced": lambda: (embed or (lambda x: x))(decode_image(data, args.max_side)),
+        }
+        for label, fn in paths.items():
+            p50, p99, cpu = measure(fn, args.frames)
+            print(f"{name:>7} {label:>8} {p50:>8.2f} {p99:>8.2f} {cpu:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Retention: hot table + index before and after compacting aged segments into
+the cold archive (backend/sighting_archive.py).
+
+Seeds `--hours` of sightings on benchmarks/fake_supabase.py: each visit is one
+person in front of one camera for `--dwell` detections, 10 s apart (what a
+gate camera without edge dedup produces). The API module is imported with
+RETENTION_HOURS=--hot_hours, the index synced, then one retention pass runs.
+
+Reports rows / index vectors / bytes before and after, compaction
+throughput, search latency for a recent window (hot only) and an unbounded
+window (hot + archive), how many of a target person's archived visits an
+unbounded search still finds, and checks that a fresh stats aggregator seeded
+from the rollups counts exactly what a full recount of the original rows does.
+
+    python benchmarks/bench_retention.py --visits 20000 --dwell 6 --hours 48 --hot_hours 12
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+import fake_supabase  # noqa: E402
+from face_index import normalize  # noqa: E402
+from sighting_stats import SightingStats, recount  # noqa: E402
+from timeutils import parse_timestamp  # noqa: E402
+
+
+def du(path):
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+
+
+def median_ms(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    return float(np.median(times) * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--visits", type=int, default=20000)
+    parser.add_argument("--dwell", type=int, default=6, help="Detections per visit, 10 s apart")
+    parser.add_argument("--people", type=int, default=2000)
+    parser.add_argument("--cams", type=int, default=8)
+    parser.add_argument("--hours", type=float, default=48)
+    parser.add_argument("--hot_hours", type=float, default=12)
+    parser.add_argument("--segment_hours", type=float, default=6)
+    parser.add_argument("--codec", choices=("i8", "pq"), default="i8")
+    parser.add_argument("--threshold", type=float, default=0.45)
+    parser.add_argument("--k", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--train_min", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=22)
+    args = parser.parse_args()
+
+    client = fake_supabase.install()
+    work = tempfile.mkdtemp(prefix="retention_bench_")
+    os.environ.update({
+        "SUPABASE_URL": "http://fake-supabase", "SUPABASE_KEY": "fake",
+        "FACE_INDEX_DIR": os.path.join(work, "index"), "ARCHIVE_DIR": os.path.join(work, "archive"),
+        "RETENTION_HOURS": str(args.hot_hours), "ARCHIVE_SEGMENT_SECONDS": str(int(args.segment_hours * 3600)),
+        "ARCHIVE_CODEC": args.codec, "SEARCH_CACHE": "off",
+        # IVF before and after, as at festival scale (the default 20000 would flip the hot index to flat)
+        "FACE_INDEX_TRAIN_MIN": str(args.train_min),
+    })
+
+    # Visits: (person, camera, start); dwell detections per visit with per-frame noise
+    rng = np.random.default_rng(args.seed)
+    dim = 512
+    now = time.time()
+    centres = normalize(rng.standard_normal((args.people, dim)).astype(np.float32))
+    person = rng.integers(0, args.people, args.visits)
+    cam = rng.integers(0, args.cams, args.visits)
+    start = now - rng.random(args.visits) * args.hours * 3600
+    person[:20], start[:20] = 0, now - np.linspace(1, args.hours, 20) * 3600  # the target, spread over time
+    rows = args.visits * args.dwell
+    who = np.repeat(person, args.dwell)
+    seen = np.repeat(start, args.dwell) + np.tile(np.arange(args.dwell) * 10.0, args.visits)
+    vecs = centres[who] + 0.6 * rng.standard_normal((rows, dim)).astype(np.float32) / np.sqrt(dim)
+    order = np.argsort(seen)  # ids follow time, as at ingest
+    cams = [f"CAM_{c}" for c in np.repeat(cam, args.dwell)[order]]
+    client.seed_sightings(vecs[order], cams, seen[order])
+    original = [dict(r) for r in client.tables["sightings"]]
+
+    import main as api  # noqa: E402  (after the fake supabase module is installed)
+
+    api.retention.start = lambda interval=None: None  # the pass below is run by hand
+
+    async def startup():
+        for handler in api.app.router.on_startup:
+            await handler()
+    asyncio.run(startup())
+    while not (api.face_index.ready and api.sighting_stats.ready):
+        time.sleep(0.1)
+
+    probe = centres[0] + 0.6 * rng.standard_normal(dim).astype(np.float32) / np.sqrt(dim)
+    recent = api.SearchFilter(since=now - args.hot_hours * 3600 / 2)
+    target_visits = start[:20] < api.retention.horizon(now)
+
+    def measure():
+        return {
+            "rows": len(client.tables["sightings"]),
+            "index": len(api.face_index),
+            "hot_mb": len(api.face_index) * (4 * dim + 28) / 1e6,  # float32 vector + metadata per hot row
+            "archive_mb": du(os.environ["ARCHIVE_DIR"]) / 1e6,
+            "recent_ms": median_ms(lambda: api.find_matches(probe, args.threshold, args.k, recent), args.repeat),
+            "all_ms": median_ms(lambda: api.find_matches(probe, args.threshold, args.k), args.repeat),
+            "found": api.find_matches(probe, args.threshold, args.k),
+        }
+
+    before = measure()
+    # Time compaction itself apart from the fake DB's filtered page reads
+    compact, compact_s = api.sighting_archive.compact, [0.0]
+
+    def timed_compact(*a, **kw):
+        t0 = time.perf_counter()
+        part = compact(*a, **kw)
+        compact_s[0] += time.perf_counter() - t0
+        return part
+    api.sighting_archive.compact = timed_compact
+    api.retention.max_segments = 10 ** 6
+    t = time.perf_counter()
+    archived = api.retention.run_once(now)
+    total_s = time.perf_counter() - t
+    after = measure()
+
+    def old_visits(found):
+        """Distinct archived-window visits of the target among the results."""
+        hit = set()
+        for m in found:
+            ts = parse_timestamp(m["seen_at"])
+            for v in np.nonzero(target_visits)[0]:
+                if start[v] - 1 <= ts <= start[v] + args.dwell * 10:
+                    hit.add(int(v))
+        return len(hit)
+
+    print(f"📊 {rows} sightings ({args.visits} visits x {args.dwell}) over {args.hours:g} h, "
+          f"{args.hot_hours:g} h hot, {args.segment_hours:g} h segments, codec {args.codec}")
+    print(f"   archived {archived} rows -> {api.sighting_archive.stats()['tracks']} tracks: compaction "
+          f"{compact_s[0]:.1f} s ({archived / compact_s[0]:,.0f} rows/s), whole pass incl. fake DB {total_s:.1f} s")
+    print(f"   {'':<26} {'before':>10} {'after':>10}")
+    for label, key, fmt in (("sightings table rows", "rows", "{:>10}"), ("index vectors", "index", "{:>10}"),
+                            ("hot vectors + meta (MB)", "hot_mb", "{:>10.1f}"),
+                            ("archive on disk (MB)", "archive_mb", "{:>10.1f}"),
+                            ("search, recent window", "recent_ms", "{:>7.2f} ms"),
+                            ("search, unbounded", "all_ms", "{:>7.2f} ms")):
+        print(f"   {label:<26} " + fmt.format(before[key]) + " " + fmt.format(after[key]))
+    print(f"   target's archived-window visits found: {old_visits(before['found'])} -> "
+          f"{old_visits(after['found'])} of {int(target_visits.sum())}")
+
+    fresh = SightingStats(base_bucket=api.sighting_stats.base_bucket)
+    fresh.add_rollups(api.sighting_archive.rollups(fresh.base_bucket))
+    fresh.sync(client)
+    exact = recount(original, fresh.base_bucket)
+    same = {c: dict(b) for c, b in fresh._counts.items()} == exact
+    print(f"   stats after restart: total {fresh.total} (archived {fresh.archived}) | "
+          f"per-bucket counts {'match' if same else 'DIFFER FROM'} a full recount")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Repeat-search latency with the search cache (backend/search_cache.py).
+
+Simulates an active case: the same probe photo is uploaded to
+/search/biometric every round while new sightings keep arriving through
+/sightings/bulk (some of them the missing person). Each round times
+
+* cold  - cache cleared: decode + detect + embed + full gallery scan
+* warm  - cached embedding + cached top-k, scanning only the sightings
+          added since the last search, merged
+
+and checks the warm answer against a full uncached search (same ids).
+In-process API on benchmarks/fake_supabase.py with the stub model from
+bench_api.py. --backend rpc turns the in-process index off (FACE_INDEX=off)
+so the refresh goes through match_faces_filtered(after_id).
+
+    python benchmarks/bench_search_cache.py --n 200000 --rounds 5 --new 2000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import bench_api  # noqa: E402  (puts backend/ on the path)
+import fake_supabase  # noqa: E402
+from embedding_codec import pack  # noqa: E402
+from image_io import decode_image  # noqa: E402
+
+
+async def run(args, api, service, ids, base, scale, client):
+    import httpx
+
+    for handler in api.app.router.on_startup:
+        await handler()
+    while api.face_index is not None and not api.face_index.ready:
+        await asyncio.sleep(0.1)
+    api.sighting_stats.sync(client)
+
+    target = 0
+    photo = bench_api.jpeg(ids.frame([target]))
+    probe = service.represent(decode_image(photo, api.DECODE_MAX_SIDE), enforce_detection=False, min_face=0)[0]
+    form = {"threshold": str(args.threshold), "top_k": str(args.k)}
+    transport = httpx.ASGITransport(app=api.app)
+    print(f"📊 {args.backend}: {args.n} sightings, +{args.new} per round "
+          f"(stub model {args.stub_call_ms} ms/call + {args.stub_face_ms} ms/face)")
+    print(f"   {'round':>5} {'gallery':>9} | {'cold':>9} {'warm':>9} {'speed-up':>9} | {'same top-k':>10}")
+    cold_all, warm_all = [], []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as http:
+        async def search():
+            t = time.perf_counter()
+            r = await http.post("/search/biometric", data=form, files={"file": ("p.jpg", photo, "image/jpeg")})
+            r.raise_for_status()
+            return (time.perf_counter() - t) * 1000, r.json()["matches"]
+
+        api.search_cache.clear()
+        await search()  # prime
+        for rnd in range(1, args.rounds + 1):
+            # New sightings since the last search; ~5% of them are the target
+            who = np.where(ids.rng.random(args.new) < 0.05, target, ids.rng.integers(0, len(base), args.new))
+            vecs = base[who] + 0.3 * scale * ids.rng.standard_normal((args.new, base.shape[1])).astype(np.float32)
+            meta = [{"cam_id": f"CAM_{i % 8}"} for i in range(args.new)]
+            r = await http.post("/sightings/bulk", content=pack(vecs, "f16", meta))
+            r.raise_for_status()
+            api.sighting_stats.sync(client)  # the background stats sync (RPC watermark)
+
+            warm, got = await search()
+            full = api.find_matches(probe["embedding"], args.threshold, args.k,
+                                    after=0 if api.face_index is None else None)
+            same = {m["id"] for m in got} == {m["id"] for m in full}
+            api.search_cache.clear()
+            cold, _ = await search()
+            cold_all.append(cold)
+            warm_all.append(warm)
+            print(f"   {rnd:>5} {args.n + rnd * args.new:>9} | {cold:>6.1f} ms {warm:>6.1f} ms "
+                  f"{cold / warm:>8.1f}x | {'yes' if same else 'NO':>10}")
+    print(f"   median: cold {np.median(cold_all):.1f} ms, warm {np.median(warm_all):.1f} ms")
+    print(f"   cache: {api.search_cache.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=200000)
+    parser.add_argument("--new", type=int, default=2000, help="Sightings added between searches")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--backend", choices=("index", "rpc"), default="index")
+    parser.add_argument("--threshold", type=float, default=0.45)
+    parser.add_argument("--k", type=int, default=50)
+    parser.add_argument("--stub_call_ms", type=float, default=5.0)
+    parser.add_argument("--stub_face_ms", type=float, default=10.0)
+    parser.add_argument("--db_latency_ms", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=29)
+    args = parser.parse_args()
+
+    client = fake_supabase.install(latency_ms=args.db_latency_ms)
+    os.environ.setdefault("SUPABASE_URL", "http://fake-supabase")
+    os.environ.setdefault("SUPABASE_KEY", "fake")
+    os.environ["FACE_INDEX_DIR"] = tempfile.mkdtemp(prefix="search_cache_bench_")
+    os.environ["FACE_INDEX"] = "on" if args.backend == "index" else "off"
+    os.environ["SEARCH_CACHE"] = "on"
+
+    ids = bench_api.Identities(max(args.n // 20, 1), seed=args.seed)
+    service = bench_api.StubModelService(call_ms=args.stub_call_ms, face_ms=args.stub_face_ms)
+    base = np.stack([service.embed_crop(ids.tile(w, noise=0)) for w in range(len(ids.patterns))])
+    who = ids.rng.integers(0, len(ids.patterns), args.n)
+    scale = np.linalg.norm(base, axis=1).mean() / np.sqrt(base.shape[1])
+    vecs = base[who] + 0.3 * scale * ids.rng.standard_normal((args.n, base.shape[1])).astype(np.float32)
+    client.seed_sightings(vecs, [f"CAM_{i % 8}" for i in range(args.n)], time.time() - ids.rng.random(args.n) * 86400)
+
+    import main as api  # noqa: E402  (after the fake supabase module is installed)
+    api.model_service = service
+    if api.embed_batcher is not None:
+        api.embed_batcher.model_service = service
+    asyncio.run(run(args, api, service, ids, base, scale, client))
+
+
+if __name__ == "__main__":
+    main()
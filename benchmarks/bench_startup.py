@@ -0,0 +1,149 @@
+"""
+Cold start of the API and the indexer CLI, as guards against startup regressions.
+
+* import        - `import main` in a fresh interpreter (median of --repeat), next
+                  to a bare interpreter, and which heavy modules it pulled in
+                  (supabase, deepface, tensorflow must stay out of the import path)
+* indexer CLI   - `indexer.py --help`: argument parsing before any heavy import
+* first request - uvicorn started on backend/main.py with a persisted face index
+                  of --n vectors and an unreachable DB; time until GET / answers,
+                  and until the index has been loaded from disk and trained
+
+No secrets are needed: SUPABASE_URL points at a closed local port. --backend runs
+the same measurements against another checkout (e.g. a git worktree of an older
+commit) for before/after numbers. --max_import_ms / --max_first_request_ms make
+the run exit non-zero when exceeded.
+
+    python benchmarks/bench_startup.py --n 200000
+    python benchmarks/bench_startup.py --max_import_ms 1500 --max_first_request_ms 3000
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+HEAVY = ("supabase", "deepface", "tensorflow", "uvicorn")
+
+IMPORT_PROBE = """
+import json, sys, time
+t = time.perf_counter()
+import main
+print(json.dumps({"ms": (time.perf_counter() - t) * 1000, "heavy": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY,)
+
+
+def wall_ms(cmd, cwd, env):
+    t = time.perf_counter()
+    subprocess.run(cmd, cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+    return (time.perf_counter() - t) * 1000
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def get_json(url):
+    try:
+        with urllib.request.urlopen(url, timeout=1) as r:
+            return json.loads(r.read())
+    except OSError:
+        return None
+
+
+def build_index(path, n, seed):
+    """A persisted index as a restarted API finds it on its volume."""
+    sys.path.insert(0, os.path.join(ROOT, "backend"))
+    from face_index import FaceIndex
+    rng = np.random.default_rng(seed)
+    index = FaceIndex(path, train_min=10 ** 9)  # train in the API process, as on a real start
+    for s in range(0, n, 50000):
+        m = min(50000, n - s)
+        index.add_vectors(list(range(s + 1, s + m + 1)), rng.standard_normal((m, 512)).astype(np.float32),
+                          [f"CAM_{i % 8}" for i in range(m)], time.time() - rng.random(m) * 86400,
+                          [0.0] * m, [0.0] * m)
+    index.store.flush()
+
+
+def first_request(backend, env, n, timeout):
+    port = free_port()
+    t = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+                            cwd=backend, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    first = loaded = None
+    try:
+        while time.perf_counter() - t < timeout:
+            health = get_json(f"http://127.0.0.1:{port}/")
+            if health is not None:
+                first = first or (time.perf_counter() - t) * 1000
+                index = health.get("face_index")
+                # Older trees have no face_index block in health: the index was loaded before serving
+                if index is None or (index["vectors"] >= n and index["cells"]):
+                    loaded = (time.perf_counter() - t) * 1000 if index is not None else first
+                    break
+            time.sleep(0.01 if first is None else 0.1)  # light polling once up (one CPU is shared)
+    finally:
+        proc.terminate()
+        proc.wait()
+    return first, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", default=os.path.join(ROOT, "backend"), help="backend/ directory to measure")
+    parser.add_argument("--n", type=int, default=200000, help="Vectors in the persisted face index")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--max_import_ms", type=float, default=None)
+    parser.add_argument("--max_first_request_ms", type=float, default=None)
+    parser.add_argument("--seed", type=int, default=24)
+    args = parser.parse_args()
+    backend = os.path.abspath(args.backend)
+
+    work = tempfile.mkdtemp(prefix="startup_bench_")
+    env = {**os.environ, "SUPABASE_URL": "http://127.0.0.1:9", "SUPABASE_KEY": "unused",
+           "FACE_INDEX_DIR": os.path.join(work, "index"), "ARCHIVE_DIR": os.path.join(work, "archive"),
+           "PYTHONDONTWRITEBYTECODE": "1"}
+    build_index(env["FACE_INDEX_DIR"], args.n, args.seed)
+
+    bare = np.median([wall_ms([sys.executable, "-c", "pass"], backend, env) for _ in range(args.repeat)])
+    probes = []
+    for _ in range(args.repeat):
+        out = subprocess.run([sys.executable, "-c", IMPORT_PROBE], cwd=backend, env=env,
+                             capture_output=True, text=True, check=True).stdout
+        probes.append(json.loads(out.strip().splitlines()[-1]))
+    import_ms = float(np.median([p["ms"] for p in probes]))
+    indexer = os.path.join(backend, "..", "indexer.py")
+    cli_ms = np.median([wall_ms([sys.executable, indexer, "--help"], backend, env) for _ in range(args.repeat)])
+    first, loaded = first_request(backend, env, args.n, args.timeout)
+
+    print(f"📊 startup of {backend} (index {args.n} vectors, DB unreachable)")
+    print(f"   bare interpreter         {bare:>8.0f} ms")
+    print(f"   import main              {import_ms:>8.0f} ms   heavy modules imported: {probes[0]['heavy'] or 'none'}")
+    print(f"   indexer.py --help        {cli_ms:>8.0f} ms   (wall, incl. interpreter)")
+    print(f"   GET / first answered     {first:>8.0f} ms   (wall from spawn)" if first else "   GET / never answered")
+    print(f"   face index loaded+trained{loaded:>8.0f} ms" if loaded else "   face index not loaded in time")
+
+    failures = []
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        failures.append(f"import main {import_ms:.0f} ms > {args.max_import_ms:.0f} ms")
+    if args.max_first_request_ms is not None and (first is None or first > args.max_first_request_ms):
+        failures.append(f"first request {first} ms > {args.max_first_request_ms:.0f} ms")
+    if set(probes[0]["heavy"]) & {"supabase", "deepface", "tensorflow"}:
+        failures.append(f"heavy modules on the import path: {probes[0]['heavy']}")
+    for f in failures:
+        print(f"❌ {f}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Cost of scoring ingested faces against the watchlist (backend/watchlist.py).
+
+For each watchlist size, a frame of `--faces` faces is scored with one
+Watchlist.match() call (one faces x probes product) and compared with the
+naive shape: one dot product per (face, probe) pair in Python. Every frame
+contains one face of a watchlisted person, so the hit rate doubles as a
+correctness check (false alerts are strangers scoring above the threshold).
+
+    python benchmarks/bench_watchlist.py --sizes 100,1000,5000,10000 --faces 1,4,16
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from face_index import normalize  # noqa: E402
+from watchlist import Watchlist  # noqa: E402
+
+
+def median_ms(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    return float(np.median(times) * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=str, default="100,1000,5000,10000")
+    parser.add_argument("--faces", type=str, default="1,4,16")
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--probes_per_person", type=int, default=3)
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--noise", type=float, default=0.8)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--naive_max", type=int, default=1000, help="Skip the Python loop above this many probes")
+    parser.add_argument("--seed", type=int, default=19)
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(",")]
+    face_counts = [int(f) for f in args.faces.split(",")]
+
+    rng = np.random.default_rng(args.seed)
+    jitter = lambda n: args.noise * rng.standard_normal((n, args.dim)).astype(np.float32) / np.sqrt(args.dim)  # noqa: E731
+
+    print(f"{'probes':>7} {'faces':>5} | {'match()':>9} {'per face':>9} | {'naive':>9} | {'hit rate':>8} {'false':>6}")
+    for size in sizes:
+        people = max(size // args.probes_per_person, 1)
+        centres = normalize(rng.standard_normal((people, args.dim)).astype(np.float32))
+        wl = Watchlist(dim=args.dim, threshold=args.threshold, cooldown=0)
+        for p in range(people):
+            wl.add(f"person-{p}", centres[p] + jitter(args.probes_per_person))
+        matrix = wl._snapshot.matrix
+        for faces in face_counts:
+            # One watchlisted face among strangers
+            target = int(rng.integers(0, people))
+            frame = np.concatenate([centres[target] + jitter(1),
+                                    normalize(rng.standard_normal((faces - 1, args.dim)).astype(np.float32))])
+            fast = median_ms(lambda: wl.match(frame), args.repeat)
+            naive = "-"
+            if wl.size <= args.naive_max:
+                naive = f"{median_ms(lambda: [[float(f @ p) for p in matrix] for f in frame], 3):7.2f}ms"
+
+            hits = wl.match(frame)
+            found = any(label == f"person-{target}" for _, label, _ in hits[0])
+            false = sum(len(h) for h in hits[1:]) + sum(label != f"person-{target}" for _, label, _ in hits[0])
+            print(f"{wl.size:>7} {faces:>5} | {fast:7.3f}ms {fast / faces:7.3f}ms | {naive:>9} | "
+                  f"{'yes' if found else 'MISS':>8} {false:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Parity check: ModelService.embed_batch() vs DeepFace.represent() on the same crops.
+
+The API and the indexer embed aligned crops in batches through the Keras model
+directly (backend/model_service.py) instead of calling DeepFace.represent()
+per face. The embeddings must stay interchangeable with the gallery that
+DeepFace produced, so this feeds each crop both ways and asserts cosine ~ 1:
+
+* batched   - embed_batch([crop, ...]) (one forward pass)
+* deepface  - DeepFace.represent(crop, detector_backend="skip"), which runs the
+              same per-face steps it applies after its own detector: channel
+              flip, resize + pad, normalisation, forward pass
+
+Crops come from --images (faces found by the detector, as on the ingest path)
+plus synthetic crops of odd aspect ratios to exercise the padding. The cosine
+of a channel-swapped input is printed alongside, to show the check would catch
+a colour-order mistake. Needs deepface (and TensorFlow) installed.
+
+    python benchmarks/check_embed_parity.py --images probe.jpg crowd.jpg
+"""
+import argparse
+import os
+import sys
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from model_service import ModelService, fit_to_input  # noqa: E402
+
+
+def cosine(a, b):
+    a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+    return float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+
+def synthetic_crops(rng, n):
+    """Photo-like RGB crops (0..1) of varied size and aspect ratio."""
+    crops = []
+    for _ in range(n):
+        h, w = int(rng.integers(60, 300)), int(rng.integers(60, 300))
+        yy, xx = np.mgrid[0:h, 0:w]
+        base = np.stack([xx / w, yy / h, (xx + yy) / (w + h)], axis=-1)
+        crops.append(np.clip(base + rng.normal(0, 0.08, base.shape), 0, 1).astype(np.float32))
+    return crops
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", nargs="*", default=[], help="Photos to take face crops from")
+    parser.add_argument("--synthetic", type=int, default=8, help="Synthetic crops to add")
+    parser.add_argument("--model", default="ArcFace")
+    parser.add_argument("--detector", default="opencv")
+    parser.add_argument("--min_cosine", type=float, default=0.999)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    model = ModelService(model_name=args.model, detector_backend=args.detector, min_face=0)
+    model.load()
+    crops = []
+    for path in args.images:
+        img = cv2.imread(path)
+        if img is None:
+            parser.error(f"cannot read {path}")
+        faces = model.detect_faces(img, enforce_detection=False)
+        crops += [f["face"] for f in faces]
+        print(f"   {path}: {len(faces)} crop(s)")
+    crops += synthetic_crops(np.random.default_rng(args.seed), args.synthetic)
+
+    from deepface import DeepFace
+    batched = model.embed_batch(crops)
+    worst = 1.0
+    for i, (crop, embedding) in enumerate(zip(crops, batched)):
+        reference = DeepFace.represent(img_path=crop, model_name=args.model, detector_backend="skip",
+                                       enforce_detection=False, align=False)[0]["embedding"]
+        swapped = model._keras.predict(fit_to_input(crop[:, :, ::-1], model.input_size)[None], verbose=0)[0]
+        sim = cosine(embedding, reference)
+        worst = min(worst, sim)
+        print(f"   crop {i:>2} {crop.shape[1]:>4}x{crop.shape[0]:<4} cosine {sim:.6f}   "
+              f"(channel-swapped input: {cosine(swapped, reference):.4f})")
+
+    assert worst >= args.min_cosine, f"embed_batch diverges from DeepFace.represent: cosine {worst:.6f}"
+    print(f"✅ embed_batch matches DeepFace.represent on {len(crops)} crops (worst cosine {worst:.6f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+"""
+In-process stand-in for the parts of the supabase client the backend and
+indexer use, for offline benchmarks.
+
+    client.table(name).select(cols, count=...).eq/gt/lt/gte/lte/or_(...).order(...).limit(n).execute()
+    client.table(name).insert(rows) / upsert(rows) / update(values).eq(...) / delete().in_(...).execute()
+    client.rpc("match_faces", {query_embedding, match_threshold, match_count}).execute()
+    client.rpc("match_faces_filtered", {..., since, until, cam_ids, min_lat, ...}).execute()
+
+`match_faces` is the numpy equivalent of the SQL function in db_setup.sql
+(cosine similarity over every stored face_vector). Sighting vectors live in one
+growable float32 matrix; `face_vector` is returned as that numpy row rather than
+pgvector text, so syncing large galleries does not benchmark string formatting.
+
+`latency_ms` adds a fixed sleep to every execute() to model the network round trip.
+
+Install it before importing backend/main.py:
+
+    import fake_supabase
+    client = fake_supabase.install()
+"""
+import bisect
+import sys
+import threading
+import time
+import types
+from datetime import datetime
+
+import numpy as np
+
+from face_index import parse_vector, normalize, SearchFilter
+from timeutils import parse_timestamp
+
+TIME_COLUMNS = {"seen_at", "last_heartbeat"}
+
+
+class Result:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+def _coerce(column, value):
+    if value is None:
+        return None
+    if column in TIME_COLUMNS:
+        return parse_timestamp(value)
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return value
+    return value
+
+
+OPS = {
+    "eq": lambda a, b: a == b,
+    "gt": lambda a, b: a is not None and a > b,
+    "lt": lambda a, b: a is not None and a < b,
+    "gte": lambda a, b: a is not None and a >= b,
+    "lte": lambda a, b: a is not None and a <= b,
+}
+
+
+def _split(expr):
+    """Top-level comma split of a PostgREST logic expression."""
+    terms, depth, start = [], 0, 0
+    for i, ch in enumerate(expr):
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            terms.append(expr[start:i])
+            start = i + 1
+    terms.append(expr[start:])
+    return [t.strip() for t in terms]
+
+
+def _predicate(term):
+    """`col.op.value`, `and(...)` or `or(...)` -> row predicate."""
+    for group, combine in (("and(", all), ("or(", any)):
+        if term.startswith(group) and term.endswith(")"):
+            parts = [_predicate(t) for t in _split(term[len(group):-1])]
+            return lambda row: combine(p(row) for p in parts)
+    column, op, value = term.split(".", 2)
+    return lambda row: OPS[op](_coerce(column, row.get(column)), _coerce(column, value))
+
+
+class Query:
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.action = "select"
+        self.columns = None
+        self.count_mode = None
+        self.payload = None
+        self.filters = []
+        self.orders = []
+        self.max_rows = None
+        self.id_floor = None  # gt("id", x): start from an id bisect instead of a full scan
+
+    # --- builders ---
+
+    def select(self, columns="*", count=None):
+        self.columns = None if columns.strip() == "*" else [c.strip() for c in columns.split(",")]
+        self.count_mode = count
+        return self
+
+    def insert(self, rows):
+        self.action, self.payload = "insert", rows
+        return self
+
+    def upsert(self, rows):
+        self.action, self.payload = "upsert", rows
+        return self
+
+    def update(self, values):
+        self.action, self.payload = "update", values
+        return self
+
+    def delete(self):
+        self.action = "delete"
+        return self
+
+    def _filter(self, op, column, value):
+        self.filters.append(lambda row: OPS[op](_coerce(column, row.get(column)), _coerce(column, value)))
+        return self
+
+    def eq(self, column, value):
+        return self._filter("eq", column, value)
+
+    def gt(self, column, value):
+        if column == "id" and self.id_floor is None:
+            self.id_floor = int(value)
+        return self._filter("gt", column, value)
+
+    def lt(self, column, value):
+        return self._filter("lt", column, value)
+
+    def gte(self, column, value):
+        return self._filter("gte", column, value)
+
+    def lte(self, column, value):
+        return self._filter("lte", column, value)
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def or_(self, expr):
+        self.filters.append(_predicate(f"or({expr})"))
+        return self
+
+    def order(self, column, desc=False):
+        self.orders.append((column, desc))
+        return self
+
+    def limit(self, n):
+        self.max_rows = n
+        return self
+
+    # --- execution ---
+
+    def execute(self):
+        self.db.round_trip()
+        with self.db.lock:
+            if self.action == "insert":
+                return Result(self.db.insert(self.table, self.payload))
+            if self.action == "upsert":
+                return Result(self.db.upsert(self.table, self.payload))
+            rows = self.db.tables.setdefault(self.table, [])
+            if self.id_floor is not None and self.table in self.db.ids:
+                rows = rows[bisect.bisect_right(self.db.ids[self.table], self.id_floor):]
+            rows = [r for r in rows if all(f(r) for f in self.filters)]
+            if self.action == "update":
+                for r in rows:
+                    r.update(self.payload)
+                return Result([dict(r) for r in rows])
+            if self.action == "delete":
+                return Result(self.db.delete(self.table, rows))
+            for column, desc in reversed(self.orders):
+                rows.sort(key=lambda r: (r.get(column) is None, _coerce(column, r.get(column))), reverse=desc)
+            count = len(rows) if self.count_mode else None
+            if self.max_rows is not None:
+                rows = rows[:self.max_rows]
+            return Result([self.db.project(self.table, r, self.columns) for r in rows], count)
+
+
+class RPC:
+    def __init__(self, db, name, params):
+        self.db, self.name, self.params = db, name, params
+
+    def execute(self):
+        self.db.round_trip()
+        if self.name == "match_faces":
+            return Result(self.db.match_faces(**self.params))
+        if self.name == "match_faces_filtered":
+            p = dict(self.params)
+            box = [p.pop(k) for k in ("min_lat", "min_lon", "max_lat", "max_lon")]
+            where = SearchFilter(p.pop("since"), p.pop("until"), p.pop("cam_ids"),
+                                 box if box[0] is not None else None)
+            return Result(self.db.match_faces(**p, where=where))
+        raise RuntimeError(f"Unknown RPC {self.name}")
+
+
+class FakeSupabase:
+    def __init__(self, latency_ms=0.0, dim=512):
+        self.latency = latency_ms / 1000.0
+        self.dim = dim
+        self.lock = threading.RLock()
+        self.tables = {}
+        self.next_id = {}
+        self.ids = {}  # table -> ascending ids, for tables whose ids are all auto-assigned
+        self.vectors = np.zeros((1024, dim), dtype=np.float32)  # normalised, row = sighting index
+        self.vector_rows = 0
+        self.vector_owner = []  # sightings row for each vector row
+        self.calls = 0
+
+    # --- client API ---
+
+    def table(self, name):
+        return Query(self, name)
+
+    def rpc(self, name, params):
+        return RPC(self, name, params)
+
+    # --- storage ---
+
+    def round_trip(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _append_vector(self, vector, row):
+        if self.vector_rows == self.vectors.shape[0]:
+            self.vectors = np.concatenate([self.vectors, np.zeros_like(self.vectors)])
+        self.vectors[self.vector_rows] = normalize(parse_vector(vector, self.dim))
+        self.vector_owner.append(row)
+        self.vector_rows += 1
+        return self.vector_rows - 1
+
+    def insert(self, table, rows):
+        rows = rows if isinstance(rows, list) else [rows]
+        out = []
+        for row in rows:
+            row = dict(row)
+            if "id" not in row:
+                row["id"] = self.next_id[table] = self.next_id.get(table, 0) + 1
+                if table not in self.tables or table in self.ids:
+                    self.ids.setdefault(table, []).append(row["id"])
+            else:
+                self.ids.pop(table, None)
+            if table == "sightings":
+                row.setdefault("lat", 0.0)
+                row.setdefault("lon", 0.0)
+                if row.get("face_vector") is not None:
+                    row["_vec"] = self._append_vector(row.pop("face_vector"), row)
+            self.tables.setdefault(table, []).append(row)
+            out.append(self.project(table, row, None))
+        return out
+
+    def upsert(self, table, rows):
+        rows = rows if isinstance(rows, list) else [rows]
+        existing = {r["id"]: r for r in self.tables.setdefault(table, [])}
+        out = []
+        for row in rows:
+            if row["id"] in existing:
+                existing[row["id"]].update(row)
+                out.append(dict(existing[row["id"]]))
+            else:
+                out += self.insert(table, [row])
+        return out
+
+    def delete(self, table, rows):
+        gone = {id(r) for r in rows}
+        self.tables[table] = [r for r in self.tables.get(table, []) if id(r) not in gone]
+        if table in self.ids:
+            self.ids[table] = [r["id"] for r in self.tables[table]]
+        out = []
+        for r in rows:
+            if "_vec" in r:
+                self.vectors[r["_vec"]] = 0.0  # never scores above a threshold again
+            out.append(self.project(table, r, None))
+        return out
+
+    def project(self, table, row, columns):
+        def value(column):
+            if column == "face_vector":
+                return self.vectors[row["_vec"]] if "_vec" in row else None
+            return row.get(column)
+        names = columns or [c for c in row if c != "_vec"] + (["face_vector"] if "_vec" in row else [])
+        return {c: value(c) for c in names}
+
+    def seed_sightings(self, vectors, cam_ids, seen_ats, lats=None, lons=None):
+        """Bulk-load a synthetic gallery without per-row insert overhead."""
+        n = len(vectors)
+        with self.lock:
+            while self.vectors.shape[0] < self.vector_rows + n:
+                self.vectors = np.concatenate([self.vectors, np.zeros_like(self.vectors)])
+            self.vectors[self.vector_rows:self.vector_rows + n] = normalize(vectors)
+            rows = self.tables.setdefault("sightings", [])
+            start = self.next_id.get("sightings", 0)
+            for i in range(n):
+                row = {
+                    "id": start + i + 1, "cam_id": cam_ids[i],
+                    "seen_at": datetime.utcfromtimestamp(seen_ats[i]).isoformat(),
+                    "lat": lats[i] if lats is not None else 0.0,
+                    "lon": lons[i] if lons is not None else 0.0,
+                    "_vec": self.vector_rows + i,
+                }
+                rows.append(row)
+                self.vector_owner.append(row)
+            if start == 0 or "sightings" in self.ids:
+                self.ids.setdefault("sightings", []).extend(range(start + 1, start + n + 1))
+            self.next_id["sightings"] = start + n
+            self.vector_rows += n
+
+    # --- RPC ---
+
+    def match_faces(self, query_embedding, match_threshold, match_count, where=None, after_id=None):
+        query = normalize(parse_vector(query_embedding, self.dim))
+        with self.lock:
+            sims = self.vectors[:self.vector_rows] @ query
+            owners = self.vector_owner
+        keep = np.nonzero(sims > match_threshold)[0]
+        if after_id is not None:
+            keep = np.array([i for i in keep if owners[i]["id"] > after_id], dtype=np.int64)
+        if where is not None:
+            # Full scan then filter, as Postgres does without a vector index
+            keep = np.array([i for i in keep if where.matches(owners[i])], dtype=np.int64)
+        best = keep[np.argsort(-sims[keep])[:match_count]]
+        # match_faces_filtered also returns the sighting id
+        return [{
+            **({"id": owners[i]["id"]} if where is not None else {}), "cam_id": owners[i]["cam_id"], "seen_at": owners[i]["seen_at"],
+            "lat": owners[i]["lat"], "lon": owners[i]["lon"], "similarity": float(sims[i]),
+        } for i in best]
+
+
+def install(latency_ms=0.0):
+    """Register a fake `supabase` module whose create_client() returns one shared FakeSupabase."""
+    client = FakeSupabase(latency_ms=latency_ms)
+    module = types.ModuleType("supabase")
+    module.create_client = lambda url, key: client
+    module.Client = FakeSupabase
+    sys.modules["supabase"] = module
+    return client
+
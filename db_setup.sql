@@ -7,7 +7,10 @@ create extension if not exists vector;
 -- 2. Drop EVERYTHING related to our app (Clean Slate)
 drop table if exists sightings cascade;
 drop table if exists camera_nodes cascade;
+drop table if exists watch_alerts cascade;
+drop table if exists watchlist cascade;
 drop function if exists match_faces cascade;
+drop function if exists match_faces_filtered cascade;
 
 -- 3. Re-create 'sightings' for ArcFace (512 Dimensions)
 -- 3. Re-create 'sightings' with Geotagging
@@ -58,4 +61,76 @@ begin
   order by sightings.face_vector <=> query_embedding
   limit match_count;
 end;
-$$;
\ No newline at end of file
+$$;
+-- 6. Filtered search: time window, camera set and/or GPS box (null = no restriction)
+create index if not exists sightings_seen_at_idx on sightings (seen_at);
+create index if not exists sightings_cam_seen_at_idx on sightings (cam_id, seen_at);
+
+create or replace function match_faces_filtered (
+  query_embedding vector(512),
+  match_threshold float,
+  match_count int,
+  since timestamp default null,
+  until timestamp default null,
+  cam_ids text[] default null,
+  min_lat float default null,
+  min_lon float default null,
+  max_lat float default null,
+  max_lon float default null,
+  after_id bigint default null  -- only sightings newer than this id (cached search refresh)
+)
+returns table (
+  id bigint,
+  cam_id text,
+  seen_at timestamp,
+  lat float,
+  lon float,
+  similarity float
+)
+language plpgsql
+as $$
+begin
+  return query
+  select
+    sightings.id,
+    sightings.cam_id,
+    sightings.seen_at,
+    sightings.lat,
+    sightings.lon,
+    1 - (sightings.face_vector <=> query_embedding) as similarity
+  from sightings
+  where (since is null or sightings.seen_at >= since)
+    and (until is null or sightings.seen_at < until)
+    and (cam_ids is null or sightings.cam_id = any(cam_ids))
+    and (min_lat is null or sightings.lat between min_lat and max_lat)
+    and (min_lon is null or sightings.lon between min_lon and max_lon)
+    and (after_id is null or sightings.id > after_id)
+    and 1 - (sightings.face_vector <=> query_embedding) > match_threshold
+  order by sightings.face_vector <=> query_embedding
+  limit match_count;
+end;
+$$;
+
+-- 7. Watchlist: one row per probe embedding (several photos may share a label)
+create table watchlist (
+  id bigserial primary key,
+  label text not null,
+  notes text,
+  threshold float,            -- null = WATCHLIST_THRESHOLD
+  probe_vector vector(512),
+  active boolean default true,
+  created_at timestamp default now()
+);
+
+-- 8. Alerts raised when an ingested face matches a watchlist probe
+create table watch_alerts (
+  id bigserial primary key,
+  watch_id bigint references watchlist(id),
+  label text,
+  similarity float,
+  cam_id text,
+  seen_at timestamp,
+  lat float default 0.0,
+  lon float default 0.0
+);
+create index if not exists watch_alerts_seen_at_idx on watch_alerts (seen_at, id);
@@ -0,0 +1,12 @@
+"""
+Edge node components for indexer.py (capture, ingestion, streaming).
+
+Modules shared with the API (backend/*.py) are flat imports there, so put the
+backend directory on the path once for every edge module.
+"""
+import os
+import sys
+
+_BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+if _BACKEND_DIR not in sys.path:
+    sys.path.append(_BACKEND_DIR)
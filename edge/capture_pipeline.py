@@ -0,0 +1,285 @@
+"""
+Staged capture -> inference -> sink pipeline for one camera.
+
+    capture thread   cap.read() + resize, overwrites a single "latest frame" slot.
+                     Never waits on ML, so RTSP buffers do not back up.
+    inference pool   N workers; each claims the NEWEST eligible frame nobody has
+                     claimed yet. Eligibility comes from an AdaptiveScheduler
+                     (motion + load gated, edge/motion_gate.py) or, without one,
+                     a fixed every-`frame_skip`-th-frame stride. Frames that went
+                     stale while workers were busy are skipped, never queued.
+    sink thread      draws the most recent detections on every display frame,
+                     publishes it to the stream, and hands faces to the DB writer.
+
+Every stage keeps a StageMeter (throughput + lag) exposed via `stats()`.
+
+With a shared InferencePool (edge/stream_supervisor.py) the pipeline starts no
+inference threads of its own; the pool's workers claim frames from every
+camera's slot in turn.
+"""
+import threading
+import time
+from collections import deque
+
+import cv2
+
+
+class StageMeter:
+    """Cheap per-stage counters: total items, EWMA rate and EWMA lag."""
+
+    def __init__(self, alpha=0.1):
+        self.alpha = alpha
+        self.count = 0
+        self.skipped = 0
+        self.fps = 0.0
+        self.lag_ms = 0.0
+        self._last = None
+        self._lock = threading.Lock()
+
+    def tick(self, lag_s=None):
+        now = time.monotonic()
+        with self._lock:
+            self.count += 1
+            if self._last is not None:
+                dt = now - self._last
+                if dt > 0:
+                    self.fps += self.alpha * (1.0 / dt - self.fps)
+            self._last = now
+            if lag_s is not None:
+                self.lag_ms += self.alpha * (lag_s * 1000 - self.lag_ms)
+
+    def skip(self, n=1):
+        with self._lock:
+            self.skipped += n
+
+    def snapshot(self):
+        return {"count": self.count, "fps": round(self.fps, 2),
+                "lag_ms": round(self.lag_ms, 1), "skipped": self.skipped}
+
+
+class FrameSlot:
+    """Single-slot mailbox holding only the freshest frame (seq, frame, captured_at),
+    plus the freshest frame marked eligible for inference."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._frame = None
+        self._ts = 0.0
+        self._eligible = None    # (seq, frame, captured_at)
+        self._unclaimed = 0      # eligible frames put since the last claim
+        self._claimed = 0
+
+    def put(self, frame, eligible=True):
+        with self._cond:
+            self._seq += 1
+            self._frame = frame
+            self._ts = time.monotonic()
+            if eligible:
+                self._eligible = (self._seq, frame, self._ts)
+                self._unclaimed += 1
+            self._cond.notify_all()
+
+    def nbytes(self):
+        with self._cond:
+            frames = {id(f): f for f in (self._frame, self._eligible and self._eligible[1]) if f is not None}
+        return sum(getattr(f, "nbytes", 0) for f in frames.values())
+
+    def wait_newer(self, seq, timeout=1.0):
+        """Newest frame with seq > `seq` (for observers like the sink), or None on timeout."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._seq > seq, timeout):
+                return None
+            return self._seq, self._frame, self._ts
+
+    def claim(self, stride=1, timeout=1.0):
+        """Exclusive claim of the newest eligible frame at least `stride` eligible frames
+        past the last claim (for workers). Returns (seq, frame, captured_at, skipped) or None on timeout."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._unclaimed >= stride, timeout):
+                return None
+            # Inference slots that went stale while every worker was busy
+            skipped = self._unclaimed // stride - 1 if self._claimed else 0
+            seq, frame, ts = self._eligible
+            self._claimed = seq
+            self._unclaimed = 0
+            return seq, frame, ts, max(skipped, 0)
+
+
+class CapturePipeline:
+    def __init__(self, cam_id, source, embed_fn, on_frame, on_faces,
+                 workers=1, frame_skip=5, resize_width=640, overlay_ttl=1.0, scheduler=None,
+                 pool=None, reconnect_min=1.0, reconnect_max=60.0):
+        """
+        embed_fn(frame) -> [{"embedding": [...], "facial_area": {...}}, ...]
+        on_frame(annotated_frame)   called by the sink for every display frame
+        on_faces(faces, frame_ts)   called by the sink once per inference result (possibly empty)
+        scheduler                   optional AdaptiveScheduler; replaces the fixed frame_skip
+        pool                        optional shared InferencePool; replaces the own `workers`
+        reconnect_min/max           exponential reconnect backoff bounds (seconds)
+        """
+        self.cam_id = cam_id
+        self.source = source
+        self.embed_fn = embed_fn
+        self.on_frame = on_frame
+        self.on_faces = on_faces
+        self.workers = workers
+        self.frame_skip = frame_skip
+        self.resize_width = resize_width
+        self.overlay_ttl = overlay_ttl
+        self.scheduler = scheduler
+        self.pool = pool
+        self.reconnect_min = reconnect_min
+        self.reconnect_max = reconnect_max
+        self.online = False
+        self.reconnects = 0
+
+        self.frames = FrameSlot()
+        self._results = deque()  # (captured_at, faces) awaiting the sink
+        self._results_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+        self.meters = {"capture": StageMeter(), "inference": StageMeter(), "sink": StageMeter()}
+
+    # --- lifecycle ---
+
+    def start(self):
+        targets = [("capture", self._capture_loop), ("sink", self._sink_loop)]
+        if self.pool:
+            self.pool.attach(self)
+        else:
+            targets += [(f"infer-{i}", self._inference_loop) for i in range(self.workers)]
+        for name, target in targets:
+            t = threading.Thread(target=target, name=f"{self.cam_id}-{name}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self.pool:
+            self.pool.detach(self)
+        for t in self._threads:
+            t.join(timeout=5)
+
+    def memory_bytes(self):
+        """Frame buffers held by this pipeline (latest, eligible, pending results)."""
+        with self._results_lock:
+            pending = sum(len(faces) for _, faces in self._results)
+        # Pending faces carry a python-float embedding list (~32 bytes per value)
+        return self.frames.nbytes() + pending * 512 * 32
+
+    def stats(self):
+        stats = {stage: meter.snapshot() for stage, meter in self.meters.items()}
+        stats["online"] = self.online
+        stats["reconnects"] = self.reconnects
+        if self.scheduler:
+            stats["scheduler"] = self.scheduler.stats()
+        return stats
+
+    # --- stages ---
+
+    def _resize(self, frame):
+        height, width = frame.shape[:2]
+        scale = self.resize_width / width
+        return cv2.resize(frame, (self.resize_width, int(height * scale)))
+
+    def _capture_loop(self):
+        meter = self.meters["capture"]
+        backoff = self.reconnect_min
+        while not self._stop.is_set():
+            cap = cv2.VideoCapture(self.source)
+            if not cap.isOpened():
+                print(f"⚠️ {self.cam_id}: connection failed. Retrying in {backoff:.0f}s...")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, self.reconnect_max)
+                continue
+
+            print(f"✅ Camera {self.cam_id} Online. ML Engine Started.")
+            while not self._stop.is_set():
+                t0 = time.monotonic()
+                ret, frame = cap.read()
+                if not ret:
+                    print(f"❌ {self.cam_id}: stream ended/interrupted.")
+                    break
+                if not self.online:
+                    # A stream that delivers frames again starts a fresh backoff sequence
+                    self.online = True
+                    backoff = self.reconnect_min
+                frame = self._resize(frame)
+                eligible = self.scheduler.should_infer(frame) if self.scheduler else True
+                self.frames.put(frame, eligible)
+                if eligible and self.pool:
+                    self.pool.notify()
+                meter.tick(time.monotonic() - t0)
+
+            cap.release()
+            self.online = False
+            if not self._stop.is_set():
+                self.reconnects += 1
+                print(f"🔄 {self.cam_id}: reconnecting in {backoff:.0f}s...")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, self.reconnect_max)
+
+    def claim(self, timeout=1.0):
+        """Claim the next frame to run inference on (own workers or a shared pool)."""
+        stride = 1 if self.scheduler else self.frame_skip
+        return self.frames.claim(stride=stride, timeout=timeout)
+
+    def infer(self, claimed):
+        """Run embed_fn on a claimed frame and queue the result for the sink."""
+        meter = self.meters["inference"]
+        _, frame, captured_at, skipped = claimed
+        if skipped:
+            meter.skip(skipped)
+        t0 = time.monotonic()
+        try:
+            faces = self.embed_fn(frame)
+        except Exception as e:
+            print(f"⚠️ Indexing Error ({self.cam_id}): {e}")
+            return
+        if self.scheduler:
+            self.scheduler.observe(len(faces), time.monotonic() - t0)
+        with self._results_lock:
+            self._results.append((captured_at, faces))
+        meter.tick(time.monotonic() - captured_at)
+
+    def _inference_loop(self):
+        while not self._stop.is_set():
+            claimed = self.claim(timeout=1.0)
+            if claimed is not None:
+                self.infer(claimed)
+
+    def _sink_loop(self):
+        meter = self.meters["sink"]
+        seq = 0
+        overlay, overlay_ts = [], 0.0
+        while not self._stop.is_set():
+            # 1. DB output for every finished inference
+            with self._results_lock:
+                pending = list(self._results)
+                self._results.clear()
+            for captured_at, faces in sorted(pending, key=lambda r: r[0]):
+                self.on_faces(faces, captured_at)
+                if captured_at >= overlay_ts:
+                    overlay, overlay_ts = faces, captured_at
+
+            # 2. Annotate + publish the freshest display frame
+            item = self.frames.wait_newer(seq, timeout=0.5)
+            if item is None:
+                continue
+            seq, frame, captured_at = item
+            frame = frame.copy()
+            if time.monotonic() - overlay_ts < self.overlay_ttl:
+                annotate(frame, overlay)
+            self.on_frame(frame)
+            meter.tick(time.monotonic() - captured_at)
+
+
+def annotate(frame, faces):
+    for face in faces:
+        area = face["facial_area"]
+        x, y, w, h = int(area['x']), int(area['y']), int(area['w']), int(area['h'])
+        cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
+        cv2.putText(frame, "TARGET", (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
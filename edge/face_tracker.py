@@ -0,0 +1,156 @@
+"""
+Lightweight per-camera face tracker for sighting deduplication.
+
+Someone standing at a gate is detected on every inference frame. Instead of
+one 512-d row per detection, detections are associated into tracks by box IoU
+and embedding similarity, and each track emits ONE representative sighting:
+the detection with the best quality (face area x detector confidence).
+
+A track emits when it ends (unseen for `max_age` seconds) and, if
+`refresh_interval` is set, periodically while it stays in view, so long
+dwell times still produce fresh rows for search. Ends are noticed by update()
+and by expire(), which the sink calls on every display frame: with the motion
+gate skipping a static scene, the next inference can be seconds away.
+"""
+import itertools
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+def iou(a, b):
+    ax2, ay2 = a['x'] + a['w'], a['y'] + a['h']
+    bx2, by2 = b['x'] + b['w'], b['y'] + b['h']
+    iw = max(0, min(ax2, bx2) - max(a['x'], b['x']))
+    ih = max(0, min(ay2, by2) - max(a['y'], b['y']))
+    inter = iw * ih
+    union = a['w'] * a['h'] + b['w'] * b['h'] - inter
+    return inter / union if union > 0 else 0.0
+
+
+def unit(vector):
+    v = np.asarray(vector, dtype=np.float32)
+    n = np.linalg.norm(v)
+    return v / n if n else v
+
+
+class Track:
+    _ids = itertools.count(1)
+
+    def __init__(self, face, ts, wall_ts):
+        self.id = next(Track._ids)
+        self.box = face["facial_area"]
+        self.embedding = unit(face["embedding"])
+        self.last_seen = ts
+        self.window_start = ts
+        self.hits = 0
+        self.best = None  # (quality, face, wall_ts)
+        self.observe(face, ts, wall_ts)
+
+    def observe(self, face, ts, wall_ts):
+        area = face["facial_area"]
+        quality = area['w'] * area['h'] * float(face.get("face_confidence") or 1.0)
+        if self.best is None or quality > self.best[0]:
+            self.best = (quality, face, wall_ts)
+        self.box = area
+        # Running mean keeps association robust to one blurry frame
+        self.embedding = unit(0.7 * self.embedding + 0.3 * unit(face["embedding"]))
+        self.last_seen = ts
+        self.hits += 1
+
+
+class FaceTracker:
+    def __init__(self, iou_min=0.3, sim_min=0.5, max_age=2.0, refresh_interval=30.0):
+        self.iou_min = iou_min
+        self.sim_min = sim_min
+        self.max_age = max_age
+        self.refresh_interval = refresh_interval
+        self.tracks = []
+        self._lock = threading.Lock()
+        self._started = deque()  # creation times, for tracks/minute
+        self.counters = {"detections": 0, "emitted": 0, "tracks": 0}
+
+    def update(self, faces, ts=None):
+        """Associate one inference result. Returns representative faces to persist:
+        [(face, wall_ts), ...] where face is the original DeepFace dict."""
+        ts = time.monotonic() if ts is None else ts
+        wall_ts = time.time() - (time.monotonic() - ts)
+        with self._lock:
+            self.counters["detections"] += len(faces)
+            unmatched = list(range(len(faces)))
+
+            # Greedy association, best (IoU + similarity) pairs first
+            pairs = []
+            for ti, track in enumerate(self.tracks):
+                for fi, face in enumerate(faces):
+                    overlap = iou(track.box, face["facial_area"])
+                    sim = float(track.embedding @ unit(face["embedding"]))
+                    # Same place and not clearly someone else, or clearly the same face anywhere
+                    if (overlap >= self.iou_min and sim >= self.sim_min / 2) or sim >= self.sim_min:
+                        pairs.append((overlap + sim, ti, fi))
+            used_tracks = set()
+            for _, ti, fi in sorted(pairs, reverse=True):
+                if ti in used_tracks or fi not in unmatched:
+                    continue
+                self.tracks[ti].observe(faces[fi], ts, wall_ts)
+                used_tracks.add(ti)
+                unmatched.remove(fi)
+
+            for fi in unmatched:
+                self.tracks.append(Track(faces[fi], ts, wall_ts))
+                self.counters["tracks"] += 1
+                self._started.append(ts)
+
+            return self._expire(ts)
+
+    def expire(self, now=None):
+        """Close tracks unseen for `max_age` (and refresh long-lived ones) without a new
+        inference result. Returns representative faces like update()."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if not self.tracks:
+                return []
+            return self._expire(now)
+
+    def _expire(self, ts):
+        # Close stale tracks, refresh long-lived ones (caller holds the lock)
+        emitted = []
+        alive = []
+        for track in self.tracks:
+            if ts - track.last_seen > self.max_age:
+                if track.best is not None:
+                    emitted.append(track.best[1:])
+                continue
+            if self.refresh_interval and ts - track.window_start >= self.refresh_interval:
+                if track.best is not None:
+                    emitted.append(track.best[1:])
+                # Next window picks its own best detection
+                track.best = None
+                track.window_start = ts
+            alive.append(track)
+        self.tracks = alive
+        self.counters["emitted"] += len(emitted)
+        return emitted
+
+    def flush(self):
+        """Emit every open track (shutdown)."""
+        with self._lock:
+            emitted = [t.best[1:] for t in self.tracks if t.best is not None]
+            self.tracks = []
+            self.counters["emitted"] += len(emitted)
+        return emitted
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._started and now - self._started[0] > 60:
+                self._started.popleft()
+            emitted = self.counters["emitted"]
+            return {
+                **self.counters,
+                "open_tracks": len(self.tracks),
+                "tracks_per_min": len(self._started),
+                "dedup_ratio": round(self.counters["detections"] / emitted, 2) if emitted else None,
+            }
@@ -0,0 +1,108 @@
+"""
+Motion-gated, load-adaptive inference scheduling for one camera.
+
+Replaces the fixed FRAME_SKIP. For every captured frame the capture thread
+asks `should_infer()`, which costs one downscaled grayscale frame difference
+against a running background (well under a millisecond at 160 px):
+
+* static scene (no motion, no faces recently) -> no detection at all, apart
+  from a slow keep-alive probe every `idle_interval` seconds;
+* activity (motion and/or recent faces)       -> the inference interval slides
+  from `max_interval` down to `min_interval` (0 = every frame) as activity rises;
+* CPU budget                                  -> never schedule more often than
+  `measured inference time / cpu_budget`, where cpu_budget is the share of
+  cores this camera may use (0.5 = half a core).
+
+Inference workers report back through `observe()` (faces found, seconds spent).
+"""
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+class AdaptiveScheduler:
+    def __init__(self, cpu_budget=0.5, min_interval=0.0, max_interval=1.0, idle_interval=5.0,
+                 motion_min=0.002, motion_high=0.05, faces_high=4, probe_width=160):
+        self.cpu_budget = cpu_budget
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.idle_interval = idle_interval
+        self.motion_min = motion_min
+        self.motion_high = motion_high
+        self.faces_high = faces_high
+        self.probe_width = probe_width
+
+        self._lock = threading.Lock()
+        self._background = None
+        self._last_scheduled = 0.0
+        self.motion = 0.0         # fraction of changed pixels in the latest frame
+        self.recent_faces = 0.0   # EWMA of faces per inference
+        self.inference_s = 0.0    # EWMA of inference cost
+        self.interval = max_interval
+        self.rate = 0.0           # EWMA inferences per second actually scheduled
+        self.counters = {"frames": 0, "scheduled": 0, "static_skips": 0}
+
+    def _motion_score(self, frame):
+        h, w = frame.shape[:2]
+        small = cv2.resize(frame, (self.probe_width, max(int(h * self.probe_width / w), 1)),
+                           interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0).astype(np.float32)
+        if self._background is None or self._background.shape != gray.shape:
+            self._background = gray
+            return 1.0  # first frame: treat as activity so the scene gets looked at
+        diff = cv2.absdiff(gray, self._background)
+        cv2.accumulateWeighted(gray, self._background, 0.05)
+        return float(np.count_nonzero(diff > 25)) / diff.size
+
+    def should_infer(self, frame, now=None):
+        """Called by the capture thread for every frame."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self.counters["frames"] += 1
+            self.motion = self._motion_score(frame)
+
+            if self.motion < self.motion_min and self.recent_faces < 0.5:
+                self.interval = self.idle_interval if self.idle_interval else float("inf")
+                static = True
+            else:
+                activity = max(min(self.motion / self.motion_high, 1.0),
+                               min(self.recent_faces / self.faces_high, 1.0))
+                self.interval = self.max_interval - activity * (self.max_interval - self.min_interval)
+                static = False
+            # CPU budget: inference_s of work every `interval` must stay under cpu_budget cores
+            if self.cpu_budget:
+                self.interval = max(self.interval, self.inference_s / self.cpu_budget)
+
+            elapsed = now - self._last_scheduled
+            if elapsed < self.interval:
+                if static:
+                    self.counters["static_skips"] += 1
+                return False
+            if self._last_scheduled:
+                self.rate += 0.2 * (1.0 / max(elapsed, 1e-3) - self.rate)
+            self._last_scheduled = now
+            self.counters["scheduled"] += 1
+            return True
+
+    def observe(self, faces, inference_s):
+        """Feedback from an inference worker."""
+        with self._lock:
+            self.recent_faces += 0.3 * (faces - self.recent_faces)
+            self.inference_s = inference_s if not self.inference_s else \
+                self.inference_s + 0.2 * (inference_s - self.inference_s)
+
+    def stats(self):
+        # Decay the reported rate if nothing has been scheduled for a while
+        idle = time.monotonic() - self._last_scheduled if self._last_scheduled else 0.0
+        rate = min(self.rate, 1.0 / idle) if idle > 1.0 else self.rate
+        return {
+            **self.counters,
+            "inference_rate_hz": round(rate, 2),
+            "interval_s": round(self.interval, 3) if self.interval != float("inf") else None,
+            "motion": round(self.motion, 4),
+            "recent_faces": round(self.recent_faces, 2),
+            "inference_ms": round(self.inference_s * 1000, 1),
+            "cpu_budget": self.cpu_budget,
+        }
@@ -0,0 +1,296 @@
+"""
+Write-behind sighting ingestion for the edge indexer.
+
+The capture loop hands rows to `SightingWriter.submit()` and never waits on the
+network. A background thread drains a bounded queue and bulk-inserts batches
+when either `batch_size` rows are waiting or `flush_interval` seconds have
+passed since the first row of the batch arrived.
+
+If Supabase is unreachable (or the queue is full) rows are appended to a local
+segment file (one JSON row per line). Once inserts succeed again, closed
+segments are replayed oldest-first, one batch after every live write (and while
+idle) so the spill drains even on a busy camera; the replay offset is
+checkpointed after every batch so a crash mid-replay re-sends at most one batch.
+
+Only transient failures (connection errors, timeouts, 5xx) mark the DB down. A
+batch the DB rejects outright (a 4xx: bad data, constraint, unknown column) is
+re-sent row by row and the rows it still rejects are appended to
+`quarantine.jsonl` with the error, instead of being retried forever.
+"""
+import glob
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import metrics
+
+INSERT_SECONDS = metrics.histogram("kumbh_db_insert_seconds", "Bulk insert latency (write-behind), by table")
+
+
+def is_permanent(exc):
+    """True if the DB rejected the rows themselves (a 4xx), so re-sending cannot succeed.
+
+    PostgREST errors carry the Postgres SQLSTATE (or the HTTP status when the body
+    is not JSON); anything without a code is a connection error or timeout.
+    """
+    code = getattr(exc, "code", None)
+    if isinstance(code, int):
+        return 400 <= code < 500 and code not in (408, 429)
+    if not isinstance(code, str) or code == "42501":  # no code / missing grant: fixable, keep the rows
+        return False
+    # 22 data exception, 23 integrity violation, 42 undefined column/table, PGRST1/2 bad request
+    return code.startswith(("22", "23", "42", "PGRST1", "PGRST2"))
+
+
+class SightingWriter:
+    def __init__(self, client, table="sightings", max_queue=5000, batch_size=50,
+                 flush_interval=1.0, spill_dir="spill", max_spill_bytes=512 * 1024 * 1024,
+                 retry_interval=5.0):
+        self.client = client
+        self.table = table
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_dir = spill_dir
+        self.max_spill_bytes = max_spill_bytes
+        self.retry_interval = retry_interval
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._spill_lock = threading.Lock()
+        self._spill_file = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._db_down_since = None
+        self._next_retry = 0.0
+        self._latencies = deque(maxlen=200)
+
+        self.counters = {
+            "enqueued": 0,
+            "inserted": 0,
+            "batches": 0,
+            "spilled": 0,
+            "replayed": 0,
+            "dropped": 0,
+            "quarantined": 0,
+            "db_errors": 0,
+        }
+        os.makedirs(spill_dir, exist_ok=True)
+
+    # --- producer side (capture thread) ---
+
+    def submit(self, row):
+        """Queue a sighting row. Never blocks; overflows go to the spill file."""
+        try:
+            self._queue.put_nowait(row)
+            self.counters["enqueued"] += 1
+        except queue.Full:
+            self._spill([row])
+
+    # --- lifecycle ---
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sighting-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self, timeout=10.0):
+        """Flush what is queued (spilling anything the DB will not take) and stop."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._close_segment()
+
+    # --- writer thread ---
+
+    def _run(self):
+        while not self._stop.is_set() or not self._queue.empty():
+            batch = self._collect()
+            if batch:
+                self._write(batch)
+            # One spill batch per live batch keeps the backlog draining under load;
+            # while down and idle, the replay doubles as the reconnect probe
+            if self._db_down_since is None or (not batch and time.monotonic() >= self._next_retry):
+                self._replay_one_batch()
+
+    def _collect(self):
+        """Block for the first row, then gather until batch_size or flush_interval."""
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=self.flush_interval))
+        except queue.Empty:
+            return batch
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _insert(self, rows):
+        t0 = time.perf_counter()
+        self.client.table(self.table).insert(rows).execute()
+        self._latencies.append(time.perf_counter() - t0)
+        INSERT_SECONDS.observe(self._latencies[-1], table=self.table)
+        self.counters["batches"] += 1
+
+    def _send(self, rows, counter):
+        """Insert rows, quarantining the ones the DB rejects outright.
+
+        Returns (done, error): the number of leading rows inserted or quarantined,
+        and the transient error that stopped the rest (None once all are done).
+        """
+        try:
+            self._insert(rows)
+            self.counters[counter] += len(rows)
+            return len(rows), None
+        except Exception as e:
+            if not is_permanent(e):
+                self.counters["db_errors"] += 1
+                return 0, e
+            if len(rows) == 1:
+                self._quarantine(rows, e)
+                return 1, None
+        # Some row in the batch is bad: find it one row at a time
+        for i, row in enumerate(rows):
+            try:
+                self._insert([row])
+                self.counters[counter] += 1
+            except Exception as e:
+                if not is_permanent(e):
+                    self.counters["db_errors"] += 1
+                    return i, e
+                self._quarantine([row], e)
+        return len(rows), None
+
+    def _mark_down(self, error, what):
+        if self._db_down_since is None:
+            print(f"⚠️ {what} failed, spilling to disk: {error}")
+            self._db_down_since = time.monotonic()
+        self._next_retry = time.monotonic() + self.retry_interval
+
+    def _mark_up(self):
+        if self._db_down_since is not None:
+            print(f"✅ DB reachable again after {time.monotonic() - self._db_down_since:.0f}s. Replaying spill...")
+            self._db_down_since = None
+            self._close_segment()
+
+    def _write(self, batch):
+        # While the DB is down, go straight to disk until the retry timer fires
+        if self._db_down_since is not None and time.monotonic() < self._next_retry:
+            self._spill(batch)
+            return
+        done, error = self._send(batch, "inserted")
+        if error is None:
+            self._mark_up()
+        else:
+            self._mark_down(error, f"Insert into {self.table}")
+            self._spill(batch[done:])
+
+    # --- spill / replay ---
+
+    def _segments(self):
+        return sorted(glob.glob(os.path.join(self.spill_dir, "sightings-*.seg")))
+
+    def _spill_bytes(self):
+        return sum(os.path.getsize(p) for p in self._segments())
+
+    def _spill(self, rows):
+        with self._spill_lock:
+            try:
+                if self._spill_bytes() > self.max_spill_bytes:
+                    self.counters["dropped"] += len(rows)
+                    return
+                if self._spill_file is None:
+                    path = os.path.join(self.spill_dir, f"sightings-{time.time_ns()}.seg")
+                    self._spill_file = open(path, "a")
+                for row in rows:
+                    self._spill_file.write(json.dumps(row) + "\n")
+                self._spill_file.flush()
+                os.fsync(self._spill_file.fileno())
+                self.counters["spilled"] += len(rows)
+            except OSError as e:
+                print(f"❌ Spill write failed, dropping {len(rows)} rows: {e}")
+                self.counters["dropped"] += len(rows)
+
+    def _quarantine(self, rows, error):
+        """Keep rows the DB will never accept out of the spill, with the reason, for inspection."""
+        print(f"🚫 {self.table} rejected {len(rows)} row(s), quarantined: {error}")
+        try:
+            with open(os.path.join(self.spill_dir, "quarantine.jsonl"), "a") as f:
+                for row in rows:
+                    f.write(json.dumps({"row": row, "error": str(error)}) + "\n")
+        except OSError as e:
+            print(f"❌ Quarantine write failed, dropping {len(rows)} rows: {e}")
+            self.counters["dropped"] += len(rows)
+            return
+        self.counters["quarantined"] += len(rows)
+
+    def _close_segment(self):
+        with self._spill_lock:
+            if self._spill_file is not None:
+                self._spill_file.close()
+                self._spill_file = None
+
+    def _replay_one_batch(self):
+        """Re-send one batch from the oldest segment, sealing it first if it is still open."""
+        segments = self._segments()
+        if not segments:
+            return
+        path = segments[0]
+        with self._spill_lock:
+            if self._spill_file is not None and self._spill_file.name == path:
+                self._spill_file.close()
+                self._spill_file = None
+        offset_path = path + ".offset"
+        offset = 0
+        if os.path.exists(offset_path):
+            with open(offset_path) as f:
+                offset = int(f.read() or 0)
+
+        rows, ends = [], []
+        with open(path) as f:
+            f.seek(offset)
+            while len(rows) < self.batch_size:
+                line = f.readline()
+                if not line:
+                    break
+                if line.endswith("\n"):
+                    rows.append(json.loads(line))
+                    ends.append(f.tell())
+
+        if not rows:
+            os.remove(path)
+            if os.path.exists(offset_path):
+                os.remove(offset_path)
+            return
+        done, error = self._send(rows, "replayed")
+        if done:
+            with open(offset_path, "w") as f:
+                f.write(str(ends[done - 1]))
+        if error is None:
+            self._mark_up()
+        else:
+            self._mark_down(error, "Spill replay")
+
+    # --- observability ---
+
+    def stats(self):
+        latencies = sorted(self._latencies)
+
+        def pick(q):
+            return round(latencies[int(q * (len(latencies) - 1))] * 1000, 1) if latencies else None
+
+        return {
+            **self.counters,
+            "queue_depth": self._queue.qsize(),
+            "spill_bytes": self._spill_bytes(),
+            "db_up": self._db_down_since is None,
+            "batch_latency_ms": {"p50": pick(0.5), "p99": pick(0.99)},
+        }
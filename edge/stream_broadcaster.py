@@ -0,0 +1,145 @@
+"""
+Encode-once MJPEG broadcaster for the indexer's /video_feed.
+
+The sink publishes raw frames; nothing is encoded until a viewer asks for it.
+Each (frame, quality profile) pair is JPEG-encoded exactly once and the bytes
+are shared by every subscriber on that profile, so CPU cost scales with
+frames x profiles, not with the number of viewers.
+
+Subscribers sleep on a condition variable keyed by frame sequence number (no
+busy loop), may cap their own frame rate, and are disconnected if they stop
+pulling frames for longer than `slow_client_timeout`. While the camera publishes
+nothing, the last frame is re-sent every `idle_timeout` seconds: a viewer that
+went away is only noticed on a write, and until then it holds a server thread.
+
+The slow-client check times how long a yielded chunk takes to be written, so it
+relies on the server blocking once a connection's output buffer is full. Waitress
+only blocks at `outbuf_high_watermark` (16 MB by default); the indexer lowers it to
+a few frames (STREAM_OUTBUF_BYTES) so a lagging viewer is dropped before it has
+megabytes of stale JPEGs queued.
+"""
+import threading
+import time
+
+import cv2
+
+# name -> (max_width, jpeg_quality)
+DEFAULT_PROFILES = {
+    "high": (640, 80),
+    "medium": (480, 65),
+    "low": (320, 50),
+}
+
+
+def parse_profiles(spec):
+    """'high:640:80,low:320:50' -> {"high": (640, 80), "low": (320, 50)}; empty -> defaults."""
+    if not spec:
+        return DEFAULT_PROFILES
+    profiles = {}
+    for item in spec.split(","):
+        name, width, quality = item.strip().split(":")
+        profiles[name] = (int(width), int(quality))
+    return profiles
+
+
+class MJPEGBroadcaster:
+    def __init__(self, profiles=None, max_clients=20, slow_client_timeout=10.0, idle_timeout=5.0):
+        self.profiles = profiles or DEFAULT_PROFILES
+        self.max_clients = max_clients
+        self.slow_client_timeout = slow_client_timeout
+        self.idle_timeout = idle_timeout
+
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._frame = None
+        self._cache = {}  # profile -> (seq, multipart chunk)
+        self._encode_locks = {p: threading.Lock() for p in self.profiles}
+        self._clients = 0
+
+        self.counters = {"published": 0, "encoded": 0, "sent": 0, "rejected": 0, "slow_disconnects": 0,
+                         "keepalives": 0}
+
+    # --- producer ---
+
+    def publish(self, frame):
+        """Hand over a new frame (the caller must not mutate it afterwards)."""
+        with self._cond:
+            self._seq += 1
+            self._frame = frame
+            self.counters["published"] += 1
+            self._cond.notify_all()
+
+    # --- encoding ---
+
+    def _encoded(self, profile, seq, frame):
+        with self._encode_locks[profile]:
+            cached = self._cache.get(profile)
+            if cached is not None and cached[0] >= seq:
+                return cached[1]
+            max_width, quality = self.profiles[profile]
+            height, width = frame.shape[:2]
+            if width > max_width:
+                frame = cv2.resize(frame, (max_width, int(height * max_width / width)),
+                                   interpolation=cv2.INTER_AREA)
+            flag, encoded = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+            if not flag:
+                return None
+            chunk = b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + encoded.tobytes() + b'\r\n'
+            self._cache[profile] = (seq, chunk)
+            self.counters["encoded"] += 1
+            return chunk
+
+    # --- subscribers ---
+
+    def subscribe(self, profile="high", max_fps=None):
+        """Multipart generator for one viewer, or None if the server is at capacity."""
+        if profile not in self.profiles:
+            profile = "high"
+        with self._cond:
+            if self._clients >= self.max_clients:
+                self.counters["rejected"] += 1
+                return None
+            self._clients += 1
+        return self._stream(profile, max_fps)
+
+    def _stream(self, profile, max_fps):
+        min_interval = 1.0 / max_fps if max_fps else 0.0
+        last_seq = 0
+        last_sent = 0.0
+        chunk = None
+        try:
+            while True:
+                # Per-client frame-rate cap: sleep first, then take whatever is newest
+                wait = last_sent + min_interval - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+
+                with self._cond:
+                    fresh = self._cond.wait_for(lambda: self._seq > last_seq, self.idle_timeout)
+                    seq, frame = self._seq, self._frame
+
+                if fresh:
+                    encoded = self._encoded(profile, seq, frame)
+                    if encoded is None:
+                        continue
+                    chunk, last_seq = encoded, seq
+                elif chunk is None:
+                    continue  # nothing published yet: nothing to show
+                else:
+                    self.counters["keepalives"] += 1  # camera idle: re-send the last frame
+
+                yielded_at = time.monotonic()
+                yield chunk
+                # Control returns here only once the server has written the chunk
+                if last_sent and time.monotonic() - yielded_at > self.slow_client_timeout:
+                    self.counters["slow_disconnects"] += 1
+                    print("⚠️ Dropping slow stream client")
+                    return
+                last_sent = time.monotonic()
+                self.counters["sent"] += 1
+        finally:
+            with self._cond:
+                self._clients -= 1
+
+    def stats(self):
+        return {**self.counters, "clients": self._clients, "profiles": list(self.profiles)}
@@ -0,0 +1,194 @@
+"""
+Multi-stream supervisor: every active camera in one indexer process.
+
+One process per camera meant one TensorFlow/ArcFace model per camera and a
+port clash on the stream server. Here all cameras share:
+
+* the resident model      - embed_fn is process-global, the model is built once;
+* an InferencePool        - N worker threads claim frames from every camera's
+                            slot round-robin, so CPU is spent where frames are
+                            eligible (motion gate) instead of N x per-camera pools;
+* one stream server       - each camera has its own MJPEGBroadcaster, served
+                            under /video_feed/<cam_id>.
+
+Capture, reconnect backoff, tracking and the overlay stay per camera
+(CameraStream), so one dead RTSP source never stalls the others.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+from edge.capture_pipeline import CapturePipeline
+from edge.face_tracker import FaceTracker
+from edge.motion_gate import AdaptiveScheduler
+from edge.stream_broadcaster import MJPEGBroadcaster
+
+
+class InferencePool:
+    def __init__(self, workers=2):
+        self.workers = workers
+        self._pipelines = []
+        self._cond = threading.Condition()
+        self._ticket = 0  # bumped on every eligible frame, so no wake-up is lost
+        self._next = 0
+        self._stop = threading.Event()
+        self._threads = []
+
+    def attach(self, pipeline):
+        with self._cond:
+            self._pipelines.append(pipeline)
+
+    def detach(self, pipeline):
+        with self._cond:
+            if pipeline in self._pipelines:
+                self._pipelines.remove(pipeline)
+
+    def notify(self):
+        with self._cond:
+            self._ticket += 1
+            self._cond.notify()
+
+    def _take(self):
+        """Next claimable frame, starting one camera further each time (round-robin)."""
+        with self._cond:
+            pipelines = list(self._pipelines)
+            start = self._next
+            self._next += 1
+        for i in range(len(pipelines)):
+            pipeline = pipelines[(start + i) % len(pipelines)]
+            claimed = pipeline.claim(timeout=0)
+            if claimed is not None:
+                return pipeline, claimed
+        return None
+
+    def _loop(self):
+        while not self._stop.is_set():
+            with self._cond:
+                ticket = self._ticket
+            work = self._take()
+            if work is None:
+                with self._cond:
+                    self._cond.wait_for(lambda: self._ticket != ticket or self._stop.is_set(), timeout=1.0)
+                continue
+            pipeline, claimed = work
+            pipeline.infer(claimed)
+
+    def start(self):
+        for i in range(self.workers):
+            t = threading.Thread(target=self._loop, name=f"infer-pool-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.notify()
+        for t in self._threads:
+            t.join(timeout=5)
+
+    def stats(self):
+        return {"workers": self.workers, "cameras": len(self._pipelines)}
+
+
+class CameraStream:
+    """Everything one camera owns: capture pipeline, motion gate, tracker and broadcaster."""
+
+    def __init__(self, cam_id, source, embed_fn, on_sightings, pool=None, workers=1,
+                 frame_skip=0, cpu_budget=0.5, dedup=True, track_refresh=30.0,
+                 resize_width=640, profiles=None, max_clients=20, on_detections=None):
+        """on_sightings(cam_id, [(face, seen_ts), ...]) receives faces to persist;
+        on_detections(cam_id, faces) sees every detection, before track dedup."""
+        self.cam_id = cam_id
+        self.on_sightings = on_sightings
+        self.on_detections = on_detections
+        self.broadcaster = MJPEGBroadcaster(profiles=profiles, max_clients=max_clients)
+        self.tracker = FaceTracker(refresh_interval=track_refresh) if dedup else None
+        self.scheduler = None if frame_skip else AdaptiveScheduler(cpu_budget=cpu_budget)
+        self.pipeline = CapturePipeline(
+            cam_id, source,
+            embed_fn=embed_fn,
+            on_frame=self._on_frame,
+            on_faces=self._on_faces,
+            workers=workers,
+            frame_skip=frame_skip,
+            resize_width=resize_width,
+            scheduler=self.scheduler,
+            pool=pool,
+        )
+        self._faces = deque()  # (monotonic ts, faces found) over the last minute
+        self._started = time.monotonic()
+        self.faces_total = 0
+
+    def _on_frame(self, frame):
+        self.broadcaster.publish(frame)
+        # Someone who left the frame is emitted now, not at the next inference
+        representatives = self.tracker.expire() if self.tracker else None
+        if representatives:
+            self.on_sightings(self.cam_id, representatives)
+
+    def _on_faces(self, faces, captured_at):
+        now = time.monotonic()
+        self._faces.append((now, len(faces)))
+        self.faces_total += len(faces)
+        if faces and self.on_detections:
+            self.on_detections(self.cam_id, faces)
+        representatives = self.tracker.update(faces, captured_at) if self.tracker else \
+            [(obj, time.time()) for obj in faces]
+        if representatives:
+            self.on_sightings(self.cam_id, representatives)
+
+    def start(self):
+        self.pipeline.start()
+        return self
+
+    def stop(self):
+        """Stop capture and return the faces still being tracked."""
+        self.pipeline.stop()
+        return self.tracker.flush() if self.tracker else []
+
+    def faces_per_s(self):
+        now = time.monotonic()
+        while self._faces and now - self._faces[0][0] > 60:
+            self._faces.popleft()
+        window = min(now - self._started, 60.0)
+        return sum(n for _, n in self._faces) / window if window > 0 else 0.0
+
+    def memory_bytes(self):
+        """Approximate per-camera footprint: frame buffers, cached JPEGs and open tracks."""
+        encoded = sum(len(chunk) for _, chunk in list(self.broadcaster._cache.values()))
+        tracks = len(self.tracker.tracks) * 512 * (4 + 32) if self.tracker else 0
+        return self.pipeline.memory_bytes() + encoded + tracks
+
+    def stats(self):
+        return {
+            "pipeline": self.pipeline.stats(),
+            "tracking": self.tracker.stats() if self.tracker else None,
+            "stream": self.broadcaster.stats(),
+            "faces_total": self.faces_total,
+            "faces_per_s": round(self.faces_per_s(), 2),
+            "memory_mb": round(self.memory_bytes() / 2**20, 2),
+        }
+
+
+def process_rss():
+    """Resident set size of this process in bytes (current on Linux, peak elsewhere)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def active_cameras(config):
+    """cameras.json entries with `active: true` -> {cam_id: (source, meta)}; digit sources are device indexes."""
+    cameras = {}
+    for cam_id, meta in config.items():
+        if not meta.get("active") or meta.get("stream_source") is None:
+            continue
+        source = meta["stream_source"]
+        if isinstance(source, str) and source.isdigit():
+            source = int(source)
+        cameras[cam_id] = (source, meta)
+    return cameras
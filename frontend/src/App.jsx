@@ -347,6 +347,8 @@ const LiveSurveillance = ({ isBroadcasting, setIsBroadcasting, stream, setStream
   const videoRef = useRef(null);
   const [lastScan, setLastScan] = useState(null);
   const intervalRef = useRef(null);
+  // Server-paced: skip ticks until the backend's suggested frame interval / retry time has passed
+  const nextFrameRef = useRef(0);
   const [nodeId] = useState(`NODE-${Math.floor(Math.random() * 9999)}`);
   // GPS State is now lifted to App.jsx for persistence
 
@@ -416,29 +418,38 @@ const LiveSurveillance = ({ isBroadcasting, setIsBroadcasting, stream, setStream
   }, [isBroadcasting, stream]);
 
   const analyzeFrame = () => {
-    if (!videoRef.current) return;
+    if (!videoRef.current || Date.now() < nextFrameRef.current) return;
+    nextFrameRef.current = Infinity; // one frame in flight at a time
     const canvas = document.createElement('canvas');
     canvas.width = videoRef.current.videoWidth;
     canvas.height = videoRef.current.videoHeight;
     canvas.getContext('2d').drawImage(videoRef.current, 0, 0);
 
     canvas.toBlob(async (blob) => {
-      if (!blob) return;
+      if (!blob) { nextFrameRef.current = 0; return; }
       const formData = new FormData();
       formData.append('file', blob, 'frame.jpg');
       formData.append('cam_id', nodeId);
       formData.append('lat', gpsRef.current.lat);
       formData.append('lon', gpsRef.current.lon);
+      let waitMs = 0;
       try {
         const res = await axios.post(`${API_URL}/analyze_frame`, formData);
+        waitMs = res.data.frame_interval_ms || 0;
         setLastScan({
           ts: new Date().toLocaleTimeString(),
           data: res.data,
           detected: res.data.faces_detected || 0
         });
       } catch (e) {
-        console.error("Link Error", e);
+        if (e.response?.status === 429) {
+          // Shed at admission: back off for as long as the server asks
+          waitMs = Math.max(e.response.data.retry_after_ms || 0, e.response.data.frame_interval_ms || 0);
+        } else {
+          console.error("Link Error", e);
+        }
       }
+      nextFrameRef.current = Date.now() + waitMs;
     }, 'image/jpeg', 0.8);
   };
 
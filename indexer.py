@@ -1,18 +1,31 @@
-import cv2
 import time
 import os
 import argparse
 import json
 import threading
-from flask import Flask, Response
+from functools import partial
 from datetime import datetime
 from dotenv import load_dotenv
-from deepface import DeepFace
-from supabase import create_client
-from waitress import serve
 
-# --- SETUP ---
 load_dotenv()
+
+# --- ARGS (before the heavy imports below: --help and usage errors return at once) ---
+parser = argparse.ArgumentParser()
+parser.add_argument("--cam_id", type=str, help="Unique ID for this camera (e.g., Gate_1)")
+parser.add_argument("--source", type=str, default="0", help="Camera Index (0) or RTSP URL")
+parser.add_argument("--all", action="store_true", help="Supervise every active camera in cameras.json in this process")
+parser.add_argument("--workers", type=int, default=1, help="Parallel inference workers (shared by all cameras with --all)")
+parser.add_argument("--no_dedup", action="store_true", help="Log every detection instead of one per face track")
+parser.add_argument("--track_refresh", type=float, default=30.0, help="Re-log a face still in view every N seconds (0 = only when it leaves)")
+parser.add_argument("--frame_skip", type=int, default=0, help="Fixed: process every Nth frame (0 = motion-gated adaptive scheduling)")
+parser.add_argument("--cpu_budget", type=float, default=0.5, help="Cores this camera's inference may use (adaptive mode)")
+parser.add_argument("--detector", type=str, default=os.getenv("DETECTOR_BACKEND", "opencv"), help="Face detector (cameras.json \"detector\" overrides per camera)")
+parser.add_argument("--detect_side", type=int, default=640, help="Long edge of the image the detector sees (0 = full frame)")
+parser.add_argument("--min_face", type=int, default=40, help="Faces smaller than this (px) are dropped before embedding")
+args = parser.parse_args()
+if not args.cam_id and not args.all:
+    parser.error("pass --cam_id (single camera) or --all (every active camera in cameras.json)")
+
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
@@ -20,42 +33,144 @@ if not SUPABASE_URL or not SUPABASE_KEY:
     print("❌ Error: Secrets not found. Check your .env file.")
     exit()
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+# --- SETUP ---
+from flask import Flask, Response, jsonify, request  # noqa: E402
+from waitress.server import create_server  # noqa: E402
+from edge.sighting_writer import SightingWriter  # noqa: E402
+from edge.stream_broadcaster import parse_profiles  # noqa: E402
+from edge.stream_supervisor import CameraStream, InferencePool, active_cameras, process_rss  # noqa: E402
+from embedding_codec import format_vector  # noqa: E402  (shared with backend/, put on the path by edge/)
+from lazy_service import LazyService  # noqa: E402
+from model_service import ModelService, represented  # noqa: E402
+from watchlist import Watchlist  # noqa: E402
+import metrics  # noqa: E402
+
+def connect_db():
+    from supabase import create_client  # ~0.3 s of imports, overlapped with camera connect + model load
+    return create_client(SUPABASE_URL, SUPABASE_KEY)
+
+# DB client built in the background; until it is up, heartbeats fail and the writers spill to disk
+supabase = LazyService("database", connect_db).start()
+
+# Write-behind DB ingestion: capture never waits on Supabase; outages spill to disk
+writer = SightingWriter(
+    supabase,
+    batch_size=int(os.getenv("INGEST_BATCH_SIZE", "50")),
+    flush_interval=float(os.getenv("INGEST_FLUSH_SECONDS", "1.0")),
+    spill_dir=os.getenv("INGEST_SPILL_DIR", "spill"),
+)
+
+# Watchlist probes (same table as the API); hits go to watch_alerts through their own write-behind queue
+watchlist = Watchlist(
+    supabase,
+    threshold=float(os.getenv("WATCHLIST_THRESHOLD", "0.5")),
+    cooldown=float(os.getenv("WATCHLIST_COOLDOWN_SECONDS", "60")),
+)
+alert_writer = SightingWriter(
+    supabase,
+    table="watch_alerts",
+    batch_size=1,  # alerts are rare and urgent: never wait for batch-mates
+    flush_interval=0.1,
+    spill_dir=os.path.join(os.getenv("INGEST_SPILL_DIR", "spill"), "alerts"),
+)
+
+# --- INSTRUMENTATION (Prometheus text at /metrics, same module as the API) ---
+STAGE_SECONDS = metrics.histogram("kumbh_stage_seconds", "Latency of each indexer stage")
+FACES_DETECTED = metrics.counter("kumbh_faces_detected_total", "Faces detected in camera frames")
+SIGHTINGS_QUEUED = metrics.counter("kumbh_sightings_queued_total", "Sightings handed to the write-behind queue")
+DB_ERRORS = metrics.counter("kumbh_db_errors_total", "Failed DB calls")
+
+for _field, _kind, _help in (("queue_depth", "gauge", "Rows waiting in the write-behind queue"),
+                             ("db_errors", "counter", "Failed bulk inserts"),
+                             ("spilled", "counter", "Rows spilled to disk"),
+                             ("replayed", "counter", "Spilled rows re-sent (retries)"),
+                             ("quarantined", "counter", "Rows the DB rejected outright (kept in quarantine.jsonl)"),
+                             ("dropped", "counter", "Rows dropped (spill full)")):
+    metrics.stats_collector(f"kumbh_ingest_{_field}", _help, _kind, writer.stats, _field)
+metrics.stats_collector("kumbh_watchlist_probes", "Active watchlist probes", "gauge", watchlist.stats, "probes")
+
+def _per_camera(read):
+    return lambda: [({"cam_id": cam_id}, read(stream)) for cam_id, stream in list(streams.items())]
+
+metrics.collector("kumbh_camera_online", "1 while the camera's capture is connected", "gauge",
+                  _per_camera(lambda s: int(s.pipeline.online)))
+metrics.collector("kumbh_camera_reconnects_total", "Capture reconnects", "counter",
+                  _per_camera(lambda s: s.pipeline.reconnects))
+metrics.collector("kumbh_camera_frames_skipped_total", "Frames never sent to inference", "counter",
+                  _per_camera(lambda s: s.pipeline.meters["inference"].skipped))
+metrics.collector("kumbh_camera_inference_fps", "Inference results per second (EWMA)", "gauge",
+                  _per_camera(lambda s: s.pipeline.meters["inference"].fps))
+metrics.collector("kumbh_camera_capture_lag_seconds", "Capture-to-sink lag (EWMA)", "gauge",
+                  _per_camera(lambda s: s.pipeline.meters["sink"].lag_ms / 1000))
+metrics.collector("kumbh_process_rss_bytes", "Resident set size", "gauge", lambda: process_rss())
 
 # --- STREAMING SETUP ---
-latest_frame = None
-lock = threading.Lock()
+streams = {}  # cam_id -> CameraStream (one per camera, all in this process)
+pool = None   # shared inference pool in --all mode
 app = Flask(__name__)
 
 @app.route('/video_feed')
-def video_feed():
-    return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
-
-def generate_frames():
-    global latest_frame
-    while True:
-        with lock:
-            if latest_frame is None:
-                continue
-            (flag, encodedImage) = cv2.imencode(".jpg", latest_frame)
-            if not flag:
-                continue
-        yield(b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + bytearray(encodedImage) + b'\r\n')
+@app.route('/video_feed/<cam_id>')
+def video_feed(cam_id=None):
+    # Optional: ?quality=low|medium|high&fps=5
+    stream = streams.get(cam_id) if cam_id else next(iter(streams.values()), None)
+    if stream is None:
+        return Response("Unknown camera", status=404)
+    # Each new frame is JPEG-encoded once per quality profile and shared by all viewers
+    feed = stream.broadcaster.subscribe(
+        profile=request.args.get("quality", "high"),
+        max_fps=request.args.get("fps", type=float)
+    )
+    if feed is None:
+        return Response("Too many viewers", status=503)
+    return Response(feed, mimetype='multipart/x-mixed-replace; boundary=frame')
 
-def start_flask():
-    print("🎥 Starting Production Stream Server (Waitress) on Port 5000...")
-    serve(app, host='0.0.0.0', port=5000, threads=6)
+@app.route('/stats')
+def ingest_stats():
+    cameras = {cam_id: stream.stats() for cam_id, stream in streams.items()}
+    rss = process_rss()
+    per_camera = sum(c["memory_mb"] for c in cameras.values())
+    return jsonify({
+        "services": {"database": supabase.state, "model": model.state, "stream_server": stream_server.state},
+        "ingest": writer.stats(),
+        "watchlist": watchlist.stats(),
+        "inference_pool": pool.stats() if pool else None,
+        "cameras": cameras,
+        "faces_per_s": round(sum(c["faces_per_s"] for c in cameras.values()), 2),
+        # Model, interpreter and pools are shared; cameras only add their buffers
+        "memory_mb": {"rss": round(rss / 2**20, 1), "per_camera": per_camera,
+                      "shared": round(rss / 2**20 - per_camera, 1)}
+    })
 
-# --- ARGS ---
-parser = argparse.ArgumentParser()
-parser.add_argument("--cam_id", type=str, required=True, help="Unique ID for this camera (e.g., Gate_1)")
-parser.add_argument("--source", type=str, default="0", help="Camera Index (0) or RTSP URL")
-args = parser.parse_args()
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype=metrics.CONTENT_TYPE)
+
+@app.route('/debug/profile')
+def profile():
+    # Sampling profiler, switched on per request: ?seconds=10 -> collapsed stacks
+    if os.getenv("PROFILER_ENDPOINT", "off") != "on":
+        return Response("Profiler endpoint disabled (PROFILER_ENDPOINT=on)", status=404)
+    seconds = min(max(request.args.get("seconds", 10.0, type=float), 0.1), 120.0)
+    try:
+        return Response(metrics.profiler.profile(seconds), mimetype="text/plain")
+    except RuntimeError as e:
+        return Response(str(e), status=409)
+
+def bind_stream_server():
+    # Every MJPEG viewer holds a server thread for as long as it watches: size for
+    # all of them at once, plus headroom so /stats and /metrics still answer
+    threads = len(streams) * STREAM_MAX_CLIENTS + STREAM_RESERVE_THREADS
+    print(f"🎥 Starting Production Stream Server (Waitress) on Port 5000 "
+          f"({len(streams)} feeds x {STREAM_MAX_CLIENTS} viewers, {threads} threads)...")
+    return create_server(app, host='0.0.0.0', port=5000, threads=threads,
+                         outbuf_high_watermark=STREAM_OUTBUF_BYTES)
 
-# Handle Source Input (Int or Str)
-source_input = args.source
-if source_input.isdigit():
-    source_input = int(source_input)
+# Ready once the port is bound (feeds are served from then on)
+stream_server = LazyService("stream_server", bind_stream_server)
+
+def start_flask():
+    stream_server.get().run()
 
 # Load Config for Name/Lat/Lon defaults
 CAMERA_CONFIG = {}
@@ -66,140 +181,167 @@ try:
 except:
     pass
 
-cam_meta = CAMERA_CONFIG.get(args.cam_id, {"name": args.cam_id, "lat": 0.0, "lon": 0.0})
+if args.all:
+    CAMERAS = active_cameras(CAMERA_CONFIG)
+    if not CAMERAS:
+        parser.error("no active cameras with a stream_source in cameras.json")
+else:
+    # Handle Source Input (Int or Str)
+    source_input = int(args.source) if args.source.isdigit() else args.source
+    CAMERAS = {args.cam_id: (source_input, CAMERA_CONFIG.get(args.cam_id, {"name": args.cam_id, "lat": 0.0, "lon": 0.0}))}
 
 # --- OPTIMIZATION VARS ---
-FRAME_SKIP = 5  # Process every 5th frame
 RESIZE_WIDTH = 640
+# MJPEG viewers per camera; each holds a stream-server thread while it watches. With many
+# cameras the per-camera cap is lowered so all feeds together stay within STREAM_MAX_VIEWERS
+STREAM_MAX_VIEWERS = int(os.getenv("STREAM_MAX_VIEWERS", "64"))
+STREAM_MAX_CLIENTS = max(1, min(int(os.getenv("STREAM_MAX_CLIENTS", "20")), STREAM_MAX_VIEWERS // len(CAMERAS)))
+STREAM_RESERVE_THREADS = 4  # /stats, /metrics, /debug/profile and "too many viewers" answers
+# Bytes Waitress buffers per connection before a viewer's write blocks (default 16 MB): a few
+# frames, so a stalled viewer backs up into the broadcaster's slow-client check, not into RAM
+STREAM_OUTBUF_BYTES = int(os.getenv("STREAM_OUTBUF_BYTES", str(256 * 1024)))
 HEARTBEAT_INTERVAL = 10 # Seconds
 
-def send_heartbeat():
+# Resident ArcFace shared by every camera and worker: detect once -> drop small -> align -> embed survivors
+model = ModelService(
+    model_name="ArcFace",
+    detector_backend=args.detector,
+    detect_side=args.detect_side,
+    min_face=args.min_face,
+)
+
+def send_heartbeat(cam_id, cam_meta):
     """Update the camera_nodes table to say 'I am alive' without overwriting Map Coords"""
     try:
-        # Check if node exists
-        res = supabase.table("camera_nodes").select("*").eq("id", args.cam_id).execute()
-        
-        if len(res.data) > 0:
-            # Node exists, just update heartbeat & status (Preserve Map Location!)
-            supabase.table("camera_nodes").update({
+        with STAGE_SECONDS.time(route="process_cctv", stage="heartbeat"):
+            # Update heartbeat & status only (Preserve Map Location!) -- one round trip per beat
+            res = supabase.table("camera_nodes").update({
                 "last_heartbeat": datetime.utcnow().isoformat(),
                 "status": "online"
-            }).eq("id", args.cam_id).execute()
-        else:
-            # New Node, Insert with defaults
-            data = {
-                "id": args.cam_id,
-                "name": cam_meta.get("name", args.cam_id),
-                "lat": cam_meta.get("lat"),
-                "lon": cam_meta.get("lon"),
-                "last_heartbeat": datetime.utcnow().isoformat(),
-                "status": "online"
-            }
-            supabase.table("camera_nodes").insert(data).execute()
+            }).eq("id", cam_id).execute()
+
+            if len(res.data) == 0:
+                # New Node (nothing updated), Insert with defaults
+                data = {
+                    "id": cam_id,
+                    "name": cam_meta.get("name", cam_id),
+                    "lat": cam_meta.get("lat"),
+                    "lon": cam_meta.get("lon"),
+                    "last_heartbeat": datetime.utcnow().isoformat(),
+                    "status": "online"
+                }
+                supabase.table("camera_nodes").insert(data).execute()
             
         # print(f"❤️ Heartbeat sent for {args.cam_id}")
     except Exception as e:
         print(f"⚠️ Heartbeat failed: {e}")
+        DB_ERRORS.inc(op="heartbeat")
+
+def embed_faces(frame, detector_backend=None):
+    """Inference stage: one detector pass; faces under --min_face are dropped before embedding."""
+    try:
+        with STAGE_SECONDS.time(route="process_cctv", stage="detect"):
+            faces = model.detect_faces(frame, enforce_detection=True, detector_backend=detector_backend)
+    except ValueError:
+        return [] # No (usable) face found
+    FACES_DETECTED.inc(len(faces))
+    with STAGE_SECONDS.time(route="process_cctv", stage="embed"):
+        embeddings = model.embed_batch([f["face"] for f in faces])
+    # Keeps the detector confidence: the tracker ranks a track's best shot by area x confidence
+    return represented(faces, embeddings)
+
+def log_sightings(cam_id, representatives):
+    """Sink stage: one representative per face track -> write-behind DB queue."""
+    for obj, seen_ts in representatives:
+        payload = {
+            "cam_id": cam_id,
+            "seen_at": datetime.utcfromtimestamp(seen_ts).isoformat(),
+            # Compact pgvector text: ~4x smaller on the wire and in spill files than a float list
+            "face_vector": format_vector(obj["embedding"])
+        }
+        writer.submit(payload)
+        SIGHTINGS_QUEUED.inc(cam_id=cam_id)
+        print(f"✅ Face Queued | {cam_id} | {datetime.now().strftime('%H:%M:%S')}")
+
+def watch_faces(cam_id, faces):
+    """Every detection (before track dedup) against the watchlist: one product per frame."""
+    if not watchlist.size:
+        return
+    cam_meta = CAMERAS[cam_id][1]
+    alerts = watchlist.check(
+        [obj["embedding"] for obj in faces],
+        {"cam_id": cam_id, "seen_at": time.time(), "lat": cam_meta.get("lat"), "lon": cam_meta.get("lon")},
+    )
+    for alert in alerts:
+        alert_writer.submit(Watchlist.alert_row(alert))
+        print(f"🚨 WATCHLIST HIT | {alert['label']} | {cam_id} | GPS: {alert['lat']},{alert['lon']} | {alert['similarity']:.2f}")
+
+def process_cctv(cameras):
+    global pool
+    if args.all:
+        # Build the model once up front instead of racing to load it from every worker
+        model.load()
+        pool = InferencePool(workers=args.workers).start()
+
+    for cam_id, (source, cam_meta) in cameras.items():
+        print(f"🎥 Connecting to {cam_id} via {source}...")
+        # Capture, inference and sink run as separate stages; this thread only supervises
+        streams[cam_id] = CameraStream(
+            cam_id, source,
+            embed_fn=partial(embed_faces, detector_backend=cam_meta.get("detector")),
+            on_sightings=log_sightings,
+            on_detections=watch_faces,
+            pool=pool,
+            workers=args.workers,
+            # Static scenes skip detection; busy scenes approach every frame, within the CPU budget
+            frame_skip=args.frame_skip,
+            cpu_budget=args.cpu_budget,
+            dedup=not args.no_dedup,
+            track_refresh=args.track_refresh,
+            resize_width=RESIZE_WIDTH,
+            profiles=parse_profiles(os.getenv("STREAM_PROFILES")),
+            max_clients=STREAM_MAX_CLIENTS,
+        ).start()
 
-def process_cctv(cam_id, source):
-    global latest_frame
-    print(f"🎥 Connecting to {cam_id} via {source}...")
-    
     # Start Stream Server in Thread
     t = threading.Thread(target=start_flask, daemon=True)
     t.start()
-    
-    while True:
-        cap = cv2.VideoCapture(source)
-        
-        if not cap.isOpened():
-            print(f"⚠️ Connection failed. Retrying in 5s...")
-            time.sleep(5)
-            continue
-            
-        print(f"✅ Camera {cam_id} Online. ML Engine Started.")
-        
-        frame_count = 0
-        last_heartbeat_time = 0
-        
+    writer.start()
+    alert_writer.start()
+    watchlist.start_sync(interval=float(os.getenv("WATCHLIST_SYNC_SECONDS", "10")))
+
+    try:
         while True:
-            ret, frame = cap.read()
-            if not ret:
-                print("❌ Stream ended/interrupted.")
-                break
-            
-            frame_count += 1
-            
             # --- HEARTBEAT ---
-            current_time = time.time()
-            if current_time - last_heartbeat_time > HEARTBEAT_INTERVAL:
-                send_heartbeat()
-                last_heartbeat_time = current_time
-
-            # --- OPTIMIZATION ---
-            # 1. Skip Frames (ML Only)
-            # But we want smooth video, so we might need to process separate from resize
-            # For now, let's just resize every frame for display speed
-            
-            height, width = frame.shape[:2]
-            scale = RESIZE_WIDTH / width
-            small_frame = cv2.resize(frame, (RESIZE_WIDTH, int(height * scale)))
-            
-            # Run ML only on skippable frames
-            if frame_count % FRAME_SKIP == 0:
-                try:
-                    # Detect & Embed
-                    embedding_objs = DeepFace.represent(
-                        img_path=small_frame,
-                        model_name="ArcFace",
-                        detector_backend="opencv",
-                        enforce_detection=True
-                    )
-                    
-                    for obj in embedding_objs:
-                        embedding = obj["embedding"]
-                        area = obj["facial_area"]
-                        
-                        # Filter small faces (noise)
-                        if area['w'] < 40 or area['h'] < 40:
-                            continue
-
-                        # Draw Box on Stream
-                        x = int(area['x'])
-                        y = int(area['y'])
-                        w = int(area['w'])
-                        h = int(area['h'])
-                        cv2.rectangle(small_frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-                        cv2.putText(small_frame, "TARGET", (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
-
-                        # Log to DB
-                        payload = {
-                            "cam_id": cam_id,
-                            "seen_at": datetime.utcnow().isoformat(),
-                            "face_vector": embedding
-                        }
-                        supabase.table("sightings").insert(payload).execute()
-                        print(f"✅ Face Logged | {datetime.now().strftime('%H:%M:%S')}")
-                        
-                except ValueError:
-                    pass # No face found
-                except Exception as e:
-                    print(f"⚠️ Indexing Error: {e}")
-            
-            # Update Global Stream Frame
-            with lock:
-                latest_frame = small_frame.copy()
-
-            # Optional Local Show
-            # cv2.imshow('CCTV', small_frame)
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
-                
-        cap.release()
-        print("🔄 Reconnecting stream...")
-        time.sleep(2)
+            for cam_id, (_, cam_meta) in cameras.items():
+                send_heartbeat(cam_id, cam_meta)
+            stats = writer.stats()
+            if stats["queue_depth"] or not stats["db_up"]:
+                print(f"📊 Ingest | queue: {stats['queue_depth']} | spilled: {stats['spilled']} | dropped: {stats['dropped']}")
+            for cam_id, stream in streams.items():
+                if stream.tracker and stream.tracker.counters["detections"]:
+                    t_stats = stream.tracker.stats()
+                    print(f"📊 Tracking | {cam_id} | dedup: {t_stats['dedup_ratio']}x | tracks/min: {t_stats['tracks_per_min']}")
+                if stream.scheduler:
+                    s_stats = stream.scheduler.stats()
+                    print(f"📊 Inference | {cam_id} | {s_stats['inference_rate_hz']} Hz | motion: {s_stats['motion']} | static skips: {s_stats['static_skips']}")
+            if len(streams) > 1:
+                faces = sum(s.faces_per_s() for s in streams.values())
+                print(f"📊 Supervisor | {len(streams)} cameras | {faces:.2f} faces/s | RSS {process_rss() / 2**20:.0f} MB")
+            time.sleep(HEARTBEAT_INTERVAL)
+    finally:
+        for cam_id, stream in streams.items():
+            # Persist faces still in view
+            log_sightings(cam_id, stream.stop())
+        if pool:
+            pool.stop()
 
 if __name__ == "__main__":
-    # Register Node on Startup
-    send_heartbeat()
-    process_cctv(args.cam_id, source_input)
\ No newline at end of file
+    # Register Nodes on Startup
+    for cam_id, (_, cam_meta) in CAMERAS.items():
+        send_heartbeat(cam_id, cam_meta)
+    try:
+        process_cctv(CAMERAS)
+    finally:
+        alert_writer.close()
+        writer.close()
\ No newline at end of file